@@ -0,0 +1,113 @@
+import os
+import pickle
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AccountStore:
+    """
+    SQLite-backed storage for each user's email accounts.
+
+    Replaces the email_accounts.pkl dict that was rewritten in full whenever
+    one account was added. Every change is a row-level insert in its own
+    transaction, and the database runs in WAL mode so request threads can
+    read while another one writes. Each thread gets its own connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS accounts (
+                    username TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    password TEXT NOT NULL,
+                    is_default INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (username, email)
+                )""")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def ensure_user(self, username):
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
+
+    def has_user(self, username):
+        row = self._connect().execute(
+            "SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None
+
+    def has_account(self, username, email):
+        row = self._connect().execute(
+            "SELECT 1 FROM accounts WHERE username = ? AND email = ?", (username, email)).fetchone()
+        return row is not None
+
+    def get_account(self, username, email):
+        """Return {'password': ..., 'isDefault': ...} for one account, or None"""
+        row = self._connect().execute(
+            "SELECT password, is_default FROM accounts WHERE username = ? AND email = ?",
+            (username, email)).fetchone()
+        if row is None:
+            return None
+        return {'password': row['password'], 'isDefault': bool(row['is_default'])}
+
+    def list_accounts(self, username):
+        """Return the user's accounts as [{'email': ..., 'isDefault': ...}] in the order added"""
+        rows = self._connect().execute(
+            "SELECT email, is_default FROM accounts WHERE username = ? ORDER BY rowid",
+            (username,)).fetchall()
+        return [{'email': row['email'], 'isDefault': bool(row['is_default'])} for row in rows]
+
+    def add_account(self, username, email, password):
+        """
+        Insert one account; the user's first account becomes the default.
+        Returns False if the email is already registered for this user.
+        """
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
+            has_accounts = conn.execute(
+                "SELECT 1 FROM accounts WHERE username = ? LIMIT 1", (username,)).fetchone()
+            try:
+                conn.execute(
+                    "INSERT INTO accounts (username, email, password, is_default) VALUES (?, ?, ?, ?)",
+                    (username, email, password, 0 if has_accounts else 1))
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def count_users(self):
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def migrate_pickle(self, pickle_path):
+        """One-shot import of the legacy {username: {email: details}} pickle file"""
+        if not os.path.exists(pickle_path):
+            return 0
+        with open(pickle_path, 'rb') as f:
+            legacy_accounts = pickle.load(f)
+        with self._connect() as conn:
+            for username, accounts in legacy_accounts.items():
+                conn.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
+                for email, details in accounts.items():
+                    conn.execute(
+                        "INSERT OR IGNORE INTO accounts (username, email, password, is_default) VALUES (?, ?, ?, ?)",
+                        (username, email, details['password'], 1 if details.get('isDefault') else 0))
+        os.replace(pickle_path, pickle_path + ".migrated")
+        logger.info(f"Migrated email accounts for {len(legacy_accounts)} users from {pickle_path}")
+        return len(legacy_accounts)
@@ -1,27 +1,39 @@
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
-import imaplib
 import email
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import face_recognition
-import cv2
 import numpy as np
 import speech_recognition as sr
-import pyttsx3
 import json
 from dotenv import load_dotenv
 import pickle
-from datetime import datetime, timedelta
 import os.path
 import logging
-import re
-from email.header import decode_header
-from gtts import gTTS
-import io
-import tempfile
+import queue
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from face_gallery import FaceGallery
+from face_index import create_index
+from face_store import FaceEncodingStore
+from account_store import AccountStore
+from face_pipeline import analyze_image, ImageDecodeError
+from face_workers import FaceWorkerPool, PoolSaturatedError, FaceJobTimeoutError
+from face_batcher import FaceBatcher
+from face_burst import match_burst
+from audio_decode import decode_audio, AudioDecodeError, TARGET_RATE
+from imap_pool import IMAPConnectionPool, imap_login
+from smtp_pool import SMTPConnectionPool
+from mail_queue import MailQueue, PermanentDeliveryError
+from bulk_mail import BulkSender, render_messages, parse_rate_limits
+from tts_cache import TTSCache, tts_cache_key
+from tts_engines import GTTSEngine, Pyttsx3Engine
+from tts_stream import split_sentences, stream_synthesis, strip_id3, PendingStreams
+from tts_prompts import PromptCatalog, prewarm, synthesize_prompt
+from mail_reader import fetch_unread_emails, fetch_email_by_uid, positive_int, read_accounts_unread
+from mail_sync import MailboxSync
+from mail_watcher import MailWatcher
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -42,43 +54,240 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
-# Store user email accounts
-email_accounts = {}  # Will be converted to: {username: {email1: {details}, email2: {details}, ...}}
+# app.run(debug=True) at the bottom imports this module twice: once in the reloader
+# process that only watches for code changes, then again (with WERKZEUG_RUN_MAIN set)
+# in the process that serves. Face workers and background threads are only started
+# in a serving process, so e.g. queued mail is not delivered by two processes
+SERVING_PROCESS = __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
 
-# Store face encodings
-registered_faces = {}
-FACE_DB_PATH = "face_encodings.pkl"
-EMAIL_ACCOUNTS_PATH = "email_accounts.pkl"
+# Face index used for 1:N searches. Small galleries are always searched exactly;
+# the IVF index only kicks in once FACE_INDEX_MIN_TRAIN_SIZE faces are enrolled.
+FACE_INDEX_TYPE = os.getenv('FACE_INDEX', 'ivf')
+FACE_INDEX_OPTIONS = {} if FACE_INDEX_TYPE == 'exact' else {
+    'nlist': int(os.getenv('FACE_INDEX_NLIST', '256')),
+    'nprobe': int(os.getenv('FACE_INDEX_NPROBE', '8')),
+    'min_train_size': int(os.getenv('FACE_INDEX_MIN_TRAIN_SIZE', '20000')),
+}
+FACE_MATCH_TOLERANCE = 0.5
+# A burst login stops at the first frame this close to the registered face
+FACE_CONFIDENT_TOLERANCE = float(os.getenv('FACE_CONFIDENT_TOLERANCE', '0.4'))
+FACE_BURST_MAX_FRAMES = int(os.getenv('FACE_BURST_MAX_FRAMES', '5'))
 
-# Load existing face encodings if available
-if os.path.exists(FACE_DB_PATH):
+# Face detection runs on a frame downscaled to this width (0 = full resolution). At 640 a
+# face filling a login frame is still well above the HOG detector's minimum size; check
+# recall on your own captures with bench_face_detection.py before going lower. Detection
+# can also be restricted to a centered region covering FACE_DETECTION_ROI of the frame
+FACE_DETECTION_OPTIONS = {
+    'detection_width': int(os.getenv('FACE_DETECTION_WIDTH', '640')),
+    'roi_fraction': float(os.getenv('FACE_DETECTION_ROI', '0')) or None,
+}
+
+# Face detection/encoding runs in a pool of worker processes (0 = on the request thread).
+# Requests beyond workers + queue depth are rejected with 503 instead of piling up.
+FACE_WORKERS = int(os.getenv('FACE_WORKERS', str(os.cpu_count() or 1)))
+face_workers = FaceWorkerPool(
+    workers=FACE_WORKERS,
+    queue_depth=int(os.getenv('FACE_QUEUE_DEPTH', str(2 * FACE_WORKERS))),
+    timeout=float(os.getenv('FACE_JOB_TIMEOUT', '15')),
+)
+if SERVING_PROCESS:
+    face_workers.start()  # forks the workers, so it must come before anything below starts a thread
+
+# Store face encodings (dict-like gallery backed by one NumPy matrix)
+registered_faces = FaceGallery(index=create_index(FACE_INDEX_TYPE, **FACE_INDEX_OPTIONS))
+FACE_DB_PATH = "face_encodings.pkl"  # legacy pickle, migrated into the store below
+FACE_STORE_PATH = "face_encodings"
+EMAIL_ACCOUNTS_PATH = "email_accounts.pkl"  # legacy pickle, migrated into the database below
+EMAIL_ACCOUNTS_DB_PATH = "email_accounts.db"
+
+# Append-only encoding store; registering a face appends one record
+face_store = FaceEncodingStore(FACE_STORE_PATH)
+
+# One-shot migration of the old pickle database into the store
+if os.path.exists(FACE_DB_PATH) and len(face_store) == 0:
     try:
         with open(FACE_DB_PATH, 'rb') as f:
-            registered_faces = pickle.load(f)
-        logger.info(f"Loaded {len(registered_faces)} registered faces")
+            legacy_faces = pickle.load(f)
+        for legacy_username, legacy_encoding in legacy_faces.items():
+            face_store.append(legacy_username, legacy_encoding)
+        os.replace(FACE_DB_PATH, FACE_DB_PATH + ".migrated")
+        logger.info(f"Migrated {len(legacy_faces)} faces from {FACE_DB_PATH} to {FACE_STORE_PATH}")
     except Exception as e:
-        logger.error(f"Error loading face encodings: {e}")
+        logger.error(f"Error migrating face encodings: {e}")
 
-# Load existing email accounts if available
-if os.path.exists(EMAIL_ACCOUNTS_PATH):
-    try:
-        with open(EMAIL_ACCOUNTS_PATH, 'rb') as f:
-            email_accounts = pickle.load(f)
-        logger.info(f"Loaded email accounts for {len(email_accounts)} users")
-    except Exception as e:
-        logger.error(f"Error loading email accounts: {e}")
+# Concurrent face requests are micro-batched for up to FACE_BATCH_WINDOW_MS while all
+# face workers are busy (0 disables batching)
+FACE_BATCH_WINDOW_MS = float(os.getenv('FACE_BATCH_WINDOW_MS', '10'))
+FACE_BATCH_MAX = int(os.getenv('FACE_BATCH_MAX', '8'))
+
+# Load existing face encodings
+try:
+    registered_faces = FaceGallery.from_dict(
+        face_store.load(), index=create_index(FACE_INDEX_TYPE, **FACE_INDEX_OPTIONS))
+    logger.info(f"Loaded {len(registered_faces)} registered faces")
+except Exception as e:
+    logger.error(f"Error loading face encodings: {e}")
+
+face_batcher = None
+if FACE_BATCH_WINDOW_MS > 0 and SERVING_PROCESS:
+    face_batcher = FaceBatcher(face_workers, registered_faces, FACE_DETECTION_OPTIONS,
+                               window=FACE_BATCH_WINDOW_MS / 1000, max_batch=FACE_BATCH_MAX)
+
+def analyze_upload(data, username=None, max_faces=None):
+    """
+    Run the face pipeline for one upload, batched with concurrent requests
+    when batching is enabled. With a username the result also carries the
+    ``distance`` to that user's registered face.
+    """
+    if face_batcher is not None:
+        return face_batcher.run(data, username, max_faces)
+    result = face_workers.run(analyze_image, data, FACE_DETECTION_OPTIONS, max_faces)
+    if username is not None and result['encodings']:
+        distance = registered_faces.pair_distances([username], result['encodings'][:1])[0]
+        result['distance'] = None if np.isnan(distance) else float(distance)
+    return result
+
+# Store user email accounts (one row per username/email pair)
+email_accounts = AccountStore(EMAIL_ACCOUNTS_DB_PATH)
+
+# One-shot migration of the old pickle file
+try:
+    email_accounts.migrate_pickle(EMAIL_ACCOUNTS_PATH)
+    logger.info(f"Loaded email accounts for {email_accounts.count_users()} users")
+except Exception as e:
+    logger.error(f"Error loading email accounts: {e}")
+
+# Pooled IMAP sessions, keyed by (username, email)
+imap_pool = IMAPConnectionPool(
+    max_per_key=int(os.getenv('IMAP_POOL_MAX_PER_ACCOUNT', '2')),
+    idle_timeout=float(os.getenv('IMAP_POOL_IDLE_TIMEOUT', '300')),
+    keepalive_interval=float(os.getenv('IMAP_POOL_KEEPALIVE', '60')),
+)
+
+# Pooled authenticated SMTP sessions, keyed by (username, email). Providers drop
+# idle SMTP connections sooner than IMAP ones, hence the shorter idle timeout.
+smtp_pool = SMTPConnectionPool(
+    max_per_key=int(os.getenv('SMTP_POOL_MAX_PER_ACCOUNT', '2')),
+    idle_timeout=float(os.getenv('SMTP_POOL_IDLE_TIMEOUT', '120')),
+    keepalive_interval=float(os.getenv('SMTP_POOL_KEEPALIVE', '30')),
+)
+
+def deliver_queued_email(username, from_email, raw_message):
+    """Send one message from the outbound queue over a pooled SMTP session"""
+    account = email_accounts.get_account(username, from_email)
+    if account is None:
+        raise PermanentDeliveryError(f"Sender account {from_email} no longer exists for user {username}")
+    msg = email.message_from_bytes(raw_message)
+    smtp_pool.send_message((username, from_email), msg, from_email, account['password'])
+
+# Outbound emails are accepted into a durable queue and delivered in the background,
+# retrying with exponential backoff when the provider fails
+mail_queue = MailQueue(
+    os.getenv('MAIL_QUEUE_PATH', 'mail_queue.db'),
+    deliver_queued_email,
+    workers=int(os.getenv('MAIL_QUEUE_WORKERS', '2')),
+    max_attempts=int(os.getenv('MAIL_QUEUE_MAX_ATTEMPTS', '6')),
+    base_delay=float(os.getenv('MAIL_QUEUE_RETRY_DELAY', '5')),
+)
+if SERVING_PROCESS:
+    mail_queue.start()
+
+# Mail merge: BULK_SEND_CONCURRENCY sends at a time per job over the pooled sessions,
+# throttled per sending mailbox at its provider's rate (BULK_SEND_RATE_LIMITS, messages
+# per second, e.g. "smtp.gmail.com=2,smtp.office365.com=0.5")
+bulk_sender = BulkSender(
+    smtp_pool,
+    rate_limits=parse_rate_limits(os.getenv('BULK_SEND_RATE_LIMITS')) or None,
+    default_rate=float(os.getenv('BULK_SEND_DEFAULT_RATE', '1')),
+    concurrency=int(os.getenv('BULK_SEND_CONCURRENCY', '2')),
+)
+BULK_SEND_MAX_RECIPIENTS = int(os.getenv('BULK_SEND_MAX_RECIPIENTS', '500'))
+
+# How much of each message text a summary read downloads
+EMAIL_PREVIEW_BYTES = int(os.getenv('EMAIL_PREVIEW_BYTES', '2048'))
+# Full reads download at most this much of each message (text parts precede attachments)
+EMAIL_MAX_FETCH_BYTES = int(os.getenv('EMAIL_MAX_FETCH_BYTES', str(1024 * 1024)))
+# Most unread emails one request may ask for ('limit')
+EMAIL_MAX_LIMIT = int(os.getenv('EMAIL_MAX_LIMIT', '100'))
+
+# Local cache of unread message summaries, synced incrementally by UID
+mailbox_sync = MailboxSync(os.getenv('MAIL_CACHE_PATH', 'mail_cache.db'), preview_bytes=EMAIL_PREVIEW_BYTES,
+                           max_cached=EMAIL_MAX_LIMIT)
+
+# New-mail push: at most MAIL_WATCH_MAX_IDLE accounts hold an IMAP IDLE connection,
+# the rest (and servers without IDLE) are polled every MAIL_WATCH_POLL_INTERVAL seconds
+mail_watcher = MailWatcher(
+    imap_login,
+    imap_pool,
+    max_idle=int(os.getenv('MAIL_WATCH_MAX_IDLE', '20')),
+    idle_timeout=float(os.getenv('MAIL_WATCH_IDLE_TIMEOUT', '600')),
+    poll_interval=float(os.getenv('MAIL_WATCH_POLL_INTERVAL', '60')),
+)
+MAIL_EVENTS_KEEPALIVE = 15
+
+# The unified inbox reads every account of a user in parallel on this pool and
+# answers after UNIFIED_INBOX_TIMEOUT seconds with whatever accounts finished
+inbox_executor = ThreadPoolExecutor(max_workers=int(os.getenv('UNIFIED_INBOX_WORKERS', '8')),
+                                    thread_name_prefix='unified-inbox')
+UNIFIED_INBOX_TIMEOUT = float(os.getenv('UNIFIED_INBOX_TIMEOUT', '20'))
 
 # Speech recognition setup
 recognizer = sr.Recognizer()
 
-# Text-to-speech setup
-engine = pyttsx3.init()
+# Text-to-speech engines: TTS_ENGINE is used unless a request names another
+# ('engine'), and when it fails the TTS_FALLBACK engines are tried in order.
+# pyttsx3 works offline; its clips are MP3 if ffmpeg is installed, else WAV. A pyttsx3
+# clip not rendered within PYTTSX3_TIMEOUT seconds fails and takes the engine out of
+# use until its driver answers again
+tts_engines = {engine.name: engine for engine in (
+    GTTSEngine(), Pyttsx3Engine(timeout=float(os.getenv('PYTTSX3_TIMEOUT', '30'))))}
+TTS_ENGINE = os.getenv('TTS_ENGINE', 'gtts')
+TTS_FALLBACK = [name.strip() for name in os.getenv('TTS_FALLBACK', 'pyttsx3').split(',') if name.strip()]
+
+# Synthesized clips are cached by a hash of (text, lang, slow, engine): an LRU in
+# memory in front of a size-bounded directory on disk
+tts_cache = TTSCache(
+    os.getenv('TTS_CACHE_DIR', 'tts_cache'),
+    max_memory_bytes=int(float(os.getenv('TTS_CACHE_MEMORY_MB', '32')) * 1024 * 1024),
+    max_disk_bytes=int(float(os.getenv('TTS_CACHE_DISK_MB', '512')) * 1024 * 1024),
+)
+# The same key always maps to the same audio, so browsers may keep clips for a day
+TTS_CACHE_MAX_AGE = 86400
+
+# Streaming TTS synthesizes one sentence at a time, keeping TTS_STREAM_LOOKAHEAD
+# sentences ahead of the one being sent; the workers are shared by all streams
+tts_stream_executor = ThreadPoolExecutor(max_workers=int(os.getenv('TTS_STREAM_WORKERS', '4')),
+                                         thread_name_prefix='tts-stream')
+TTS_STREAM_LOOKAHEAD = int(os.getenv('TTS_STREAM_LOOKAHEAD', '2'))
+# Text to stream is POSTed and then opened by id, valid for TTS_STREAM_TTL seconds
+tts_streams = PendingStreams(ttl=float(os.getenv('TTS_STREAM_TTL', '300')))
+
+# Recurring voice prompts (TTS_PROMPTS_FILE, else the built-in catalog) are
+# rendered into the cache in the background at startup; sentences such as
+# "Email 3 of 12." are then assembled from cached segments. TTS_PREWARM=0 skips it
+prompt_catalog = PromptCatalog.load(os.getenv('TTS_PROMPTS_FILE'))
+TTS_PREWARM_LANG = os.getenv('TTS_PREWARM_LANG', 'en')
 
 # Add a root endpoint for testing
 @app.route('/', methods=['GET'])
 def index():
     return jsonify({"status": "ok", "message": "Voice Email Assistant API is running"}), 200
 
+@app.route('/api/health', methods=['GET'])
+def health():
+    """
+    503 once the face worker pool is degraded (a crashed worker left every
+    face job running inline on request threads), so a supervisor restarts us.
+    Also lists which TTS engines are currently answering.
+    """
+    face_status = face_workers.status()
+    status = "degraded" if face_status['degraded'] else "ok"
+    return jsonify({
+        "status": status,
+        "face_workers": face_status,
+        "tts_engines": {name: engine.healthy for name, engine in tts_engines.items()},
+    }), 503 if face_status['degraded'] else 200
+
 @app.route('/api/accounts', methods=['GET', 'POST'])
 def handle_accounts():
     if request.method == 'GET':
@@ -87,17 +296,11 @@ def handle_accounts():
             logger.error("No username provided in get accounts request")
             return jsonify({"error": "Missing username parameter"}), 400
         
-        # Initialize empty dict for this user if not exists
-        if username not in email_accounts:
-            email_accounts[username] = {}
+        # Create the user if not exists
+        email_accounts.ensure_user(username)
         
         # Return list of accounts with their details
-        accounts = []
-        for email, account_data in email_accounts[username].items():
-            accounts.append({
-                'email': email,
-                'isDefault': account_data.get('isDefault', False)
-            })
+        accounts = email_accounts.list_accounts(username)
         
         logger.info(f"Retrieved {len(accounts)} accounts for user: {username}")
         return jsonify({"accounts": accounts}), 200
@@ -113,41 +316,22 @@ def handle_accounts():
         password = data['password']
         username = data['username']
         
-        # Initialize empty dict for this user if not exists
-        if username not in email_accounts:
-            email_accounts[username] = {}
-        
         # Check if email is already registered for this user
-        if email in email_accounts[username]:
+        if email_accounts.has_account(username, email):
             logger.warning(f"Email {email} already registered for user: {username}")
             return jsonify({"error": "Email account already registered for this user"}), 400
         
         try:
-            # Test the email credentials
-            if email.endswith('@gmail.com'):
-                # For Gmail, use OAuth2 or App Password
-                server = smtplib.SMTP('smtp.gmail.com', 587)
-                server.starttls()
-                server.login(email, password)
-                server.quit()
-            else:
-                # For other email providers
-                server = smtplib.SMTP('smtp.office365.com', 587)
-                server.starttls()
-                server.login(email, password)
-                server.quit()
+            # Test the email credentials (for Gmail, use an App Password). The
+            # logged-in session stays pooled for this account's first send.
+            smtp_pool.run((username, email), lambda server: None, email, password)
             
-            # Store the account credentials
-            email_accounts[username][email] = {
-                'password': password,
-                'isDefault': len(email_accounts[username]) == 0  # First account is default
-            }
-            
-            # Save updated email accounts
+            # Store the account credentials (first account is default)
             try:
-                with open(EMAIL_ACCOUNTS_PATH, 'wb') as f:
-                    pickle.dump(email_accounts, f)
-                logger.info(f"Saved email accounts to {EMAIL_ACCOUNTS_PATH}")
+                if not email_accounts.add_account(username, email, password):
+                    logger.warning(f"Email {email} already registered for user: {username}")
+                    return jsonify({"error": "Email account already registered for this user"}), 400
+                logger.info(f"Saved email account to {EMAIL_ACCOUNTS_DB_PATH}")
             except Exception as e:
                 logger.error(f"Error saving email accounts: {e}")
                 return jsonify({"error": "Failed to save account"}), 500
@@ -179,12 +363,12 @@ def check_account():
     username = data['username']
     
     # Check if user exists
-    if username not in email_accounts:
+    if not email_accounts.has_user(username):
         logger.info(f"User {username} not found")
         return jsonify({"exists": False}), 200
     
     # Check if email exists for this user
-    exists = user_email in email_accounts[username]
+    exists = email_accounts.has_account(username, user_email)
     
     logger.info(f"Checked email account: {user_email} for user: {username}, exists: {exists}")
     return jsonify({"exists": exists}), 200
@@ -207,94 +391,86 @@ def register_face():
     logger.info(f"Processing registration for username: {username}")
     
     try:
-        # Save temporary image file
-        temp_path = "temp_register_image.jpg"
-        image_file.save(temp_path)
-        logger.info(f"Saved temporary image file to {temp_path}")
-        
-        # Load the image
-        logger.info("Loading image with face_recognition library")
-        image = face_recognition.load_image_file(temp_path)
-        logger.info(f"Image loaded successfully, shape: {image.shape}")
-        
-        # Find all face locations in the image
+        # Decode, detect and encode in a face worker (batched with other requests)
         logger.info("Detecting faces in the image")
-        face_locations = face_recognition.face_locations(image)
-        logger.info(f"Number of faces detected: {len(face_locations)}")
+        result = analyze_upload(image_file.read(), max_faces=1)
+        face_locations = result['locations']
+        face_encodings = result['encodings']
+        logger.info(f"Image shape: {result['shape']}, number of faces detected: {len(face_locations)}")
         
         # If no faces found
         if len(face_locations) == 0:
-            os.remove(temp_path)
             logger.warning("No faces detected in the image")
             return jsonify({"registered": False, "message": "No face detected"}), 200
         
         # If multiple faces found
         if len(face_locations) > 1:
-            os.remove(temp_path)
             logger.warning(f"Multiple faces detected: {len(face_locations)}")
             return jsonify({"registered": False, "message": "Multiple faces detected. Please provide an image with only your face."}), 200
         
-        # Get face encodings
-        logger.info("Computing face encodings")
-        face_encodings = face_recognition.face_encodings(image, face_locations)
-        
         if len(face_encodings) == 0:
-            os.remove(temp_path)
             logger.error("Failed to compute face encodings")
             return jsonify({"registered": False, "message": "Failed to process face. Please try again with better lighting."}), 200
         
         # Check if this face is already registered with another username
         logger.info("Checking if face is already registered")
-        for registered_username, registered_encoding in registered_faces.items():
-            if registered_username != username:  # Skip comparing with self
-                matches = face_recognition.compare_faces([registered_encoding], face_encodings[0], tolerance=0.5)
-                if matches[0]:
-                    os.remove(temp_path)
-                    logger.warning(f"Face already registered with username: {registered_username}")
-                    return jsonify({"registered": False, "message": "This face is already registered with another user."}), 200
+        # Skip comparing with self; same tolerance as face_recognition.compare_faces
+        registered_username, distance = registered_faces.nearest(face_encodings[0], exclude=username)
+        if registered_username is not None and distance <= FACE_MATCH_TOLERANCE:
+            logger.warning(f"Face already registered with username: {registered_username}")
+            return jsonify({"registered": False, "message": "This face is already registered with another user."}), 200
         
-        # Store the face encoding for the username
-        registered_faces[username] = face_encodings[0]
-        logger.info(f"Face encoding stored for username: {username}")
+        # Persist the new encoding, then make it searchable
+        face_store.append(username, face_encodings[0])
+        logger.info(f"Face encoding saved to {FACE_STORE_PATH}")
         
-        # Save updated face encodings
-        with open(FACE_DB_PATH, 'wb') as f:
-            pickle.dump(registered_faces, f)
-        logger.info(f"Face encodings saved to {FACE_DB_PATH}")
+        registered_faces.add(username, face_encodings[0])
+        logger.info(f"Face encoding stored for username: {username}")
         
-        os.remove(temp_path)
         logger.info("Registration successful")
         return jsonify({"registered": True, "message": "Face registered successfully"}), 200
     
+    except ImageDecodeError as e:
+        logger.error(f"Invalid image upload: {str(e)}")
+        return jsonify({"error": "Invalid image file"}), 400
+    except PoolSaturatedError:
+        logger.warning("Face worker pool saturated, rejecting request")
+        return jsonify({"error": "Server busy, please try again in a moment"}), 503
+    except FaceJobTimeoutError as e:
+        logger.error(str(e))
+        return jsonify({"error": "Face processing timed out, please try again"}), 504
     except Exception as e:
         logger.error(f"Error in face registration: {str(e)}", exc_info=True)
-        # Clean up temp file if it exists
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/speech-to-text', methods=['POST'])
 def speech_to_text():
-    if 'audio' not in request.files:
+    """
+    Transcribe an 'audio' file upload (or a raw audio/* request body): WAV,
+    or WebM/Opus and other formats ffmpeg can read. The audio is decoded in
+    memory to mono 16 kHz PCM, so concurrent requests share no files.
+    """
+    if 'audio' in request.files:
+        data = request.files['audio'].read()
+    elif request.mimetype.startswith('audio/'):
+        data = request.get_data()
+    else:
         return jsonify({"error": "No audio file provided"}), 400
     
-    audio_file = request.files['audio']
-    
     try:
-        # Save temporary audio file
-        temp_path = "temp_audio.wav"
-        audio_file.save(temp_path)
+        pcm = decode_audio(data)
+        audio_data = sr.AudioData(pcm, TARGET_RATE, 2)
         
         # Convert speech to text
-        with sr.AudioFile(temp_path) as source:
-            audio_data = recognizer.record(source)
-            text = recognizer.recognize_google(audio_data)
-            
-        # Remove temporary file
-        os.remove(temp_path)
+        text = recognizer.recognize_google(audio_data)
         
         return jsonify({"text": text}), 200
     
+    except AudioDecodeError as e:
+        logger.error(f"Invalid audio upload: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except sr.UnknownValueError:
+        return jsonify({"error": "Could not understand the audio"}), 422
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -315,18 +491,17 @@ def send_email():
     username = data['username']
     
     # For debugging
-    if username in email_accounts:
-        logger.info(f"Current email accounts for user {username}: {list(email_accounts[username].keys())}")
+    if email_accounts.has_user(username):
+        logger.info(f"Current email accounts for user {username}: {[a['email'] for a in email_accounts.list_accounts(username)]}")
     else:
         logger.error(f"User {username} not found")
         return jsonify({"error": f"User {username} not found. Please log in again."}), 404
     
-    if from_email not in email_accounts[username]:
+    account = email_accounts.get_account(username, from_email)
+    if account is None:
         logger.error(f"Sender email not found in accounts for user {username}: {from_email}")
         return jsonify({"error": f"Sender email {from_email} not found in accounts for user {username}. Please add the account first."}), 404
     
-    account = email_accounts[username][from_email]
-    password = account['password']
     to_email = data['to_email']
     subject = data['subject']
     body = data['body']
@@ -339,25 +514,84 @@ def send_email():
         msg['Subject'] = subject
         msg.attach(MIMEText(body, 'plain'))
         
-        # Connect to SMTP server (assuming Gmail)
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        
-        logger.info(f"Attempting to login with email: {from_email}")
-        server.login(from_email, password)
-        
-        # Send email
-        logger.info(f"Sending email from {from_email} to {to_email}")
-        server.send_message(msg)
-        server.quit()
+        # Accept now; a queue worker delivers it over a pooled SMTP session
+        message_id = mail_queue.enqueue(username, from_email, msg)
         
-        logger.info("Email sent successfully")
-        return jsonify({"message": "Email sent successfully"}), 200
+        logger.info(f"Email from {from_email} to {to_email} queued as {message_id}")
+        return jsonify({"message": "Email queued for sending", "message_id": message_id, "status": "queued"}), 202
     
     except Exception as e:
-        logger.error(f"Error sending email: {str(e)}", exc_info=True)
+        logger.error(f"Error queueing email: {str(e)}", exc_info=True)
         return jsonify({"error": f"Failed to send email: {str(e)}"}), 500
 
+@app.route('/api/bulk-send', methods=['POST'])
+def bulk_send():
+    """
+    Send one message template to many recipients. 'recipients' is a list of
+    addresses or {email, fields} objects whose fields fill {name}
+    placeholders in the subject and body. Returns a job id to poll.
+    """
+    data = request.json
+    
+    if not data or any(k not in data for k in ('from_email', 'subject', 'body', 'recipients', 'username')):
+        logger.error(f"Missing required bulk send information: {data}")
+        return jsonify({"error": "Missing required information. Need from_email, subject, body, recipients, and username"}), 400
+    
+    recipients = data['recipients']
+    if not isinstance(recipients, list) or not recipients:
+        return jsonify({"error": "recipients must be a non-empty list"}), 400
+    if len(recipients) > BULK_SEND_MAX_RECIPIENTS:
+        return jsonify({"error": f"Too many recipients (maximum {BULK_SEND_MAX_RECIPIENTS})"}), 400
+    if not all(isinstance(r, str) or (isinstance(r, dict) and isinstance(r.get('email'), str)) for r in recipients):
+        return jsonify({"error": "Each recipient must be an address or an object with an email"}), 400
+    if not all(isinstance(r, str) or r.get('fields') is None or isinstance(r['fields'], dict) for r in recipients):
+        return jsonify({"error": "A recipient's fields must be an object"}), 400
+    
+    username = data['username']
+    from_email = data['from_email']
+    account = email_accounts.get_account(username, from_email)
+    if account is None:
+        logger.error(f"Sender email not found in accounts for user {username}: {from_email}")
+        return jsonify({"error": f"Sender email {from_email} not found in accounts for user {username}. Please add the account first."}), 404
+    
+    messages = render_messages(from_email, data['subject'], data['body'], recipients)
+    job_id = bulk_sender.start_job((username, from_email), from_email, account['password'], messages, len(recipients))
+    
+    logger.info(f"Started bulk send job {job_id} from {from_email} to {len(recipients)} recipients")
+    return jsonify({"job_id": job_id, "total": len(recipients), "status": "running"}), 202
+
+@app.route('/api/bulk-send/<job_id>', methods=['GET'])
+def bulk_send_status(job_id):
+    """Progress of a bulk send job: sent count and per-recipient failures"""
+    job = bulk_sender.job_status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job), 200
+
+@app.route('/api/email-status/<message_id>', methods=['GET'])
+def email_status(message_id):
+    """Delivery status of an email accepted by /api/send-email, for the user who sent it"""
+    username = request.args.get('username')
+    if not username:
+        return jsonify({"error": "Missing username"}), 400
+    status = mail_queue.status(message_id)
+    # Someone else's message looks the same as one that does not exist
+    if status is None or status['username'] != username:
+        return jsonify({"error": "Unknown message id"}), 404
+    return jsonify(status), 200
+
+def read_account_unread(username, user_email, password, mode='full', limit=20):
+    """Unread emails of one account over a pooled IMAP session"""
+    # 'summary' mode downloads headers plus a short preview only, and
+    # only for messages that are not in the local cache yet
+    if mode == 'summary':
+        fetch = lambda mail: mailbox_sync.sync_unread(mail, (username, user_email), limit=limit)
+    else:
+        fetch = lambda mail: fetch_unread_emails(mail, limit=limit, mode=mode, preview_bytes=EMAIL_PREVIEW_BYTES,
+                                                   max_bytes=EMAIL_MAX_FETCH_BYTES)
+    # Reuse a logged-in session for this account if one is pooled
+    return imap_pool.run((username, user_email), fetch, user_email, password)
+
 @app.route('/api/read-unread-emails', methods=['POST'])
 def read_unread_emails():
     data = request.json
@@ -371,116 +605,22 @@ def read_unread_emails():
     username = data['username']
     
     # For debugging
-    if username in email_accounts:
-        logger.info(f"Current email accounts for user {username}: {list(email_accounts[username].keys())}")
+    if email_accounts.has_user(username):
+        logger.info(f"Current email accounts for user {username}: {[a['email'] for a in email_accounts.list_accounts(username)]}")
     else:
         logger.error(f"User {username} not found")
         return jsonify({"error": f"User {username} not found. Please log in again."}), 404
     
-    if user_email not in email_accounts[username]:
+    account = email_accounts.get_account(username, user_email)
+    if account is None:
         logger.error(f"Email not found in accounts for user {username}: {user_email}")
         return jsonify({"error": f"Email {user_email} not found in accounts for user {username}. Please add the account first."}), 404
     
-    account = email_accounts[username][user_email]
     password = account['password']
     
     try:
-        # Determine email provider from domain
-        email_domain = user_email.split('@')[1].lower()
-        
-        if 'gmail' in email_domain:
-            imap_server = 'imap.gmail.com'
-        elif 'yahoo' in email_domain:
-            imap_server = 'imap.mail.yahoo.com'
-        elif 'outlook' in email_domain or 'hotmail' in email_domain or 'live' in email_domain:
-            imap_server = 'outlook.office365.com'
-        else:
-            # Default to Gmail
-            imap_server = 'imap.gmail.com'
-        
-        logger.info(f"Using IMAP server {imap_server} for {user_email}")
-            
-        # Connect to IMAP server
-        mail = imaplib.IMAP4_SSL(imap_server)
-        
-        logger.info(f"Attempting to login with email: {user_email}")
-        mail.login(user_email, password)
-        
-        mail.select('inbox')
-        
-        # Search for ALL unread emails, not just from last 24 hours
-        logger.info("Searching for unread emails")
-        result, data = mail.search(None, 'UNSEEN')
-        
-        email_ids = data[0].split()
-        emails = []
-        
-        logger.info(f"Found {len(email_ids)} unread emails")
-        
-        # Limit to most recent 20 emails to avoid overload
-        # Reverse to get newest first
-        email_ids = email_ids[-20:] if len(email_ids) > 20 else email_ids
-        
-        for e_id in email_ids:
-            try:
-                result, data = mail.fetch(e_id, '(RFC822)')
-                raw_email = data[0][1]
-                msg = email.message_from_bytes(raw_email)
-                
-                subject = decode_header(msg['subject'])
-                subject = subject[0][0]
-                if isinstance(subject, bytes):
-                    subject = subject.decode('utf-8', errors='replace')
-                
-                from_addr = decode_header(msg['from'])
-                from_addr = from_addr[0][0]
-                if isinstance(from_addr, bytes):
-                    from_addr = from_addr.decode('utf-8', errors='replace')
-                
-                body = ""
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        content_type = part.get_content_type()
-                        content_disposition = str(part.get("Content-Disposition"))
-                        
-                        if "attachment" not in content_disposition and (content_type == "text/plain" or content_type == "text/html"):
-                            try:
-                                payload = part.get_payload(decode=True)
-                                if payload:
-                                    charset = part.get_content_charset() or 'utf-8'
-                                    body = payload.decode(charset, errors='replace')
-                                    if content_type == "text/html":
-                                        # Try to extract text from HTML
-                                        body = re.sub('<[^<]+?>', ' ', body)
-                                    break
-                            except Exception as e:
-                                logger.error(f"Error decoding email part: {str(e)}")
-                                continue
-                else:
-                    try:
-                        payload = msg.get_payload(decode=True)
-                        if payload:
-                            charset = msg.get_content_charset() or 'utf-8'
-                            body = payload.decode(charset, errors='replace')
-                    except Exception as e:
-                        logger.error(f"Error decoding email: {str(e)}")
-                
-                # Clean up the body text
-                body = re.sub(r'\s+', ' ', body).strip()
-                
-                emails.append({
-                    "from": from_addr,
-                    "subject": subject,
-                    "body": body
-                })
-                
-                logger.info(f"Processed email: {subject}")
-            except Exception as e:
-                logger.error(f"Error processing email ID {e_id}: {str(e)}")
-                continue
-        
-        mail.close()
-        mail.logout()
+        logger.info(f"Reading unread emails for {user_email}")
+        emails = read_account_unread(username, user_email, password, data.get('mode', 'full'))
         
         logger.info(f"Successfully retrieved {len(emails)} unread emails")
         return jsonify({"emails": emails}), 200
@@ -489,6 +629,159 @@ def read_unread_emails():
         logger.error(f"Error reading unread emails: {str(e)}", exc_info=True)
         return jsonify({"error": f"Failed to read unread emails: {str(e)}"}), 500
 
+@app.route('/api/unified-inbox', methods=['POST'])
+def unified_inbox():
+    """
+    Unread emails from all of a user's accounts, read in parallel and merged
+    by date (oldest first, like /api/read-unread-emails). Each email carries
+    the 'account' it came from; accounts that failed or did not answer within
+    UNIFIED_INBOX_TIMEOUT are listed in 'errors' next to the partial result.
+    """
+    data = request.json
+    
+    if not data or 'username' not in data:
+        logger.error("Missing username in unified inbox request")
+        return jsonify({"error": "Missing username"}), 400
+    
+    username = data['username']
+    if not email_accounts.has_user(username):
+        logger.error(f"User {username} not found")
+        return jsonify({"error": f"User {username} not found. Please log in again."}), 404
+    
+    # Summary mode by default: a full read would mark every account's mail as read
+    mode = data.get('mode', 'summary')
+    limit = positive_int(data.get('limit', 20))
+    if limit is None:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    limit = min(limit, EMAIL_MAX_LIMIT)
+    
+    readers = {}
+    for account in email_accounts.list_accounts(username):
+        user_email = account['email']
+        password = email_accounts.get_account(username, user_email)['password']
+        readers[user_email] = functools.partial(read_account_unread, username, user_email, password, mode, limit)
+    
+    emails, errors = read_accounts_unread(inbox_executor, readers, UNIFIED_INBOX_TIMEOUT, limit)
+    
+    logger.info(f"Unified inbox for {username}: {len(emails)} emails from {len(readers)} accounts, {len(errors)} errors")
+    return jsonify({"emails": emails, "errors": errors}), 200
+
+@app.route('/api/read-email', methods=['POST'])
+def read_email():
+    """Fetch the full body of one message (by UID) after a summary read"""
+    data = request.json
+    
+    if not data or 'email' not in data or 'username' not in data or 'uid' not in data:
+        logger.error("Missing email, username or uid in read email request")
+        return jsonify({"error": "Missing email, username or uid"}), 400
+    
+    user_email = data['email']
+    username = data['username']
+    uid = positive_int(data['uid'])
+    if uid is None:
+        logger.error(f"Invalid uid in read email request: {data['uid']!r}")
+        return jsonify({"error": "uid must be a positive integer"}), 400
+    
+    account = email_accounts.get_account(username, user_email)
+    if account is None:
+        logger.error(f"Email not found in accounts for user {username}: {user_email}")
+        return jsonify({"error": f"Email {user_email} not found in accounts for user {username}. Please add the account first."}), 404
+    
+    try:
+        message = imap_pool.run(
+            (username, user_email),
+            lambda mail: fetch_email_by_uid(mail, uid, mark_seen=data.get('mark_seen', True),
+                                           max_bytes=EMAIL_MAX_FETCH_BYTES),
+            user_email, account['password'])
+        
+        if message is None:
+            logger.warning(f"Email with UID {uid} not found for {user_email}")
+            return jsonify({"error": "Email not found"}), 404
+        
+        logger.info(f"Retrieved full email with UID {uid}")
+        return jsonify({"email": message}), 200
+    
+    except Exception as e:
+        logger.error(f"Error reading email: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Failed to read email: {str(e)}"}), 500
+
+@app.route('/api/mail-events', methods=['GET'])
+def mail_events():
+    """Server-sent event stream of new-mail notifications for one account"""
+    username = request.args.get('username')
+    user_email = request.args.get('email')
+    
+    if not username or not user_email:
+        logger.error("Missing email or username in mail events request")
+        return jsonify({"error": "Missing email account or username information"}), 400
+    
+    account = email_accounts.get_account(username, user_email)
+    if account is None:
+        logger.error(f"Email not found in accounts for user {username}: {user_email}")
+        return jsonify({"error": f"Email {user_email} not found in accounts for user {username}. Please add the account first."}), 404
+    
+    key = (username, user_email)
+    if mail_watcher.login_failed(key, account['password']):
+        # Not a 200, so EventSource gives up instead of reconnecting
+        return jsonify({"error": f"The mail server refused the login for {user_email}. Please update the account password."}), 401
+    events = mail_watcher.subscribe(key, user_email, account['password'])
+    logger.info(f"Opened mail event stream for {user_email}")
+    
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = events.get(timeout=MAIL_EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            mail_watcher.unsubscribe(key, events)
+            logger.info(f"Closed mail event stream for {user_email}")
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def authenticate_frame(data, username):
+    """
+    Match one uploaded frame against the user's registered face.
+    Returns (body, distance): the JSON reply for this frame and the face
+    distance, or None when no usable face was found.
+    """
+    # Decode, detect and encode in a face worker (batched with other requests)
+    logger.info("Detecting faces in the image")
+    result = analyze_upload(data, username=username)
+    face_locations = result['locations']
+    face_encodings = result['encodings']
+    logger.info(f"Image shape: {result['shape']}, number of faces detected: {len(face_locations)}")
+    
+    # If no faces found
+    if len(face_locations) == 0:
+        logger.warning("No faces detected in the image")
+        return {"authenticated": False, "message": "No face detected"}, None
+    
+    if len(face_encodings) == 0:
+        logger.error("Failed to compute face encodings")
+        return {"authenticated": False, "message": "Failed to process face. Please try again with better lighting."}, None
+    
+    # Compare with registered face for this username
+    logger.info("Comparing face encodings")
+    distance = result.get('distance')
+    
+    if distance is not None and distance <= FACE_MATCH_TOLERANCE:
+        logger.info("Authentication successful")
+        return {
+            "authenticated": True, 
+            "message": "Authentication successful",
+            "username": username
+        }, distance
+    else:
+        logger.warning("Face does not match registered user")
+        return {"authenticated": False, "message": "Face does not match registered user"}, distance
+
 @app.route('/api/facial-recognition', methods=['POST'])
 def facial_recognition():
     logger.info("Authentication request received")
@@ -512,58 +805,119 @@ def facial_recognition():
         return jsonify({"authenticated": False, "message": "User not registered. Please register your face first."}), 200
     
     try:
-        # Save temporary image file
-        temp_path = "temp_image.jpg"
-        image_file.save(temp_path)
-        logger.info(f"Saved temporary image file to {temp_path}")
-        
-        # Load the image
-        logger.info("Loading image with face_recognition library")
-        image = face_recognition.load_image_file(temp_path)
-        logger.info(f"Image loaded successfully, shape: {image.shape}")
-        
-        # Find all face locations in the image
-        logger.info("Detecting faces in the image")
-        face_locations = face_recognition.face_locations(image)
+        body, _ = authenticate_frame(image_file.read(), username)
+        return jsonify(body), 200
+    
+    except ImageDecodeError as e:
+        logger.error(f"Invalid image upload: {str(e)}")
+        return jsonify({"error": "Invalid image file"}), 400
+    except PoolSaturatedError:
+        logger.warning("Face worker pool saturated, rejecting request")
+        return jsonify({"error": "Server busy, please try again in a moment"}), 503
+    except FaceJobTimeoutError as e:
+        logger.error(str(e))
+        return jsonify({"error": "Face processing timed out, please try again"}), 504
+    except Exception as e:
+        logger.error(f"Error in facial authentication: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/facial-recognition/burst', methods=['POST'])
+def facial_recognition_burst():
+    """
+    Authenticate from a short burst of frames (multipart field 'images',
+    in capture order). Frames are matched one by one and the request returns
+    as soon as one matches confidently, skipping the rest.
+    """
+    logger.info("Burst authentication request received")
+    
+    frames = request.files.getlist('images')
+    if not frames:
+        logger.error("No image files provided in request")
+        return jsonify({"error": "No image files provided"}), 400
+    
+    if 'username' not in request.form:
+        logger.error("No username provided in request")
+        return jsonify({"error": "No username provided"}), 400
+    
+    username = request.form['username']
+    
+    logger.info(f"Processing burst of {min(len(frames), FACE_BURST_MAX_FRAMES)} frames for username: {username}")
+    
+    if username not in registered_faces:
+        logger.warning(f"Username not registered: {username}")
+        return jsonify({"authenticated": False, "message": "User not registered. Please register your face first."}), 200
+    
+    try:
+        body = match_burst(frames, lambda data: authenticate_frame(data, username),
+                           FACE_BURST_MAX_FRAMES, FACE_CONFIDENT_TOLERANCE)
+        return jsonify(body), 200
+    
+    except ImageDecodeError as e:
+        logger.error(f"Invalid burst upload: {str(e)}")
+        return jsonify({"error": "No readable image files provided"}), 400
+    except PoolSaturatedError:
+        logger.warning("Face worker pool saturated, rejecting request")
+        return jsonify({"error": "Server busy, please try again in a moment"}), 503
+    except FaceJobTimeoutError as e:
+        logger.error(str(e))
+        return jsonify({"error": "Face processing timed out, please try again"}), 504
+    except Exception as e:
+        logger.error(f"Error in burst authentication: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/identify-face', methods=['POST'])
+def identify_face():
+    """Username-less login: find which registered user the face belongs to"""
+    logger.info("Identification request received")
+    
+    if 'image' not in request.files:
+        logger.error("No image file provided in request")
+        return jsonify({"error": "No image file provided"}), 400
+    
+    image_file = request.files['image']
+    
+    try:
+        result = analyze_upload(image_file.read(), max_faces=1)
+        face_locations = result['locations']
+        face_encodings = result['encodings']
         logger.info(f"Number of faces detected: {len(face_locations)}")
         
-        # If no faces found
         if len(face_locations) == 0:
-            os.remove(temp_path)
             logger.warning("No faces detected in the image")
             return jsonify({"authenticated": False, "message": "No face detected"}), 200
         
-        # Get face encodings
-        logger.info("Computing face encodings")
-        face_encodings = face_recognition.face_encodings(image, face_locations)
+        if len(face_locations) > 1:
+            logger.warning(f"Multiple faces detected: {len(face_locations)}")
+            return jsonify({"authenticated": False, "message": "Multiple faces detected. Please make sure only your face is visible."}), 200
         
         if len(face_encodings) == 0:
-            os.remove(temp_path)
             logger.error("Failed to compute face encodings")
             return jsonify({"authenticated": False, "message": "Failed to process face. Please try again with better lighting."}), 200
         
-        # Compare with registered face for this username
-        logger.info("Comparing face encodings")
-        matches = face_recognition.compare_faces([registered_faces[username]], face_encodings[0], tolerance=0.5)
-        
-        os.remove(temp_path)
+        username, distance = registered_faces.nearest(face_encodings[0])
         
-        if matches[0]:
-            logger.info("Authentication successful")
+        if username is not None and distance <= FACE_MATCH_TOLERANCE:
+            logger.info(f"Identified user: {username} (distance {distance:.3f})")
             return jsonify({
-                "authenticated": True, 
+                "authenticated": True,
                 "message": "Authentication successful",
                 "username": username
             }), 200
         else:
-            logger.warning("Face does not match registered user")
-            return jsonify({"authenticated": False, "message": "Face does not match registered user"}), 200
+            logger.warning("Face does not match any registered user")
+            return jsonify({"authenticated": False, "message": "Face does not match any registered user"}), 200
     
+    except ImageDecodeError as e:
+        logger.error(f"Invalid image upload: {str(e)}")
+        return jsonify({"error": "Invalid image file"}), 400
+    except PoolSaturatedError:
+        logger.warning("Face worker pool saturated, rejecting request")
+        return jsonify({"error": "Server busy, please try again in a moment"}), 503
+    except FaceJobTimeoutError as e:
+        logger.error(str(e))
+        return jsonify({"error": "Face processing timed out, please try again"}), 504
     except Exception as e:
-        logger.error(f"Error in facial authentication: {str(e)}", exc_info=True)
-        # Clean up temp file if it exists
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        logger.error(f"Error in face identification: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/login', methods=['POST'])
@@ -582,36 +936,156 @@ def get_users():
     logger.info(f"Get users request, returning {len(users)} users")
     return jsonify(users), 200
 
-@app.route('/api/text-to-speech', methods=['POST'])
+def tts_engines_for(data):
+    """
+    Engines to try for a request: only the one it names in 'engine', else
+    TTS_ENGINE followed by the TTS_FALLBACK engines. Raises KeyError for an
+    unknown engine name.
+    """
+    if data.get('engine'):
+        return [tts_engines[data['engine']]]
+    names = [TTS_ENGINE] + [name for name in TTS_FALLBACK if name != TTS_ENGINE]
+    return [tts_engines[name] for name in names]
+
+def synthesize_speech(engines, text, lang='en', slow=False):
+    """Render text through the cache and the prompt catalog, returning (audio, engine)"""
+    return synthesize_prompt(prompt_catalog, engines, text, lang, slow, tts_cache)
+
+if os.getenv('TTS_PREWARM', '1') != '0' and SERVING_PROCESS:
+    prewarm(prompt_catalog,
+            lambda text: synthesize_speech(tts_engines_for({}), text, TTS_PREWARM_LANG))
+
+@app.route('/api/text-to-speech', methods=['GET', 'POST'])
 def text_to_speech():
     """
-    Convert text to speech using gTTS (Google Text-to-Speech)
-    Returns an audio file in MP3 format
+    Convert text to speech with the configured engine (gTTS by default), or
+    the one named in 'engine', falling back to the others if it fails.
+    Returns MP3 audio (WAV from pyttsx3 when ffmpeg is not installed)
+    
+    Clips are cached by content, so repeated prompts skip synthesis. GET
+    (?text=...&lang=...) only takes the fixed voice prompts, whose responses
+    the browser may cache; everything else (email senders, subjects, bodies)
+    must be POSTed so it stays out of URLs and access logs. Both carry the
+    clip's cache key as their ETag.
     """
-    data = request.json
+    data = request.args if request.method == 'GET' else request.json
     
     if not data or 'text' not in data:
         return jsonify({"error": "No text provided"}), 400
     
     text = data['text']
+    if request.method == 'GET' and not prompt_catalog.covers(text):
+        return jsonify({"error": "Only voice prompts can be requested with GET; POST other text"}), 400
+    lang = data.get('lang', 'en')
+    slow = str(data.get('slow', False)).lower() in ('1', 'true')
+    try:
+        engines = tts_engines_for(data)
+    except KeyError:
+        return jsonify({"error": f"Unknown TTS engine: {data['engine']}"}), 400
     logger.info(f"Text-to-speech request received for text of length: {len(text)}")
     
+    key = tts_cache_key(text, lang, slow, engines[0].cache_name)
+    if key in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{key}"'})
+    
     try:
-        # Create a temporary file to store the audio
-        mp3_fp = io.BytesIO()
+        audio, engine = synthesize_speech(engines, text, lang, slow)
         
-        # Use gTTS to generate the speech
-        # Slower but higher quality than browser's built-in TTS
-        tts = gTTS(text=text, lang='en', slow=False)
-        tts.write_to_fp(mp3_fp)
-        mp3_fp.seek(0)
-        
-        logger.info("Successfully generated speech audio")
-        return Response(mp3_fp.read(), mimetype='audio/mpeg')
+        logger.info(f"Successfully generated speech audio with {engine.name}")
+        key = tts_cache_key(text, lang, slow, engine.cache_name)
+        headers = {'ETag': f'"{key}"'}
+        if request.method == 'GET':
+            headers['Cache-Control'] = f'public, max-age={TTS_CACHE_MAX_AGE}'
+        else:
+            headers['Cache-Control'] = 'no-store'
+        return Response(audio, mimetype=engine.mimetype, headers=headers)
         
     except Exception as e:
         logger.error(f"Error generating speech: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/text-to-speech/prompts', methods=['GET'])
+def text_to_speech_prompts():
+    """The fixed voice prompts, which clients may request with a cacheable GET"""
+    return jsonify({"phrases": prompt_catalog.phrases}), 200
+
+@app.route('/api/text-to-speech/stream', methods=['POST'])
+def create_speech_stream():
+    """
+    Register text (with optional lang, slow and engine) for streaming and
+    return its stream_id; GET /api/text-to-speech/stream/<stream_id> then
+    plays it. The text travels in the request body, never in a URL.
+    """
+    data = request.json
+    
+    if not data or not data.get('text'):
+        return jsonify({"error": "No text provided"}), 400
+    if data.get('engine') and data['engine'] not in tts_engines:
+        return jsonify({"error": f"Unknown TTS engine: {data['engine']}"}), 400
+    
+    stream_id = tts_streams.add({
+        'text': data['text'],
+        'lang': data.get('lang', 'en'),
+        'slow': str(data.get('slow', False)).lower() in ('1', 'true'),
+        'engine': data.get('engine'),
+    })
+    return jsonify({"stream_id": stream_id}), 201
+
+@app.route('/api/text-to-speech/stream/<stream_id>', methods=['GET'])
+def text_to_speech_stream(stream_id):
+    """
+    Synthesize registered text sentence by sentence and stream the MP3 as
+    each sentence is ready, so playback of a long email starts after the
+    first sentence rather than the whole text. Each sentence is cached on
+    its own. Engines that cannot produce MP3 get the whole clip in one
+    response instead.
+    """
+    data = tts_streams.get(stream_id)
+    if data is None:
+        return jsonify({"error": "Unknown or expired stream id"}), 404
+    
+    text, lang, slow = data['text'], data['lang'], data['slow']
+    engines = tts_engines_for(data)
+    # WAV clips cannot simply be concatenated
+    mp3_engines = [engine for engine in engines if engine.format == 'mp3']
+    if not mp3_engines:
+        try:
+            audio, engine = synthesize_speech(engines, text, lang, slow)
+        except Exception as e:
+            logger.error(f"Error generating speech: {str(e)}", exc_info=True)
+            return jsonify({"error": str(e)}), 500
+        return Response(audio, mimetype=engine.mimetype, headers={'Cache-Control': 'no-store'})
+    
+    chunks = split_sentences(text)
+    if not chunks:
+        return jsonify({"error": "No text provided"}), 400
+    logger.info(f"Streaming text-to-speech for {len(chunks)} sentences")
+    
+    def render(chunk):
+        return synthesize_speech(mp3_engines, chunk, lang, slow)[0]
+    
+    audio = stream_synthesis(chunks, render, tts_stream_executor, lookahead=TTS_STREAM_LOOKAHEAD)
+    try:
+        # Render the first sentence before answering, so a failure is still a 500
+        first = next(audio)
+    except Exception as e:
+        audio.close()
+        logger.error(f"Error generating speech: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    
+    def stream():
+        try:
+            yield first
+            for clip in audio:
+                yield strip_id3(clip)
+        except Exception as e:
+            # Headers are already sent; end the stream where synthesis failed
+            logger.error(f"Error streaming speech: {str(e)}", exc_info=True)
+        finally:
+            audio.close()
+    
+    return Response(stream(), mimetype='audio/mpeg',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001, host='0.0.0.0') 
\ No newline at end of file
@@ -0,0 +1,102 @@
+import io
+import subprocess
+import wave
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# What the speech recognizer gets: mono 16-bit PCM at 16 kHz
+TARGET_RATE = 16000
+
+
+class AudioDecodeError(ValueError):
+    """Raised when an upload is not readable audio"""
+
+
+def pcm_to_float(frames, sample_width, channels):
+    """Interleaved PCM bytes to a float32 array of shape (samples, channels) in [-1, 1]"""
+    if sample_width == 1:
+        # 8-bit WAV is unsigned
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768
+    elif sample_width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16)
+        samples = (np.where(ints >= 1 << 23, ints - (1 << 24), ints)).astype(np.float32) / (1 << 23)
+    elif sample_width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / (1 << 31)
+    else:
+        raise AudioDecodeError(f"Unsupported WAV sample width: {sample_width} bytes")
+    return samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+
+
+def resample(samples, rate, target_rate=TARGET_RATE):
+    """
+    Linear-interpolation resampling of a mono float array. When downsampling,
+    a moving average over one output period first removes most of the
+    content above the new Nyquist frequency.
+    """
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    if rate > target_rate:
+        width = int(round(rate / target_rate))
+        if width > 1:
+            samples = np.convolve(samples, np.full(width, 1 / width, dtype=np.float32), mode='same')
+    count = int(len(samples) * target_rate / rate)
+    positions = np.arange(count, dtype=np.float64) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def float_to_pcm16(samples):
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def decode_wav(data, target_rate=TARGET_RATE):
+    """Decode PCM WAV bytes to mono 16-bit PCM at ``target_rate``"""
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise AudioDecodeError(f"Could not read WAV: {e}")
+    mono = pcm_to_float(frames, width, channels).mean(axis=1)
+    return float_to_pcm16(resample(mono, rate, target_rate))
+
+
+def decode_with_ffmpeg(data, target_rate=TARGET_RATE, timeout=30):
+    """
+    Decode any format ffmpeg reads (WebM/Opus from MediaRecorder, Ogg, MP3,
+    compressed WAV) to mono 16-bit PCM through its stdin and stdout.
+    """
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+             '-f', 's16le', '-ac', '1', '-ar', str(target_rate), 'pipe:1'],
+            input=data, capture_output=True, timeout=timeout)
+    except FileNotFoundError:
+        raise AudioDecodeError("Decoding this audio format needs ffmpeg, which is not installed")
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeError("Timed out decoding audio")
+    if result.returncode != 0:
+        raise AudioDecodeError(f"Could not decode audio: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout
+
+
+def decode_audio(data, target_rate=TARGET_RATE):
+    """
+    Decode uploaded audio bytes in memory to mono 16-bit PCM at
+    ``target_rate``. PCM WAV is decoded with NumPy; everything else goes
+    through ffmpeg. Raises AudioDecodeError if the bytes are not readable audio.
+    """
+    if not data:
+        raise AudioDecodeError("Empty audio upload")
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        try:
+            return decode_wav(data, target_rate)
+        except AudioDecodeError as e:
+            # wave only reads PCM; let ffmpeg try float or compressed WAV
+            logger.info(f"Falling back to ffmpeg for WAV upload: {e}")
+    return decode_with_ffmpeg(data, target_rate)
@@ -0,0 +1,78 @@
+"""
+Benchmark bulk sending throughput against a local SMTP stand-in.
+
+Usage:
+    python bench_bulk_send.py [--messages 200] [--latency-ms 20] [--concurrency 1 2 4] [--rate 0]
+
+Compares the old one-connection-per-email pattern (connect, EHLO, AUTH,
+send, QUIT, as /api/send-email used to do) with BulkSender over pooled
+sessions at several concurrency levels, and reports messages/second.
+--latency-ms delays every server reply to stand in for the round trip to a
+real provider (TLS is not simulated, so the real gap is larger); --rate
+applies the per-mailbox rate limit (0 = unlimited).
+"""
+import argparse
+import smtplib
+import time
+
+from bulk_mail import BulkSender, render_messages
+from smtp_standin import SMTPStandIn, LocalSMTPPool
+
+FROM_EMAIL = 'sender@example.com'
+
+
+def recipients(count):
+    return [{'email': f"user{i}@example.org", 'fields': {'name': f"User {i}"}} for i in range(count)]
+
+
+def bench_connect_per_message(server, count):
+    start = time.perf_counter()
+    for _, msg in render_messages(FROM_EMAIL, "Hello {name}", "Hi {name}, see you soon.", recipients(count)):
+        smtp = smtplib.SMTP('127.0.0.1', server.port)
+        smtp.login(FROM_EMAIL, 'password')
+        smtp.send_message(msg)
+        smtp.quit()
+    return time.perf_counter() - start
+
+
+def bench_bulk(server, count, concurrency, rate):
+    pool = LocalSMTPPool(server.port, max_per_key=concurrency)
+    sender = BulkSender(pool, rate_limits={}, default_rate=rate or None, concurrency=concurrency)
+    messages = render_messages(FROM_EMAIL, "Hello {name}", "Hi {name}, see you soon.", recipients(count))
+    start = time.perf_counter()
+    job = sender.send(('bench', FROM_EMAIL), FROM_EMAIL, 'password', messages)
+    elapsed = time.perf_counter() - start
+    assert job['sent'] == count, job['failed'][:3]
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk SMTP sending")
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Delay before every server reply")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--rate', type=float, default=0.0, help="Provider rate limit in messages/s (0 = none)")
+    args = parser.parse_args()
+
+    server = SMTPStandIn(latency=args.latency_ms / 1000).start()
+    try:
+        print(f"{args.messages} messages, {args.latency_ms:g} ms per server reply\n")
+        print(f"{'mode':<28}{'seconds':>9}{'msg/s':>9}{'connections':>13}{'AUTH':>6}")
+
+        server.reset_counts()
+        elapsed = bench_connect_per_message(server, args.messages)
+        print(f"{'connect per message':<28}{elapsed:>9.2f}{args.messages / elapsed:>9.1f}"
+              f"{server.connections:>13}{server.command_counts['AUTH']:>6}")
+
+        for concurrency in args.concurrency:
+            server.reset_counts()
+            elapsed = bench_bulk(server, args.messages, concurrency, args.rate)
+            label = f"pooled, concurrency {concurrency}"
+            print(f"{label:<28}{elapsed:>9.2f}{args.messages / elapsed:>9.1f}"
+                  f"{server.connections:>13}{server.command_counts['AUTH']:>6}")
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark the downscaled face detection pipeline against full-resolution detection.
+
+Usage:
+    python bench_face_detection.py path/to/frames [--widths 320 480 640] [--roi 0.8]
+
+For every image in the directory (e.g. 1080p webcam captures) the script times
+detection + encoding at full resolution and with each detection width, then
+reports the speedup and the accuracy impact: how often the same number of
+faces was found, the IoU of the detected boxes, and the distance between the
+full-resolution encoding and the pipeline encoding (anything below the 0.5
+match tolerance would still authenticate as the same person).
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import face_recognition
+
+from face_pipeline import decode_image, detect_faces
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+MATCH_TOLERANCE = 0.5
+
+
+def box_iou(a, b):
+    top, right, bottom, left = a
+    top2, right2, bottom2, left2 = b
+    inter_h = max(0, min(bottom, bottom2) - max(top, top2))
+    inter_w = max(0, min(right, right2) - max(left, left2))
+    inter = inter_h * inter_w
+    union = (bottom - top) * (right - left) + (bottom2 - top2) * (right2 - left2) - inter
+    return inter / union if union else 0.0
+
+
+def run(image, **options):
+    start = time.perf_counter()
+    if options:
+        locations = detect_faces(image, **options)
+    else:
+        locations = face_recognition.face_locations(image)
+    encodings = face_recognition.face_encodings(image, locations)
+    return time.perf_counter() - start, locations, encodings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark downscaled face detection")
+    parser.add_argument('directory', help="Directory of test frames")
+    parser.add_argument('--widths', type=int, nargs='+', default=[320, 480, 640])
+    parser.add_argument('--roi', type=float, default=None, help="Centered ROI fraction, e.g. 0.8")
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.directory, name) for name in os.listdir(args.directory)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        print(f"No images found in {args.directory}")
+        return
+
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(decode_image(f.read()))
+    print(f"Loaded {len(images)} images, first shape {images[0].shape}")
+
+    baseline = [run(image) for image in images]
+    base_time = np.mean([t for t, _, _ in baseline])
+    print(f"\n{'config':<22}{'ms/frame':>10}{'speedup':>9}{'same count':>12}{'mean IoU':>10}{'mean dist':>11}{'match':>8}")
+    print(f"{'full resolution':<22}{base_time * 1000:>10.1f}{1.0:>9.2f}{'-':>12}{'-':>10}{'-':>11}{'-':>8}")
+
+    for width in args.widths:
+        results = [run(image, detection_width=width, roi_fraction=args.roi) for image in images]
+        mean_time = np.mean([t for t, _, _ in results])
+
+        same_count, ious, dists = 0, [], []
+        for (_, base_locs, base_encs), (_, locs, encs) in zip(baseline, results):
+            if len(base_locs) == len(locs):
+                same_count += 1
+            if base_locs and locs:
+                ious.append(box_iou(base_locs[0], locs[0]))
+                dists.append(float(np.linalg.norm(base_encs[0] - encs[0])))
+
+        label = f"width {width}" + (f", roi {args.roi}" if args.roi else "")
+        print(f"{label:<22}{mean_time * 1000:>10.1f}{base_time / mean_time:>9.2f}"
+              f"{same_count / len(images):>12.1%}"
+              f"{np.mean(ious) if ious else float('nan'):>10.3f}"
+              f"{np.mean(dists) if dists else float('nan'):>11.4f}"
+              f"{np.mean([d <= MATCH_TOLERANCE for d in dists]) if dists else float('nan'):>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
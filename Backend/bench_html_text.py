@@ -0,0 +1,103 @@
+"""
+Benchmark the HTML-to-text converter against the regex strip it replaced.
+
+Usage:
+    python bench_html_text.py [path/to/newsletters] [--max-chars 20000] [--repeat 5]
+
+The directory should hold real newsletter/marketing emails saved as .html or
+.htm files. Without one, the sample emails in bench_emails/ (a responsive
+newsletter, a shipping receipt and an Outlook reply thread) are timed along
+with synthetic newsletters of growing size (table layout, large <style>
+blocks, inline CSS, tracking pixels, entities). For each
+document the script reports the time per document for the old regex, the
+converter on the whole document and the converter with early truncation,
+plus how much leftover CSS/script and undecoded entities the regex output
+would have read aloud.
+"""
+import argparse
+import os
+import random
+import re
+import time
+
+from html_text import html_to_text
+
+HTML_EXTENSIONS = ('.html', '.htm')
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_emails')
+ENTITY = re.compile(r'&(?:[a-z]+|#\d+|#x[0-9a-f]+);', re.I)
+
+
+def regex_strip(body):
+    """The previous extraction: drop anything tag-like, collapse whitespace"""
+    body = re.sub('<[^<]+?>', ' ', body)
+    return re.sub(r'\s+', ' ', body).strip()
+
+
+def synthetic_newsletter(rng, sections):
+    css = "\n".join(f".c{i} {{ color: #{rng.randrange(0xffffff):06x}; padding: {i}px; font-family: Arial; }}"
+                    for i in range(400))
+    rows = []
+    for i in range(sections):
+        words = ' '.join(rng.choice(['deal', 'offer', 'new', 'summer', 'save', 'today', 'you&rsquo;ll',
+                                     'love', '&amp;', 'more', 'caf&eacute;', '&nbsp;'])
+                         for _ in range(rng.randint(20, 80)))
+        rows.append(
+            f'<tr><td class="c{i % 400}" style="padding:10px;border:0;background:#fff" width="600">'
+            f'<table role="presentation"><tr><td><h2 style="margin:0">Section {i}</h2>'
+            f'<p style="font-size:14px;line-height:20px">{words}</p>'
+            f'<a href="https://example.com/track?id={i}&amp;u=1"><img src="https://example.com/p{i}.png" '
+            f'alt="" width="1" height="1"></a></td></tr></table></td></tr>')
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Newsletter</title>"
+            f"<style>{css}</style><script>window.dataLayer=[];</script></head>"
+            f"<body><table width='100%'>{''.join(rows)}</table></body></html>")
+
+
+def load_corpus(directory):
+    documents = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(HTML_EXTENSIONS):
+            with open(os.path.join(directory, name), 'rb') as f:
+                documents.append((name, f.read().decode('utf-8', errors='replace')))
+    return documents
+
+
+def timed(fn, document, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(document)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML-to-text extraction")
+    parser.add_argument('directory', nargs='?', help="Directory of .html emails (default: samples and synthetic)")
+    parser.add_argument('--max-chars', type=int, default=20000, help="Truncation length for the early-exit run")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.directory:
+        documents = load_corpus(args.directory)
+        if not documents:
+            print(f"No HTML files found in {args.directory}")
+            return
+    else:
+        rng = random.Random(0)
+        documents = load_corpus(SAMPLE_DIR) if os.path.isdir(SAMPLE_DIR) else []
+        documents += [(f"synthetic-{n}", synthetic_newsletter(rng, n)) for n in (20, 100, 500, 2000)]
+
+    print(f"{'document':<24}{'KB':>8}{'regex ms':>10}{'full ms':>9}{'trunc ms':>10}"
+          f"{'regex css/js':>14}{'regex ents':>12}")
+    totals = [0.0, 0.0, 0.0]
+    for name, document in documents:
+        regex_time, regex_text = timed(regex_strip, document, args.repeat)
+        full_time, _ = timed(html_to_text, document, args.repeat)
+        trunc_time, _ = timed(lambda d: html_to_text(d, args.max_chars), document, args.repeat)
+        totals = [totals[0] + regex_time, totals[1] + full_time, totals[2] + trunc_time]
+        leaked = len(re.findall(r'[{};]\s', regex_text))
+        print(f"{name[:23]:<24}{len(document) / 1024:>8.0f}{regex_time * 1000:>10.2f}{full_time * 1000:>9.2f}"
+              f"{trunc_time * 1000:>10.2f}{leaked:>14}{len(ENTITY.findall(regex_text)):>12}")
+    print(f"{'total':<24}{'':>8}{totals[0] * 1000:>10.2f}{totals[1] * 1000:>9.2f}{totals[2] * 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import re
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from email.mime.text import MIMEText
+
+from smtp_pool import smtp_server_for
+
+logger = logging.getLogger(__name__)
+
+# Messages per second each provider tolerates from one mailbox before throttling
+# (Office 365 allows 30 messages a minute per mailbox)
+DEFAULT_RATE_LIMITS = {
+    'smtp.gmail.com': 2.0,
+    'smtp.mail.yahoo.com': 1.0,
+    'smtp.office365.com': 0.5,
+}
+
+_FIELD = re.compile(r'\{(\w+)\}')
+
+
+def fill_template(text, fields):
+    """Replace {name} placeholders with fields[name]; unknown placeholders are left as they are"""
+    return _FIELD.sub(lambda m: str(fields.get(m.group(1), m.group(0))), text)
+
+
+def render_messages(from_email, subject, body, recipients):
+    """
+    Lazily build one message per recipient. ``recipients`` items are an
+    address or {'email': ..., 'fields': {...}}; the fields (plus 'email')
+    fill {name} placeholders in the subject and body. Yields (to, message).
+    """
+    for recipient in recipients:
+        if isinstance(recipient, str):
+            recipient = {'email': recipient}
+        fields = dict(recipient.get('fields') or {}, email=recipient['email'])
+        msg = MIMEText(fill_template(body, fields), 'plain')
+        msg['From'] = from_email
+        msg['To'] = recipient['email']
+        msg['Subject'] = fill_template(subject, fields)
+        yield recipient['email'], msg
+
+
+def parse_rate_limits(spec):
+    """Parse 'smtp.gmail.com=2,smtp.office365.com=0.5' into a dict"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        host, _, rate = item.partition('=')
+        limits[host.strip()] = float(rate)
+    return limits
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` acquisitions per second, in bursts of up to ``burst``"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve a token even if it is not there yet, then wait for it outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class BulkSender:
+    """
+    Sends mail-merge batches in the background over pooled SMTP sessions.
+
+    Each job pulls messages from a generator, so a large recipient list is
+    never built up front, and sends them from ``concurrency`` threads sharing
+    the account's pooled sessions. Providers throttle each mailbox, so every
+    sending account has one rate limiter shared by all its jobs, at the rate
+    of its provider (``rate_limits`` by SMTP host, else ``default_rate``;
+    None means unlimited). Job progress is kept in memory for the last
+    ``max_jobs`` jobs; a new job only pushes out finished ones, so a running
+    job's progress stays visible however many jobs are started.
+    """
+
+    def __init__(self, smtp_pool, rate_limits=None, default_rate=1.0, concurrency=2, max_jobs=100):
+        self.smtp_pool = smtp_pool
+        self.rate_limits = DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits
+        self.default_rate = default_rate
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self._limiters = {}  # (SMTP host, sending address) -> RateLimiter
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _limiter_for(self, email_address):
+        host = smtp_server_for(email_address)
+        key = (host, email_address.lower())
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = RateLimiter(self.rate_limits.get(host, self.default_rate))
+            return limiter
+
+    def send(self, key, email_address, password, messages, job=None):
+        """
+        Send every (to, message) from ``messages`` and wait for the batch.
+        Returns (and updates, if given) a job dict with 'sent' and 'failed'.
+        If ``messages`` raises, the batch stops there and the error is
+        recorded as the job's 'error'.
+        """
+        job = job if job is not None else {'sent': 0, 'failed': []}
+        messages = iter(messages)
+        limiter = self._limiter_for(email_address)
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if 'error' in job:
+                        return
+                    try:
+                        item = next(messages, None)
+                    except Exception as e:
+                        logger.error(f"Could not build bulk message from {email_address}: {e}", exc_info=True)
+                        job['error'] = str(e)
+                        return
+                if item is None:
+                    return
+                to, msg = item
+                limiter.acquire()
+                try:
+                    self.smtp_pool.send_message(key, msg, email_address, password)
+                except Exception as e:
+                    logger.warning(f"Bulk send from {email_address} to {to} failed: {e}")
+                    with lock:
+                        job['failed'].append({'to': to, 'error': str(e)})
+                else:
+                    with lock:
+                        job['sent'] += 1
+
+        threads = [threading.Thread(target=worker, name=f"bulk-send-{i}", daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return job
+
+    def start_job(self, key, email_address, password, messages, total):
+        """Run send() on a background thread and return the job id"""
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': 'running', 'total': total, 'sent': 0, 'failed': [],
+               'started_at': time.time(), 'finished_at': None}
+        with self._lock:
+            self._jobs[job_id] = job
+            self._forget_finished_jobs()
+
+        def run():
+            try:
+                self.send(key, email_address, password, messages, job)
+            except Exception as e:
+                logger.error(f"Bulk send job {job_id} failed: {e}", exc_info=True)
+                job['error'] = str(e)
+            job['finished_at'] = time.time()
+            job['status'] = 'failed' if 'error' in job else 'done'
+            elapsed = job['finished_at'] - job['started_at']
+            logger.info(f"Bulk send job {job_id}: {job['sent']}/{total} sent in {elapsed:.1f}s")
+
+        threading.Thread(target=run, name=f"bulk-job-{job_id[:8]}", daemon=True).start()
+        return job_id
+
+    def _forget_finished_jobs(self):
+        # Caller holds the lock. Oldest first, skipping jobs that are still running
+        excess = len(self._jobs) - self.max_jobs
+        if excess > 0:
+            finished = [job_id for job_id, job in self._jobs.items() if job['status'] != 'running']
+            for job_id in finished[:excess]:
+                del self._jobs[job_id]
+
+    def job_status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else dict(job, failed=list(job['failed']))
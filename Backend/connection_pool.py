@@ -0,0 +1,169 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection for a key becomes available in time"""
+
+
+class KeyedConnectionPool:
+    """
+    Pool of authenticated connections, keyed by account.
+
+    Subclasses implement ``_connect(key, *args)``, ``_check(conn)`` (a cheap
+    round trip such as NOOP), ``_close(conn)`` and ``disconnect_errors``.
+    At most ``max_per_key`` connections exist per key; idle connections are
+    health-checked before reuse once they have been idle for
+    ``keepalive_interval`` seconds, and a background reaper closes any idle
+    longer than ``idle_timeout``.
+    """
+
+    disconnect_errors = (OSError,)
+    name = "connection"
+
+    def __init__(self, max_per_key=2, idle_timeout=300, keepalive_interval=60, acquire_timeout=30):
+        self.max_per_key = max_per_key
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle = {}   # key -> [(conn, last_used), ...], most recently used last
+        self._counts = {}  # key -> open connections (idle + checked out)
+        self._reaper = threading.Thread(target=self._reap_loop, name=f"{self.name}-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _connect(self, key, *args):
+        raise NotImplementedError
+
+    def _check(self, conn):
+        raise NotImplementedError
+
+    def _close(self, conn):
+        raise NotImplementedError
+
+    def _safe_close(self, conn):
+        try:
+            self._close(conn)
+        except Exception as e:
+            logger.debug(f"Error closing {self.name} connection: {e}")
+
+    def acquire(self, key, *args):
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                idle = self._idle.get(key)
+                if idle:
+                    conn, last_used = idle.pop()
+                elif self._counts.get(key, 0) < self.max_per_key:
+                    self._counts[key] = self._counts.get(key, 0) + 1
+                    conn = None
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f"No {self.name} connection available for {key}")
+                    self._cond.wait(remaining)
+                    continue
+
+            if conn is None:
+                try:
+                    conn = self._connect(key, *args)
+                except Exception:
+                    self._forget(key)
+                    raise
+                logger.info(f"Opened new {self.name} connection for {key}")
+                return conn
+
+            if time.monotonic() - last_used < self.keepalive_interval:
+                return conn
+            try:
+                self._check(conn)
+                return conn
+            except Exception as e:
+                logger.info(f"Dropping stale {self.name} connection for {key}: {e}")
+                self._safe_close(conn)
+                self._forget(key)
+
+    def release(self, key, conn):
+        """Return a healthy connection to the pool"""
+        with self._cond:
+            self._idle.setdefault(key, []).append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, key, conn):
+        """Close a broken connection instead of returning it"""
+        self._safe_close(conn)
+        self._forget(key)
+
+    def _forget(self, key):
+        with self._cond:
+            self._counts[key] = self._counts.get(key, 1) - 1
+            if self._counts[key] <= 0:
+                self._counts.pop(key, None)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, key, *args):
+        conn = self.acquire(key, *args)
+        try:
+            yield conn
+        except self.disconnect_errors:
+            # The session is dead; don't hand it to the next caller
+            self.discard(key, conn)
+            raise
+        except Exception:
+            # An error reply (refused recipient, NO to a command) leaves the session usable
+            self.release(key, conn)
+            raise
+        except BaseException:
+            # Interrupted, possibly mid-command
+            self.discard(key, conn)
+            raise
+        else:
+            self.release(key, conn)
+
+    def run(self, key, fn, *args, retries=1):
+        """
+        Call ``fn(conn)`` with a pooled connection. If the connection turns out
+        to be dead (server closed it, network dropped) the call is retried on
+        a fresh connection up to ``retries`` times.
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.connection(key, *args) as conn:
+                    return fn(conn)
+            except self.disconnect_errors as e:
+                if attempt == retries:
+                    raise
+                logger.warning(f"{self.name} connection for {key} lost ({e}), reconnecting")
+
+    def evict(self, key):
+        """Close every idle connection for a key, e.g. after a password change"""
+        with self._cond:
+            idle = self._idle.pop(key, [])
+        for conn, _ in idle:
+            self.discard(key, conn)
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(min(self.idle_timeout, self.keepalive_interval) / 2)
+            self.reap()
+
+    def reap(self):
+        """Close connections that have been idle longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._cond:
+            for key, idle in list(self._idle.items()):
+                keep = [(conn, used) for conn, used in idle if used >= cutoff]
+                expired.extend((key, conn) for conn, used in idle if used < cutoff)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for key, conn in expired:
+            logger.info(f"Closing idle {self.name} connection for {key}")
+            self.discard(key, conn)
@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from face_pipeline import analyze_batch
+from face_workers import FaceJobTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class FaceBatcher:
+    """
+    Micro-batching front end for the face worker pool.
+
+    Concurrent authentication requests are collected into one analyze_batch()
+    job so dlib encodes all their faces in a single call, and the 1:1 matches
+    against the gallery are computed together with pair_distances(). Batching
+    is adaptive: while a worker is idle a request is dispatched straight away
+    (no added latency at low load); only when every worker is busy do new
+    requests wait up to ``window`` seconds, or until ``max_batch`` have
+    queued, to ride along in the next batch.
+    """
+
+    def __init__(self, pool, gallery, detection_options, window=0.01, max_batch=8):
+        self.pool = pool
+        self.gallery = gallery
+        self.detection_options = detection_options
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="face-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def _capacity(self):
+        return max(1, self.pool.workers)
+
+    def submit(self, data, username=None, max_faces=None):
+        """
+        Queue one upload and return a Future for its analysis result. When
+        ``username`` is given the result also carries ``distance`` to that
+        user's registered face (None if the user is not registered).
+        """
+        future = Future()
+        self._queue.put((data, username, max_faces, future))
+        return future
+
+    def run(self, data, username=None, max_faces=None):
+        """Submit and wait up to the pool timeout"""
+        future = self.submit(data, username, max_faces)
+        try:
+            return future.result(timeout=self.pool.timeout)
+        except FutureTimeoutError:
+            raise FaceJobTimeoutError(f"Face processing took longer than {self.pool.timeout}s")
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            with self._idle:
+                if self._in_flight < self._capacity:
+                    break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._collect()
+            with self._idle:
+                self._in_flight += 1
+            try:
+                job = self.pool.submit(analyze_batch, [(data, max_faces) for data, _, max_faces, _ in batch],
+                                       self.detection_options)
+            except Exception as e:
+                self._finish(batch, error=e)
+                continue
+            job.add_done_callback(lambda done, batch=batch: self._finish(batch, job=done))
+
+    def _finish(self, batch, job=None, error=None):
+        with self._idle:
+            self._in_flight -= 1
+        try:
+            if error is None:
+                error = job.exception()
+            if error is not None:
+                for _, _, _, future in batch:
+                    future.set_exception(error)
+                return
+
+            results = job.result()
+            # Vectorised 1:1 matching for every request in the batch that named a user
+            pairs = [(i, item[1], result['encodings'][0]) for i, (item, result) in enumerate(zip(batch, results))
+                     if item[1] is not None and isinstance(result, dict) and result['encodings']]
+            if pairs:
+                dists = self.gallery.pair_distances([p[1] for p in pairs], [p[2] for p in pairs])
+                for (i, _, _), dist in zip(pairs, dists):
+                    results[i]['distance'] = None if np.isnan(dist) else float(dist)
+
+            for (_, _, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            if len(batch) > 1:
+                logger.info(f"Processed batch of {len(batch)} face requests")
+        except Exception as e:
+            logger.error(f"Error finishing face batch: {e}", exc_info=True)
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
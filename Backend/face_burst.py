@@ -0,0 +1,41 @@
+import logging
+
+from face_pipeline import ImageDecodeError
+
+logger = logging.getLogger(__name__)
+
+
+def match_burst(frames, match_frame, max_frames, confident_tolerance):
+    """
+    Authenticate from a burst of frames (file-like uploads, in capture
+    order). Only the first ``max_frames`` are looked at; each is read and
+    passed to ``match_frame(data) -> (body, distance)`` in turn, and the
+    first frame whose distance is within ``confident_tolerance`` wins
+    straight away without reading the rest. Otherwise the frame closest to
+    the registered face wins (a frame with no usable face only if no frame
+    had one). Unreadable frames are skipped.
+
+    Returns the winning body with ``frames_processed`` set. Raises
+    ImageDecodeError if no frame could be read at all.
+    """
+    frames = frames[:max_frames]
+    best_body, best_distance = None, None
+    for frame_number, frame in enumerate(frames, start=1):
+        try:
+            body, distance = match_frame(frame.read())
+        except ImageDecodeError as e:
+            logger.warning(f"Skipping unreadable frame {frame_number}: {str(e)}")
+            continue
+
+        if distance is not None and distance <= confident_tolerance:
+            logger.info(f"Confident match on frame {frame_number} of {len(frames)}")
+            body["frames_processed"] = frame_number
+            return body
+
+        if best_body is None or (distance is not None and (best_distance is None or distance < best_distance)):
+            best_body, best_distance = body, distance
+
+    if best_body is None:
+        raise ImageDecodeError("No readable image files provided")
+    best_body["frames_processed"] = len(frames)
+    return best_body
@@ -0,0 +1,224 @@
+import copy
+import logging
+import threading
+
+import numpy as np
+
+from face_index import ExactIndex
+
+logger = logging.getLogger(__name__)
+
+# Length of the encodings produced by face_recognition / dlib
+ENCODING_SIZE = 128
+
+
+class FaceGallery:
+    """
+    In-memory gallery of registered face encodings.
+
+    All encodings live in one contiguous (N, 128) NumPy matrix with a parallel
+    array of usernames, so "which registered face is closest to this one" is a
+    single batched distance computation instead of one compare_faces() call
+    per user. The gallery also behaves like the old {username: encoding} dict
+    (``in``, ``[]``, ``len()``, ``keys()``) so existing lookups keep working.
+
+    An optional approximate index (see face_index.py) narrows each search to
+    a set of candidate rows; without one every search is exact. Once the
+    gallery has grown enough for the index to be (re)trained, a new index is
+    trained on a snapshot in a background thread while searches keep using
+    the current one, then swapped in.
+    """
+
+    def __init__(self, capacity=64, index=None):
+        self._lock = threading.RLock()
+        self._index = index or ExactIndex()
+        self._matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float64)
+        self._sq_norms = np.empty(capacity, dtype=np.float64)
+        self._usernames = np.empty(capacity, dtype=object)
+        self._rows = {}  # username -> row in the matrix
+        self._size = 0
+        # While an index is being trained: the index updates made since its snapshot
+        self._pending_updates = None
+
+    @classmethod
+    def from_dict(cls, faces, index=None):
+        """Build a gallery from a {username: encoding} mapping"""
+        gallery = cls(capacity=max(64, len(faces)), index=index)
+        size = len(faces)
+        if size:
+            gallery._matrix[:size] = np.asarray(list(faces.values()), dtype=np.float64)
+            gallery._sq_norms[:size] = np.einsum('ij,ij->i', gallery._matrix[:size], gallery._matrix[:size])
+            gallery._usernames[:size] = list(faces.keys())
+            gallery._rows = {username: row for row, username in enumerate(faces.keys())}
+            gallery._size = size
+        gallery.train_index()
+        return gallery
+
+    def train_index(self, background=False):
+        """
+        (Re)build the approximate index if the gallery has grown enough. The
+        k-means runs on a snapshot of the matrix without holding the gallery
+        lock; with ``background`` it runs in a new thread, which is returned
+        (None if no training was needed or one is already running).
+        """
+        with self._lock:
+            if self._pending_updates is not None or not self._index.needs_training(self._size):
+                return None
+            index = copy.copy(self._index)
+            index.reset()
+            snapshot = self._matrix[:self._size].copy()
+            self._pending_updates = []
+        if not background:
+            self._train(index, snapshot)
+            return None
+        thread = threading.Thread(target=self._train, args=(index, snapshot), name="face-index-train", daemon=True)
+        thread.start()
+        return thread
+
+    def _train(self, index, snapshot):
+        try:
+            index.train(snapshot)
+        except Exception as e:
+            logger.error(f"Error training face index: {e}", exc_info=True)
+            with self._lock:
+                self._pending_updates = None
+            return
+        with self._lock:
+            # Catch up with the faces added, replaced and removed during training
+            for method, args in self._pending_updates:
+                getattr(index, method)(*args)
+            self._index = index
+            self._pending_updates = None
+
+    def _update_index(self, method, *args):
+        getattr(self._index, method)(*args)
+        if self._pending_updates is not None:
+            self._pending_updates.append((method, args))
+
+    def _grow(self):
+        capacity = max(64, len(self._matrix) * 2)
+        matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float64)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.empty(capacity, dtype=np.float64)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        usernames = np.empty(capacity, dtype=object)
+        usernames[:self._size] = self._usernames[:self._size]
+        self._matrix = matrix
+        self._sq_norms = sq_norms
+        self._usernames = usernames
+
+    def add(self, username, encoding, train=True):
+        """Add or replace the encoding registered for a username"""
+        encoding = np.asarray(encoding, dtype=np.float64).reshape(ENCODING_SIZE)
+        with self._lock:
+            row = self._rows.get(username)
+            if row is None:
+                if self._size == len(self._matrix):
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._rows[username] = row
+                self._usernames[row] = username
+            self._matrix[row] = encoding
+            self._sq_norms[row] = encoding @ encoding
+            self._update_index('add', row, encoding)
+        if train:
+            self.train_index(background=True)
+
+    def remove(self, username):
+        """Remove a username from the gallery, returning True if it was present"""
+        with self._lock:
+            row = self._rows.pop(username, None)
+            if row is None:
+                return False
+            # Move the last row into the hole to keep the matrix dense
+            last = self._size - 1
+            self._update_index('remove', row)
+            if row != last:
+                self._update_index('move', last, row)
+                moved = self._usernames[last]
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._usernames[row] = moved
+                self._rows[moved] = row
+            self._usernames[last] = None
+            self._size = last
+            return True
+
+    def distances(self, encoding):
+        """Euclidean distance from an encoding to every registered face, in row order"""
+        encoding = np.asarray(encoding, dtype=np.float64).reshape(ENCODING_SIZE)
+        with self._lock:
+            # |a - b|^2 = |a|^2 - 2a.b + |b|^2, so the whole gallery is one matrix-vector product
+            sq = self._sq_norms[:self._size] - 2.0 * (self._matrix[:self._size] @ encoding)
+        sq += encoding @ encoding
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def pair_distances(self, usernames, encodings):
+        """
+        Distance between each encoding and the face registered for the
+        matching username (NaN where the username is not registered), as one
+        vectorised computation for a batch of 1:1 verifications.
+        """
+        probes = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        dists = np.full(len(probes), np.nan)
+        with self._lock:
+            rows = [self._rows.get(username) for username in usernames]
+            known = [i for i, row in enumerate(rows) if row is not None]
+            if known:
+                targets = self._matrix[[rows[i] for i in known]]
+                dists[known] = np.linalg.norm(targets - probes[known], axis=1)
+        return dists
+
+    def search(self, encoding, k=1, exclude=None):
+        """
+        Return up to ``k`` (username, distance) pairs for the registered faces
+        closest to ``encoding``, nearest first. ``exclude`` skips one username,
+        e.g. the user who is re-registering.
+        """
+        encoding = np.asarray(encoding, dtype=np.float64).reshape(ENCODING_SIZE)
+        with self._lock:
+            rows = self._index.candidates(encoding, self._size)
+            if rows is None:
+                dists = self.distances(encoding)
+                rows = np.arange(self._size)
+            else:
+                sq = self._sq_norms[rows] - 2.0 * (self._matrix[rows] @ encoding) + encoding @ encoding
+                dists = np.sqrt(np.maximum(sq, 0.0))
+            skip = self._rows.get(exclude) if exclude is not None else None
+            if skip is not None:
+                dists[rows == skip] = np.inf
+            k = min(k, len(dists))
+            if k == 0:
+                return []
+            best = np.argpartition(dists, k - 1)[:k]
+            best = best[np.argsort(dists[best])]
+            return [(self._usernames[rows[i]], float(dists[i])) for i in best if np.isfinite(dists[i])]
+
+    def nearest(self, encoding, exclude=None):
+        """
+        Return (username, distance) of the closest registered face, or
+        (None, None) if the gallery is empty.
+        """
+        results = self.search(encoding, k=1, exclude=exclude)
+        return results[0] if results else (None, None)
+
+    def to_dict(self):
+        """Return a {username: encoding} dict copy of the gallery"""
+        with self._lock:
+            return {username: self._matrix[row].copy() for username, row in self._rows.items()}
+
+    def keys(self):
+        with self._lock:
+            return list(self._rows.keys())
+
+    def __contains__(self, username):
+        return username in self._rows
+
+    def __getitem__(self, username):
+        with self._lock:
+            return self._matrix[self._rows[username]].copy()
+
+    def __len__(self):
+        return self._size
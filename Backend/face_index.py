@@ -0,0 +1,154 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ExactIndex:
+    """Brute-force search: every registered face is a candidate"""
+
+    def reset(self):
+        pass
+
+    def needs_training(self, size):
+        return False
+
+    def train(self, matrix):
+        pass
+
+    def add(self, row, encoding):
+        pass
+
+    def remove(self, row):
+        pass
+
+    def move(self, old_row, new_row):
+        pass
+
+    def candidates(self, encoding, size):
+        """Rows to compare against exactly, or None for all of them"""
+        return None
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index.
+
+    Encodings are clustered into ``nlist`` cells with k-means; a query only
+    looks at the rows in its ``nprobe`` closest cells, and the gallery then
+    re-ranks those candidates with exact distances. Raising ``nprobe`` trades
+    latency for recall. Below ``min_train_size`` faces the index is left
+    untrained and every search falls back to an exact scan.
+    """
+
+    def __init__(self, nlist=256, nprobe=8, min_train_size=20000, kmeans_iters=10,
+                 sample_per_list=64, retrain_growth=2.0, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iters = kmeans_iters
+        self.sample_per_list = sample_per_list
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self.centroids = None
+        self._trained_size = 0
+        self._lists = []
+        self._list_arrays = []
+        self._assignment = {}  # row -> list id
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def needs_training(self, size):
+        if size < self.min_train_size:
+            return False
+        return not self.is_trained or size >= self._trained_size * self.retrain_growth
+
+    def _assign(self, vectors, chunk=65536):
+        """Index of the closest centroid for each vector"""
+        c_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        out = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk]
+            # |c|^2 - 2v.c is enough to rank centroids for a fixed v
+            out[start:start + chunk] = np.argmin(c_sq - 2.0 * (block @ self.centroids.T), axis=1)
+        return out
+
+    def train(self, matrix):
+        """Cluster the gallery matrix and rebuild every inverted list"""
+        size = len(matrix)
+        nlist = max(1, min(self.nlist, size))
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(size, nlist * self.sample_per_list)
+        sample = matrix[rng.choice(size, sample_size, replace=False)]
+
+        self.centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            labels = self._assign(sample)
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            filled = counts > 0
+            self.centroids[filled] = sums[filled] / counts[filled, None]
+
+        labels = self._assign(matrix)
+        self._lists = [set() for _ in range(nlist)]
+        self._assignment = {}
+        for row, label in enumerate(labels.tolist()):
+            self._lists[label].add(row)
+            self._assignment[row] = label
+        self._list_arrays = [None] * nlist
+        self._trained_size = size
+        logger.info(f"Trained IVF index with {nlist} lists over {size} faces")
+
+    def add(self, row, encoding):
+        if not self.is_trained:
+            return
+        self.remove(row)
+        label = int(self._assign(encoding[None, :])[0])
+        self._lists[label].add(row)
+        self._assignment[row] = label
+        self._list_arrays[label] = None
+
+    def remove(self, row):
+        label = self._assignment.pop(row, None)
+        if label is not None:
+            self._lists[label].discard(row)
+            self._list_arrays[label] = None
+
+    def move(self, old_row, new_row):
+        label = self._assignment.pop(old_row, None)
+        if label is not None:
+            self._lists[label].discard(old_row)
+            self._lists[label].add(new_row)
+            self._assignment[new_row] = label
+            self._list_arrays[label] = None
+
+    def _list_rows(self, label):
+        rows = self._list_arrays[label]
+        if rows is None:
+            rows = np.fromiter(self._lists[label], dtype=np.int64, count=len(self._lists[label]))
+            self._list_arrays[label] = rows
+        return rows
+
+    def candidates(self, encoding, size):
+        if not self.is_trained:
+            return None
+        nprobe = min(self.nprobe, len(self.centroids))
+        scores = np.einsum('ij,ij->i', self.centroids, self.centroids) - 2.0 * (self.centroids @ encoding)
+        probes = np.argpartition(scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._list_rows(label) for label in probes])
+
+
+def create_index(kind, **options):
+    """Build a face index by name ('exact' or 'ivf')"""
+    if kind == 'exact':
+        return ExactIndex()
+    if kind == 'ivf':
+        return IVFIndex(**options)
+    raise ValueError(f"Unknown face index type: {kind}")
@@ -0,0 +1,144 @@
+import cv2
+import numpy as np
+import face_recognition
+
+
+class ImageDecodeError(ValueError):
+    """Raised when an upload is not a readable image"""
+
+
+def decode_image(data):
+    """
+    Decode uploaded image bytes straight into an RGB uint8 array, the same
+    layout face_recognition.load_image_file() returns, without touching disk.
+    Raises ImageDecodeError if the bytes are not a readable image.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if buffer.size == 0:
+        raise ImageDecodeError("Empty image upload")
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ImageDecodeError("Could not decode image")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def center_roi(image, fraction):
+    """
+    Crop the centered region covering ``fraction`` of the width and height.
+    Returns (crop, (top, left)) where (top, left) is the crop's offset.
+    """
+    if not fraction or fraction >= 1:
+        return image, (0, 0)
+    height, width = image.shape[:2]
+    crop_h, crop_w = int(height * fraction), int(width * fraction)
+    top, left = (height - crop_h) // 2, (width - crop_w) // 2
+    return image[top:top + crop_h, left:left + crop_w], (top, left)
+
+
+def detect_faces(image, detection_width=None, roi_fraction=None, upsample=1, model='hog'):
+    """
+    Find faces on a downscaled copy of the frame and return their locations
+    as (top, right, bottom, left) boxes in full-resolution coordinates, ready
+    for face_recognition.face_encodings(image, locations).
+
+    ``detection_width`` is the width the (optionally ROI-cropped) frame is
+    shrunk to before running the detector; 0 or None detects at full size.
+    ``roi_fraction`` restricts detection to a centered crop of the frame.
+    """
+    crop, (offset_top, offset_left) = center_roi(image, roi_fraction)
+    height, width = crop.shape[:2]
+
+    scale = 1.0
+    if detection_width and width > detection_width:
+        scale = detection_width / width
+        crop = cv2.resize(crop, (detection_width, max(1, round(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+
+    locations = face_recognition.face_locations(crop, number_of_times_to_upsample=upsample, model=model)
+
+    full_height, full_width = image.shape[:2]
+    mapped = []
+    for top, right, bottom, left in locations:
+        mapped.append((
+            max(0, min(full_height, round(top / scale) + offset_top)),
+            max(0, min(full_width, round(right / scale) + offset_left)),
+            max(0, min(full_height, round(bottom / scale) + offset_top)),
+            max(0, min(full_width, round(left / scale) + offset_left)),
+        ))
+    return mapped
+
+
+def analyze_image(data, detection_options=None, max_faces=None):
+    """
+    Full pipeline for one upload: decode, detect, encode. Returns a dict with
+    the image ``shape``, the face ``locations`` and their ``encodings``
+    (skipped when more than ``max_faces`` faces are found). Only takes and
+    returns plain, picklable values so it can run in a worker process.
+    """
+    image = decode_image(data)
+    locations = detect_faces(image, **(detection_options or {}))
+    encodings = []
+    if locations and (max_faces is None or len(locations) <= max_faces):
+        encodings = face_recognition.face_encodings(image, locations)
+    return {'shape': image.shape, 'locations': locations, 'encodings': encodings}
+
+
+def _encode_batch(images, locations_per_image):
+    """
+    Encode every face in several images with one call into dlib's batched
+    face descriptor, falling back to per-image encoding if the installed dlib
+    has no batch overload. Landmarks come from the same 5-point predictor
+    face_encodings() uses, so the descriptors match it face for face.
+    """
+    import dlib
+    from face_recognition import api
+
+    batch_images, batch_faces, owners = [], [], []
+    for i, (image, locations) in enumerate(zip(images, locations_per_image)):
+        if not locations:
+            continue
+        detections = dlib.full_object_detections()
+        for top, right, bottom, left in locations:
+            detections.append(api.pose_predictor_5_point(image, dlib.rectangle(left, top, right, bottom)))
+        batch_images.append(image)
+        batch_faces.append(detections)
+        owners.append(i)
+
+    encodings = [[] for _ in images]
+    if not batch_images:
+        return encodings
+    try:
+        descriptors = api.face_encoder.compute_face_descriptor(batch_images, batch_faces, 1)
+    except TypeError:
+        for i in owners:
+            encodings[i] = face_recognition.face_encodings(images[i], locations_per_image[i])
+        return encodings
+    for i, image_descriptors in zip(owners, descriptors):
+        encodings[i] = [np.array(d) for d in image_descriptors]
+    return encodings
+
+
+def analyze_batch(items, detection_options=None):
+    """
+    Batched analyze_image(): ``items`` is a list of (data, max_faces) pairs.
+    Detection runs per image, then all faces are encoded in one batch.
+    Returns one result dict per item, or the ImageDecodeError for uploads
+    that could not be decoded.
+    """
+    results, images, locations_per_image, slots = [], [], [], []
+    for data, max_faces in items:
+        try:
+            image = decode_image(data)
+        except ImageDecodeError as e:
+            results.append(e)
+            continue
+        locations = detect_faces(image, **(detection_options or {}))
+        results.append({'shape': image.shape, 'locations': locations, 'encodings': []})
+        if locations and (max_faces is None or len(locations) <= max_faces):
+            images.append(image)
+            locations_per_image.append(locations)
+            slots.append(len(results) - 1)
+
+    for slot, encodings in zip(slots, _encode_batch(images, locations_per_image)):
+        results[slot]['encodings'] = encodings
+    return results
@@ -0,0 +1,182 @@
+import os
+import json
+import threading
+import logging
+
+import numpy as np
+
+from face_gallery import ENCODING_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class FaceEncodingStore:
+    """
+    Append-only on-disk store for face encodings.
+
+    Encodings are fixed-width float32 records in ``<prefix>.<generation>.f32``,
+    read back with np.memmap so startup does not copy or unpickle anything.
+    ``<prefix>.idx`` is a JSON-lines log mapping usernames to record numbers:
+
+        {"data": "face_encodings.0.f32"}     first line, names the data file
+        {"add": "alice", "row": 0}           alice's encoding is record 0
+        {"del": "alice"}                     tombstone
+
+    Registering a face appends one record and one log line, so the cost does
+    not depend on how many users are enrolled. A record is written and synced
+    before the log line that points at it, and torn records or log lines left
+    by a crash are ignored on load. Compaction writes a new generation of both
+    files and switches over with a single os.replace() of the log.
+    """
+
+    def __init__(self, prefix, compact_min_dead=1000, compact_ratio=1.0):
+        self.prefix = prefix
+        self.index_path = f"{prefix}.idx"
+        self.compact_min_dead = compact_min_dead
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._rows = {}  # username -> record number
+        self._records = 0
+        self._generation = 0
+        self._data_path = None
+        self._data_file = None
+        self._index_file = None
+        self._open()
+
+    @property
+    def record_size(self):
+        return ENCODING_SIZE * np.dtype(np.float32).itemsize
+
+    def _data_name(self, generation):
+        return f"{os.path.basename(self.prefix)}.{generation}.f32"
+
+    def _open(self):
+        directory = os.path.dirname(self.index_path) or '.'
+        if not os.path.exists(self.index_path):
+            self._write_index(self.index_path, self._data_name(0), {})
+        self._rows = {}
+        data_name = None
+        valid_length = 0
+        with open(self.index_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete line")
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-append
+                    logger.warning(f"Ignoring unreadable line in {self.index_path}")
+                    break
+                valid_length += len(line)
+                if 'data' in entry:
+                    data_name = entry['data']
+                elif 'add' in entry:
+                    self._rows[entry['add']] = entry['row']
+                elif 'del' in entry:
+                    self._rows.pop(entry['del'], None)
+
+        self._data_path = os.path.join(directory, data_name)
+        self._generation = int(data_name.rsplit('.', 2)[-2])
+        if not os.path.exists(self._data_path):
+            open(self._data_path, 'wb').close()
+        # A partially written trailing record is not counted
+        self._records = os.path.getsize(self._data_path) // self.record_size
+        self._rows = {u: r for u, r in self._rows.items() if r < self._records}
+        self._data_file = open(self._data_path, 'r+b')
+        self._data_file.seek(self._records * self.record_size)
+        self._data_file.truncate()
+        self._index_file = open(self.index_path, 'ab')
+        self._index_file.truncate(valid_length)
+
+    def _write_index(self, path, data_name, rows):
+        with open(path, 'wb') as f:
+            f.write(json.dumps({'data': data_name}).encode() + b'\n')
+            for username, row in rows.items():
+                f.write(json.dumps({'add': username, 'row': row}).encode() + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append_index(self, entry):
+        self._index_file.write(json.dumps(entry).encode() + b'\n')
+        self._index_file.flush()
+        os.fsync(self._index_file.fileno())
+
+    def _memmap(self):
+        if self._records == 0:
+            return np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        return np.memmap(self._data_path, dtype=np.float32, mode='r',
+                         shape=(self._records, ENCODING_SIZE))
+
+    def load(self):
+        """Return a {username: encoding} mapping of read-only memmap rows"""
+        with self._lock:
+            matrix = self._memmap()
+            return {username: matrix[row] for username, row in self._rows.items()}
+
+    def append(self, username, encoding):
+        """Store (or replace) the encoding for a username"""
+        record = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self._lock:
+            row = self._records
+            self._data_file.write(record.tobytes())
+            self._data_file.flush()
+            os.fsync(self._data_file.fileno())
+            self._records += 1
+            self._append_index({'add': username, 'row': row})
+            self._rows[username] = row
+            self._maybe_compact()
+
+    def delete(self, username):
+        """Tombstone a username, returning True if it was stored"""
+        with self._lock:
+            if username not in self._rows:
+                return False
+            self._append_index({'del': username})
+            del self._rows[username]
+            self._maybe_compact()
+            return True
+
+    @property
+    def dead_records(self):
+        return self._records - len(self._rows)
+
+    def _maybe_compact(self):
+        dead = self.dead_records
+        if dead >= self.compact_min_dead and dead >= len(self._rows) * self.compact_ratio:
+            self._compact()
+
+    def compact(self):
+        """Rewrite the store without replaced or deleted records"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        old_data_path = self._data_path
+        generation = self._generation + 1
+        data_name = self._data_name(generation)
+        data_path = os.path.join(os.path.dirname(self.index_path) or '.', data_name)
+
+        matrix = self._memmap()
+        rows = {}
+        with open(data_path, 'wb') as f:
+            for new_row, (username, row) in enumerate(self._rows.items()):
+                f.write(matrix[row].tobytes())
+                rows[username] = new_row
+            f.flush()
+            os.fsync(f.fileno())
+        del matrix
+
+        # Replacing the log is the commit point; until then the old generation is intact
+        self._write_index(self.index_path + '.tmp', data_name, rows)
+        self._data_file.close()
+        self._index_file.close()
+        os.replace(self.index_path + '.tmp', self.index_path)
+        os.remove(old_data_path)
+        logger.info(f"Compacted face store: {self._records} -> {len(rows)} records")
+        self._open()
+
+    def __contains__(self, username):
+        return username in self._rows
+
+    def __len__(self):
+        return len(self._rows)
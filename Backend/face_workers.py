@@ -0,0 +1,146 @@
+import threading
+import time
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the face worker pool already has its maximum number of jobs queued"""
+
+
+class FaceJobTimeoutError(Exception):
+    """Raised when a face job does not finish within the pool's timeout"""
+
+
+def _init_worker():
+    """Load the dlib models once per worker process instead of once per job"""
+    import face_recognition
+    # A detection pass on a blank frame forces every lazy initialisation
+    face_recognition.face_locations(np.zeros((64, 64, 3), dtype=np.uint8))
+
+
+class FaceWorkerPool:
+    """
+    Process pool for face detection and encoding.
+
+    HOG detection and dlib encoding are CPU-bound and hold the GIL for long
+    stretches, so running them on request threads serialises logins. Jobs are
+    sent to ``workers`` processes with the models preloaded; at most
+    ``workers + queue_depth`` jobs may be in flight, beyond which ``run``
+    raises PoolSaturatedError immediately so the caller can answer 503
+    instead of queueing without bound. With ``workers=0`` jobs run inline on
+    the calling thread, which is also the only mode on platforms without fork.
+
+    Forking a process that already runs threads can leave the children stuck
+    on a lock (logging, BLAS) some thread held at fork time, so every worker
+    is forked by start(), which must run before the server starts any
+    thread. Jobs run inline until then, and after a worker crash broke the
+    pool rather than forking again from a threaded process; status() then
+    reports the pool as degraded so a health check can get the server
+    restarted.
+    """
+
+    def __init__(self, workers, queue_depth, timeout):
+        if workers and not self.fork_available():
+            logger.warning("fork is not available on this platform, running face jobs inline")
+            workers = 0
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_depth) if workers else None
+        self._lock = threading.Lock()
+        self._executor = None
+        self.broken_at = None  # time.time() when a worker crash broke the pool
+
+    @staticmethod
+    def fork_available():
+        return 'fork' in multiprocessing.get_all_start_methods()
+
+    def start(self):
+        """Fork every worker process now; call before any other thread starts"""
+        with self._lock:
+            if not self.workers or self._executor is not None:
+                return self
+            # fork: a spawned worker would re-import app.py (as __mp_main__)
+            # and re-open every database
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker,
+            )
+            # The first job forks all workers, before the executor starts its own threads
+            self._executor.submit(int)
+        logger.info(f"Started face worker pool with {self.workers} processes")
+        return self
+
+    @staticmethod
+    def _run_inline(fn, args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _discard_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.broken_at = time.time()
+                logger.error("Face worker pool broke, running face jobs inline until the server restarts")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args):
+        """Queue a job and return its future, or raise PoolSaturatedError"""
+        executor = self._executor
+        if executor is None:
+            return self._run_inline(fn, args)
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturatedError("Face processing is at capacity")
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard_executor(executor)
+            return self._run_inline(fn, args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is only freed when the job actually finishes, even after a timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        """Run a job and wait up to the pool timeout for its result"""
+        if self._executor is None:
+            return fn(*args)
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise FaceJobTimeoutError(f"Face processing took longer than {self.timeout}s")
+
+    def status(self):
+        """
+        How face jobs run: {'mode': 'processes' or 'inline', 'workers',
+        'degraded', 'broken_at'}. ``degraded`` means a crash broke the pool
+        and every job now runs inline on a request thread.
+        """
+        return {
+            'mode': 'processes' if self._executor is not None else 'inline',
+            'workers': self.workers,
+            'degraded': self.broken_at is not None,
+            'broken_at': self.broken_at,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
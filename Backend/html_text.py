@@ -0,0 +1,194 @@
+import re
+from html import unescape
+
+# Elements whose content is never spoken
+SKIPPED_TAGS = {'head', 'title', 'script', 'style', 'noscript', 'template', 'svg', 'object'}
+# Elements whose content is raw text up to the closing tag, not markup
+RAW_TEXT_TAGS = {'script', 'style'}
+# Elements that start a new paragraph
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'dd', 'div', 'dl', 'dt', 'fieldset', 'figcaption',
+    'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main',
+    'nav', 'ol', 'p', 'pre', 'section', 'table', 'tr', 'ul',
+}
+
+# One text run, comment, tag or declaration; a '<' that starts none of them is text
+_TOKEN = re.compile(r"""
+    ([^<]+)
+  | <!--.*?-->
+  | <(/?)([a-zA-Z][^\s/>]*)((?:[^>"']|"[^"]*"|'[^']*')*)>
+  | <!(?!--)[^>]*>
+  | <\?[^>]*>
+""", re.S | re.X)
+_TAGS_OF_INTEREST = SKIPPED_TAGS | BLOCK_TAGS | {'br', 'td', 'th'}
+_RAW_TEXT_END = {tag: re.compile(rf'</{tag}\s*>', re.I) for tag in RAW_TEXT_TAGS}
+# Longest character reference worth holding back for the next chunk ("&CounterClockwiseContourIntegral;")
+_MAX_ENTITY = 40
+
+
+class HTMLTextConverter:
+    """
+    Single-pass HTML to speech text converter.
+
+    Feed HTML incrementally with feed(); text() returns the visible text with
+    entities decoded, runs of whitespace collapsed to one space, block
+    elements separated by a blank line and <br> by a newline. Head, script,
+    style and similar content is dropped. Once ``max_chars`` characters have
+    been produced ``full`` is set and further input is ignored, so a huge
+    newsletter costs no more than its first screen.
+
+    Tags are found with one regular expression rather than html.parser, and
+    script and style bodies are skipped with a single search for their closing
+    tag. That makes it two to three times faster than html.parser, but on a
+    whole document it is still slower than the old regex strip (1.3-3x in
+    bench_html_text.py), which did not decode entities or drop CSS. The
+    speedup over the regex comes from truncation only. Input that ends in the
+    middle of a tag or a character reference is held back until the next
+    feed().
+    """
+
+    def __init__(self, max_chars=None):
+        self.max_chars = max_chars
+        self.full = False
+        self._parts = []
+        self._length = 0
+        self._pending = ''
+        self._raw_end = None  # closing-tag pattern while inside <script> or <style>
+        self._skip_depth = 0
+        self._break = ''
+        self._space = False
+
+    def feed(self, data):
+        if self.full:
+            return
+        self._pending = self._parse(self._pending + data, final=False)
+
+    def close(self):
+        if self.full:
+            return
+        self._parse(self._pending, final=True)
+        self._pending = ''
+
+    def text(self):
+        text = ''.join(self._parts)
+        return text[:self.max_chars] if self.max_chars is not None else text
+
+    def _parse(self, html, final):
+        """Consume as much of ``html`` as possible and return the unconsumed rest"""
+        pos, end = 0, len(html)
+        while pos < end and not self.full:
+            if self._raw_end is not None:
+                match = self._raw_end.search(html, pos)
+                if match is None:
+                    # Keep just enough to find a closing tag split across chunks
+                    return '' if final else html[max(pos, end - 16):]
+                self._raw_end = None
+                pos = match.end()
+                continue
+
+            for match in _TOKEN.finditer(html, pos):
+                if match.start() != pos:
+                    # Only '<' is left unmatched: text, unless a tag may continue in the next chunk
+                    if not final and self._incomplete(html, pos):
+                        return html[pos:]
+                    self._data(html[pos:match.start()])
+                text, closing, tag, attrs = match.groups()
+                pos = match.end()
+                if text is not None:
+                    if not final and pos == end:
+                        # A character reference may continue in the next chunk
+                        amp = text.rfind('&')
+                        if amp != -1 and len(text) - amp < _MAX_ENTITY and ';' not in text[amp:]:
+                            if amp and not self._skip_depth:
+                                self._data(text[:amp])
+                            return html[end - len(text) + amp:]
+                    if not self._skip_depth:
+                        self._data(text)
+                elif tag is not None:
+                    tag = tag.lower()
+                    if tag not in _TAGS_OF_INTEREST:
+                        continue
+                    if closing:
+                        self._end_tag(tag)
+                    elif not attrs.endswith('/'):
+                        self._start_tag(tag)
+                    elif tag not in SKIPPED_TAGS:
+                        # <br/>, <hr/>; a self-closing skipped tag has no content to skip
+                        self._start_tag(tag)
+                    if self._raw_end is not None:
+                        break
+                if self.full:
+                    return ''
+            else:
+                if pos < end:
+                    # Trailing '<' that starts no complete token
+                    if not final and self._incomplete(html, pos):
+                        return html[pos:]
+                    self._data(html[pos:])
+                return ''
+        return ''
+
+    @staticmethod
+    def _incomplete(html, pos):
+        return html.find('>', pos) == -1 or html.startswith('<!--', pos)
+
+    def _line_break(self, kind):
+        # Only the strongest break between two runs of text is kept
+        if len(kind) > len(self._break):
+            self._break = kind
+
+    def _start_tag(self, tag):
+        if tag in RAW_TEXT_TAGS:
+            self._raw_end = _RAW_TEXT_END[tag]
+        elif tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == 'br':
+            self._line_break('\n')
+        elif tag in BLOCK_TAGS:
+            self._line_break('\n\n')
+        elif tag in ('td', 'th'):
+            self._space = True
+
+    def _end_tag(self, tag):
+        if tag in SKIPPED_TAGS:
+            if tag not in RAW_TEXT_TAGS:
+                self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._line_break('\n\n')
+
+    def _data(self, data):
+        if self._skip_depth:
+            return
+        if '&' in data:
+            data = unescape(data)
+        words = data.split()
+        if not words:
+            if data:
+                self._space = True
+            return
+
+        if self._parts:
+            if self._break:
+                separator = self._break
+            elif self._space or data[0].isspace():
+                separator = ' '
+            else:
+                separator = ''
+        else:
+            separator = ''
+        chunk = separator + ' '.join(words)
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        self._break = ''
+        self._space = data[-1].isspace()
+
+        if self.max_chars is not None and self._length >= self.max_chars:
+            self.full = True
+
+
+def html_to_text(html, max_chars=None):
+    """Convert an HTML document (str) to plain speech text; see HTMLTextConverter"""
+    converter = HTMLTextConverter(max_chars)
+    converter.feed(html)
+    converter.close()
+    return converter.text()
@@ -0,0 +1,58 @@
+import imaplib
+import logging
+
+from connection_pool import KeyedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+def imap_server_for(email_address):
+    """Pick the IMAP server from the email domain"""
+    email_domain = email_address.split('@')[1].lower()
+    
+    if 'gmail' in email_domain:
+        return 'imap.gmail.com'
+    elif 'yahoo' in email_domain:
+        return 'imap.mail.yahoo.com'
+    elif 'outlook' in email_domain or 'hotmail' in email_domain or 'live' in email_domain:
+        return 'outlook.office365.com'
+    else:
+        # Default to Gmail
+        return 'imap.gmail.com'
+
+
+def imap_login(email_address, password):
+    """Open an IMAP4_SSL session to the account's provider and log in"""
+    imap_server = imap_server_for(email_address)
+    logger.info(f"Connecting to IMAP server {imap_server} for {email_address}")
+    mail = imaplib.IMAP4_SSL(imap_server)
+    try:
+        mail.login(email_address, password)
+    except Exception:
+        mail.shutdown()
+        raise
+    return mail
+
+
+class IMAPConnectionPool(KeyedConnectionPool):
+    """
+    Logged-in IMAP4_SSL sessions keyed by (username, email), so repeated
+    reads reuse a warm session instead of paying TLS + LOGIN every time.
+    """
+
+    disconnect_errors = (imaplib.IMAP4.abort, OSError)
+    name = "IMAP"
+
+    def _connect(self, key, email_address, password):
+        return imap_login(email_address, password)
+
+    def _check(self, mail):
+        status, _ = mail.noop()
+        if status != 'OK':
+            raise imaplib.IMAP4.abort(f"NOOP returned {status}")
+
+    def _close(self, mail):
+        try:
+            mail.logout()
+        except Exception:
+            mail.shutdown()
@@ -0,0 +1,336 @@
+"""
+Minimal local IMAP4rev1 server for tests and benchmarks.
+
+Speaks just enough plain-TCP IMAP for imaplib.IMAP4 (LOGIN, SELECT, SEARCH,
+FETCH, UID, NOOP, IDLE, LOGOUT...) over an in-memory INBOX, and counts every
+command it receives so tests can assert on round trips:
+
+    server = IMAPStandIn()
+    server.add_message(raw_bytes)
+    server.start()
+    mail = imaplib.IMAP4('127.0.0.1', server.port)
+    ...
+    server.command_counts['FETCH']
+
+make_message(i) builds a numbered test message to add, LocalIMAPPool is an
+IMAPConnectionPool that connects to a stand-in's port, and wait_for polls
+until the server reaches some state.
+"""
+import imaplib
+import re
+import socketserver
+import threading
+import time
+from collections import Counter
+from email.mime.text import MIMEText
+from email.parser import BytesHeaderParser
+
+from imap_pool import IMAPConnectionPool
+
+_FETCH_ITEM = re.compile(
+    r'BODY(?:\.PEEK)?\[[^\]]*\](?:<\d+\.\d+>)?|RFC822\.SIZE|RFC822\.HEADER|RFC822|UID|FLAGS|INTERNALDATE|MODSEQ',
+    re.I)
+
+
+def parse_sequence_set(text, largest):
+    """Expand an IMAP sequence set such as 1,5,9:* into a set of numbers"""
+    numbers = set()
+    for chunk in text.split(','):
+        if ':' in chunk:
+            low, high = chunk.split(':')
+            low = largest if low == '*' else int(low)
+            high = largest if high == '*' else int(high)
+            numbers.update(range(min(low, high), max(low, high) + 1))
+        else:
+            numbers.add(largest if chunk == '*' else int(chunk))
+    return numbers
+
+
+class _Message:
+    def __init__(self, uid, raw, flags):
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags)
+
+    @property
+    def header(self):
+        return self.raw.split(b'\r\n\r\n', 1)[0] + b'\r\n\r\n'
+
+    @property
+    def text(self):
+        parts = self.raw.split(b'\r\n\r\n', 1)
+        return parts[1] if len(parts) > 1 else b''
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+
+    def send(self, line):
+        with self.write_lock:
+            self.wfile.write(line if isinstance(line, bytes) else line.encode())
+
+    def handle(self):
+        server = self.server.standin
+        self.selected = False
+        self.send("* OK IMAP stand-in ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode().rstrip('\r\n')
+            parts = line.split(' ', 2)
+            if len(parts) < 2:
+                continue
+            tag, command = parts[0], parts[1].upper()
+            args = parts[2] if len(parts) > 2 else ''
+            uid = False
+            if command == 'UID':
+                uid = True
+                command, _, args = args.partition(' ')
+                command = command.upper()
+            with server.lock:
+                server.command_counts[command] += 1
+            handler = getattr(self, f"_cmd_{command.lower()}", None)
+            if handler is None:
+                self.send(f"{tag} BAD unknown command\r\n")
+                continue
+            if handler(tag, args, uid) is False:
+                return
+
+    def _cmd_capability(self, tag, args, uid):
+        self.send(f"* CAPABILITY {' '.join(self.server.standin.capabilities)}\r\n")
+        self.send(f"{tag} OK CAPABILITY completed\r\n")
+
+    def _cmd_login(self, tag, args, uid):
+        if args.split(' ')[0].strip('"') in self.server.standin.refused_logins:
+            self.send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials\r\n")
+            return
+        self.send(f"{tag} OK LOGIN completed\r\n")
+
+    def _cmd_noop(self, tag, args, uid):
+        self.send(f"{tag} OK NOOP completed\r\n")
+
+    def _cmd_idle(self, tag, args, uid):
+        server = self.server.standin
+        self.send("+ idling\r\n")
+        with server.lock:
+            server.idlers.add(self)
+        try:
+            line = self.rfile.readline()
+        finally:
+            with server.lock:
+                server.idlers.discard(self)
+        if not line:
+            return False
+        if line.strip().upper() != b'DONE':
+            self.send(f"{tag} BAD expected DONE\r\n")
+            return
+        self.send(f"{tag} OK IDLE terminated\r\n")
+
+    def _cmd_logout(self, tag, args, uid):
+        self.send("* BYE logging out\r\n")
+        self.send(f"{tag} OK LOGOUT completed\r\n")
+        return False
+
+    def _cmd_close(self, tag, args, uid):
+        self.selected = False
+        self.send(f"{tag} OK CLOSE completed\r\n")
+
+    def _cmd_select(self, tag, args, uid):
+        server = self.server.standin
+        with server.lock:
+            self.send(f"* {len(server.messages)} EXISTS\r\n")
+            self.send("* 0 RECENT\r\n")
+            self.send(f"* OK [UIDVALIDITY {server.uidvalidity}] UIDs valid\r\n")
+            self.send(f"* OK [UIDNEXT {server.next_uid}] Predicted next UID\r\n")
+            if 'CONDSTORE' in server.capabilities:
+                self.send(f"* OK [HIGHESTMODSEQ {server.modseq}] Highest\r\n")
+        self.selected = True
+        self.send(f"{tag} OK [READ-WRITE] SELECT completed\r\n")
+
+    _cmd_examine = _cmd_select
+
+    def _matches(self, message, seq, tokens, largest_seq, largest_uid):
+        i = 0
+        while i < len(tokens):
+            token = tokens[i].upper()
+            if token == 'ALL':
+                pass
+            elif token == 'UNSEEN':
+                if '\\Seen' in message.flags:
+                    return False
+            elif token == 'SEEN':
+                if '\\Seen' not in message.flags:
+                    return False
+            elif token == 'UID':
+                i += 1
+                if message.uid not in parse_sequence_set(tokens[i], largest_uid):
+                    return False
+            elif token == 'CHARSET':
+                i += 1
+            elif token[0].isdigit() or token[0] == '*':
+                if seq not in parse_sequence_set(token, largest_seq):
+                    return False
+            i += 1
+        return True
+
+    def _cmd_search(self, tag, args, uid):
+        server = self.server.standin
+        tokens = args.split()
+        with server.lock:
+            largest_uid = server.messages[-1].uid if server.messages else 0
+            hits = [str(m.uid if uid else seq)
+                    for seq, m in enumerate(server.messages, start=1)
+                    if self._matches(m, seq, tokens, len(server.messages), largest_uid)]
+        self.send(f"* SEARCH {' '.join(hits)}\r\n".replace("SEARCH \r\n", "SEARCH\r\n"))
+        self.send(f"{tag} OK SEARCH completed\r\n")
+
+    def _mark_seen(self, message):
+        if '\\Seen' not in message.flags:
+            message.flags.add('\\Seen')
+            self.server.standin.modseq += 1
+
+    def _fetch_item(self, message, item):
+        upper = item.upper()
+        if upper == 'UID':
+            return f"UID {message.uid}".encode()
+        if upper == 'FLAGS':
+            return f"FLAGS ({' '.join(sorted(message.flags))})".encode()
+        if upper == 'RFC822.SIZE':
+            return f"RFC822.SIZE {len(message.raw)}".encode()
+        if upper == 'MODSEQ':
+            return f"MODSEQ ({self.server.standin.modseq})".encode()
+        if upper == 'INTERNALDATE':
+            return b'INTERNALDATE "01-Jan-2024 00:00:00 +0000"'
+        if upper == 'RFC822':
+            self._mark_seen(message)
+            return b"RFC822 {%d}\r\n" % len(message.raw) + message.raw
+        if upper == 'RFC822.HEADER':
+            return b"RFC822.HEADER {%d}\r\n" % len(message.header) + message.header
+
+        section = re.match(r'BODY(\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?', item, re.I)
+        peek, spec, offset, length = section.groups()
+        if not peek:
+            self._mark_seen(message)
+        spec_upper = spec.upper()
+        if spec_upper == '':
+            payload = message.raw
+        elif spec_upper == 'TEXT':
+            payload = message.text
+        elif spec_upper == 'HEADER':
+            payload = message.header
+        elif spec_upper.startswith('HEADER.FIELDS'):
+            wanted = {f.upper() for f in re.search(r'\(([^)]*)\)', spec).group(1).split()}
+            headers = BytesHeaderParser().parsebytes(message.header)
+            payload = b''.join(f"{k}: {v}\r\n".encode() for k, v in headers.items() if k.upper() in wanted) + b'\r\n'
+        else:
+            payload = b''
+        name = f"BODY[{spec}]"
+        if offset is not None:
+            payload = payload[int(offset):int(offset) + int(length)]
+            name += f"<{offset}>"
+        return name.encode() + b" {%d}\r\n" % len(payload) + payload
+
+    def _cmd_fetch(self, tag, args, uid):
+        server = self.server.standin
+        message_set, _, items = args.partition(' ')
+        wanted = _FETCH_ITEM.findall(items)
+        if uid and not any(w.upper() == 'UID' for w in wanted):
+            wanted.insert(0, 'UID')
+        with server.lock:
+            if uid:
+                largest_uid = server.messages[-1].uid if server.messages else 0
+                uids = parse_sequence_set(message_set, largest_uid)
+                selected = [(seq, m) for seq, m in enumerate(server.messages, start=1) if m.uid in uids]
+            else:
+                seqs = parse_sequence_set(message_set, len(server.messages))
+                selected = [(seq, m) for seq, m in enumerate(server.messages, start=1) if seq in seqs]
+            for seq, message in selected:
+                body = b' '.join(self._fetch_item(message, item) for item in wanted)
+                self.send(b"* %d FETCH (" % seq + body + b")\r\n")
+        self.send(f"{tag} OK FETCH completed\r\n")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class IMAPStandIn:
+    """In-memory IMAP server on 127.0.0.1 with an ephemeral port"""
+
+    def __init__(self, capabilities=('IMAP4rev1',), uidvalidity=1):
+        self.capabilities = list(capabilities)
+        self.uidvalidity = uidvalidity
+        self.messages = []
+        self.next_uid = 1
+        self.modseq = 1
+        self.command_counts = Counter()
+        self.idlers = set()
+        # Addresses whose LOGIN is answered with AUTHENTICATIONFAILED
+        self.refused_logins = set()
+        self.lock = threading.RLock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.standin = self
+        self.port = self._server.server_address[1]
+
+    def add_message(self, raw, flags=()):
+        with self.lock:
+            self.messages.append(_Message(self.next_uid, raw, flags))
+            self.next_uid += 1
+            self.modseq += 1
+            for handler in self.idlers:
+                handler.send(f"* {len(self.messages)} EXISTS\r\n")
+
+    def set_flags(self, uid, flags):
+        with self.lock:
+            for message in self.messages:
+                if message.uid == uid:
+                    message.flags = set(flags)
+            self.modseq += 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.command_counts.clear()
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def make_message(i):
+    """Raw message number ``i`` (subject "Subject {i}"), with the CRLF line endings IMAP uses"""
+    msg = MIMEText(f"Body of message {i}")
+    msg['From'] = f"sender{i}@example.com"
+    msg['Subject'] = f"Subject {i}"
+    return msg.as_bytes().replace(b'\n', b'\r\n')
+
+
+class LocalIMAPPool(IMAPConnectionPool):
+    """IMAPConnectionPool whose sessions go to a stand-in on ``port`` instead of the provider"""
+
+    def __init__(self, port, **kwargs):
+        self.port = port
+        super().__init__(**kwargs)
+
+    def _connect(self, key, email_address, password):
+        mail = imaplib.IMAP4('127.0.0.1', self.port)
+        mail.login(email_address, password)
+        return mail
+
+
+def wait_for(predicate, timeout=5):
+    """Poll ``predicate`` until it is true; False if ``timeout`` seconds pass first"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
@@ -0,0 +1,191 @@
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentDeliveryError(Exception):
+    """Raised by a deliver callback when retrying cannot help (e.g. the sender account is gone)"""
+
+
+def is_permanent_failure(error):
+    """5xx replies and refused recipients will fail the same way on every retry"""
+    if isinstance(error, (PermanentDeliveryError, smtplib.SMTPRecipientsRefused,
+                          smtplib.SMTPAuthenticationError)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+class MailQueue:
+    """
+    Durable outbound mail queue in SQLite.
+
+    enqueue() stores the serialized message and returns its id at once;
+    ``workers`` background threads deliver due messages by calling
+    ``deliver(username, from_email, raw_message)``. A failed delivery is
+    retried after an exponential backoff (``base_delay`` doubling per attempt,
+    capped at ``max_delay``, with jitter) until ``max_attempts``; permanent
+    SMTP errors and PermanentDeliveryError fail immediately. Messages left
+    'sending' for longer than ``stale_after`` seconds (the process sending
+    them stopped) are queued again, on start and then periodically by the
+    workers, so delivery is at least once.
+
+    Status is one of 'queued', 'sending', 'sent' or 'failed'.
+    """
+
+    def __init__(self, path, deliver, workers=2, max_attempts=6, base_delay=5, max_delay=600,
+                 stale_after=600):
+        self.path = path
+        self.deliver = deliver
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stale_after = stale_after
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._last_requeue = 0.0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    from_email TEXT NOT NULL,
+                    to_email TEXT NOT NULL,
+                    subject TEXT,
+                    message BLOB NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)")
+        self.requeue_stale()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def requeue_stale(self):
+        """Queue again messages left 'sending' by a process that stopped; returns how many"""
+        self._last_requeue = now = time.time()
+        with self._connect() as conn:
+            # A recent 'sending' row may belong to another live process using this file
+            requeued = conn.execute(
+                "UPDATE outbox SET status = 'queued', updated_at = ? WHERE status = 'sending' AND updated_at < ?",
+                (now, now - self.stale_after)).rowcount
+        if requeued:
+            logger.warning(f"Re-queued {requeued} emails that were being sent when their process stopped")
+        return requeued
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work_loop, name=f"mail-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def enqueue(self, username, from_email, msg):
+        """Store an email.message.Message for delivery and return its id"""
+        message_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO outbox (id, username, from_email, to_email, subject, message, status, "
+                "next_attempt, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (message_id, username, from_email, str(msg['To']), str(msg['Subject']), msg.as_bytes(),
+                 now, now, now))
+        with self._wakeup:
+            self._wakeup.notify()
+        logger.info(f"Queued email {message_id} from {from_email} to {msg['To']}")
+        return message_id
+
+    def status(self, message_id):
+        """Delivery status of one message as a dict, or None if unknown"""
+        row = self._connect().execute(
+            "SELECT id, username, from_email, to_email, subject, status, attempts, next_attempt, "
+            "last_error, created_at, updated_at FROM outbox WHERE id = ?", (message_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def _claim(self):
+        """
+        Mark the next due message as sending; returns its row, or the seconds
+        until one is due. Other processes may run workers on the same file
+        (the debug reloader, several server workers), so a message only
+        counts as claimed if the update still finds it queued.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id, username, from_email, message, attempts FROM outbox "
+                    "WHERE status = 'queued' AND next_attempt <= ? ORDER BY next_attempt LIMIT 1",
+                    (now,)).fetchone()
+                if row is None:
+                    break
+                claimed = conn.execute(
+                    "UPDATE outbox SET status = 'sending', attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ? AND status = 'queued'", (now, row['id'])).rowcount
+                if claimed:
+                    return row
+            due = conn.execute(
+                "SELECT MIN(next_attempt) FROM outbox WHERE status = 'queued'").fetchone()[0]
+        return None if due is None else max(0.0, due - now)
+
+    def _work_loop(self):
+        requeue_interval = max(min(self.stale_after, 60), 0.1)
+        while True:
+            try:
+                if time.time() - self._last_requeue >= requeue_interval:
+                    self.requeue_stale()
+                job = self._claim()
+            except Exception as e:
+                logger.error(f"Error reading mail queue: {e}", exc_info=True)
+                job = 5.0
+            if isinstance(job, sqlite3.Row):
+                self._send(job)
+                continue
+            with self._wakeup:
+                # Sleep until the next retry is due, a new message is queued or
+                # it is time to look for stale rows again
+                self._wakeup.wait(timeout=requeue_interval if job is None else min(job, requeue_interval))
+
+    def _send(self, job):
+        attempts = job['attempts'] + 1
+        try:
+            self.deliver(job['username'], job['from_email'], job['message'])
+        except Exception as e:
+            now = time.time()
+            if is_permanent_failure(e) or attempts >= self.max_attempts:
+                logger.error(f"Giving up on email {job['id']} after {attempts} attempts: {e}")
+                status, next_attempt = 'failed', now
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                delay *= random.uniform(0.8, 1.2)
+                logger.warning(f"Delivery of email {job['id']} failed ({e}), retrying in {delay:.0f}s")
+                status, next_attempt = 'queued', now + delay
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE outbox SET status = ?, next_attempt = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                    (status, next_attempt, str(e), now, job['id']))
+            return
+        with self._connect() as conn:
+            conn.execute(
+                # The body is no longer needed once delivered; keep the status row
+                "UPDATE outbox SET status = 'sent', message = X'', last_error = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), job['id']))
+        logger.info(f"Delivered email {job['id']} after {attempts} attempt(s)")
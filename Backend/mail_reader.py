@@ -0,0 +1,296 @@
+import email
+import logging
+import re
+from concurrent.futures import wait
+from datetime import timezone
+from email.header import decode_header
+from email.utils import parsedate_to_datetime
+
+from mime_body import extract_body
+
+logger = logging.getLogger(__name__)
+
+# Longest body handed to the voice reader
+MAX_BODY_CHARS = 20000
+# Messages are downloaded up to this size; text parts come before attachments
+MAX_FETCH_BYTES = 1024 * 1024
+
+_MESSAGE_START = re.compile(rb'^\s*(\d+) \(')
+_LITERAL = re.compile(rb'\{(\d+)\}\s*$')
+_ITEM = re.compile(rb'([A-Z0-9.]+(?:\[[^\]]*\])?(?:<\d+>)?) (\([^()]*\)|"[^"]*"|\x00|[^\s()]+)', re.I)
+
+
+def positive_int(value):
+    """
+    ``value`` as a positive int, or None if it is anything else. Request
+    values end up in IMAP commands, which imaplib sends unescaped.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        value = int(value)
+    if not isinstance(value, int) or value <= 0:
+        return None
+    return value
+
+
+def compress_message_set(ids):
+    """Turn message ids into a compact IMAP sequence set, e.g. 1,5,9:12"""
+    numbers = sorted({int(i) for i in ids})
+    ranges = []
+    for n in numbers:
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return ','.join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def _parse_items(text, items, literal=None):
+    # A literal's value is marked with \x00 so it pairs up with its item name
+    for name, value in _ITEM.findall(text):
+        name = name.upper().decode()
+        items[name] = literal if value == b'\x00' else value.decode()
+
+
+def parse_fetch_response(data):
+    """
+    Split the raw imaplib FETCH response for a whole message set into
+    {sequence number: {item name: value}}. Literal items (message bodies,
+    header blocks) are bytes, everything else is the raw atom as str, e.g.
+    {5: {'UID': '120', 'RFC822.SIZE': '2048', 'BODY[TEXT]<0>': b'...'}}.
+    """
+    messages = {}
+    current = None
+    for part in data:
+        if part is None:
+            continue
+        head, literal = part if isinstance(part, tuple) else (part, None)
+        start = _MESSAGE_START.match(head)
+        if start:
+            current = messages.setdefault(int(start.group(1)), {})
+            head = head[start.end():]
+        if current is None:
+            continue
+        if literal is not None:
+            head = _LITERAL.sub(b'\x00', head)
+        _parse_items(head, current, literal)
+    return messages
+
+
+def fetch_messages(mail, ids, items='(RFC822)'):
+    """
+    Fetch ``items`` for all ``ids`` with a single FETCH command (one round
+    trip) and return {sequence number: {item name: value}}.
+    """
+    if not ids:
+        return {}
+    result, data = mail.fetch(compress_message_set(ids), items)
+    if result != 'OK':
+        raise RuntimeError(f"FETCH failed: {data}")
+    return parse_fetch_response(data)
+
+
+# Headers the voice reader needs; Content-Type/-Transfer-Encoding let the text preview be decoded
+SUMMARY_HEADERS = 'FROM SUBJECT DATE MESSAGE-ID CONTENT-TYPE CONTENT-TRANSFER-ENCODING'
+
+
+def summary_items(preview_bytes):
+    return f'(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS ({SUMMARY_HEADERS})] BODY.PEEK[TEXT]<0.{preview_bytes}>)'
+
+
+def fetch_messages_by_uid(mail, uids, items):
+    """
+    Like fetch_messages() but addressed by UID (UID FETCH, one round trip);
+    returns {uid: {item name: value}}.
+    """
+    if not uids:
+        return {}
+    result, data = mail.uid('FETCH', compress_message_set(uids), items)
+    if result != 'OK':
+        raise RuntimeError(f"UID FETCH failed: {data}")
+    return {int(items['UID']): items for items in parse_fetch_response(data).values() if 'UID' in items}
+
+
+def parse_email(raw_email, max_chars=MAX_BODY_CHARS):
+    """
+    Turn raw RFC822 bytes into a {from, subject, date, body} dict. The body
+    is the first text part, at most ``max_chars`` long; attachments are
+    skipped without being decoded (see mime_body.extract_body).
+    """
+    msg, body, content_type, _ = extract_body(raw_email, max_chars)
+    
+    subject = decode_header(msg['subject'])
+    subject = subject[0][0]
+    if isinstance(subject, bytes):
+        subject = subject.decode('utf-8', errors='replace')
+    
+    from_addr = decode_header(msg['from'])
+    from_addr = from_addr[0][0]
+    if isinstance(from_addr, bytes):
+        from_addr = from_addr.decode('utf-8', errors='replace')
+    
+    if content_type == "text/html":
+        # Already converted to text by extract_body; keep its paragraph breaks
+        body = body.strip()
+    else:
+        # Clean up the body text
+        body = re.sub(r'\s+', ' ', body).strip()
+    
+    return {
+        "from": from_addr,
+        "subject": subject,
+        "date": msg['date'],
+        "body": body
+    }
+
+
+def email_timestamp(date_header):
+    """POSIX timestamp of a Date header, for sorting; 0 if missing or unparseable"""
+    if not date_header:
+        return 0.0
+    try:
+        date = parsedate_to_datetime(date_header)
+    except (TypeError, ValueError):
+        return 0.0
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+def _find_item(items, prefix):
+    # Servers echo section names in their own case/spacing, so match on the prefix
+    for name, value in items.items():
+        if name.startswith(prefix):
+            return value
+    return None
+
+
+def parse_summary(items, preview_chars):
+    """
+    Build a {uid, from, subject, date, message_id, size, body, truncated}
+    dict from a SUMMARY_ITEMS fetch. The preview is the first bytes of the
+    message text, parsed with the message's own Content-Type so multipart
+    previews still yield the first text part.
+    """
+    headers = _find_item(items, 'BODY[HEADER') or b'\r\n'
+    text = _find_item(items, 'BODY[TEXT]') or b''
+    parsed = parse_email(headers + text)
+    msg = email.message_from_bytes(headers)
+    size = int(items.get('RFC822.SIZE', 0))
+    body = parsed['body']
+    truncated = len(headers) + len(text) < size or len(body) > preview_chars
+    return {
+        "uid": items.get('UID'),
+        "from": parsed['from'],
+        "subject": parsed['subject'],
+        "date": msg['date'],
+        "message_id": msg['message-id'],
+        "size": size,
+        "body": body[:preview_chars],
+        "truncated": truncated
+    }
+
+
+def fetch_unread_emails(mail, limit=20, mode='full', preview_bytes=2048, preview_chars=500,
+                        max_bytes=MAX_FETCH_BYTES):
+    """
+    Read up to ``limit`` of the most recent unread emails from the INBOX of
+    a logged-in IMAP session. Returns a list of {from, subject, date, body} dicts.
+
+    In 'summary' mode only the headers the voice reader needs and the first
+    ``preview_bytes`` of the text are downloaded (with BODY.PEEK, so the
+    messages stay unread); use fetch_email_by_uid() for the full body.
+    Otherwise each message is downloaded up to ``max_bytes``, which is
+    enough for its text while capping what a huge attachment costs.
+    """
+    mail.select('inbox')
+    
+    # Search for ALL unread emails, not just from last 24 hours
+    logger.info("Searching for unread emails")
+    result, data = mail.search(None, 'UNSEEN')
+    
+    email_ids = data[0].split()
+    emails = []
+    
+    logger.info(f"Found {len(email_ids)} unread emails")
+    
+    # Limit to most recent emails to avoid overload
+    email_ids = email_ids[-limit:] if len(email_ids) > limit else email_ids
+    
+    # One FETCH for the whole batch instead of one round trip per email
+    if mode == 'summary':
+        messages = fetch_messages(mail, email_ids, summary_items(preview_bytes))
+    else:
+        messages = fetch_messages(mail, email_ids, f'(UID BODY[]<0.{max_bytes}>)')
+    
+    for e_id in email_ids:
+        try:
+            items = messages[int(e_id)]
+            if mode == 'summary':
+                parsed = parse_summary(items, preview_chars)
+            else:
+                parsed = parse_email(_find_item(items, 'BODY[]'))
+                parsed['uid'] = items.get('UID')
+            emails.append(parsed)
+            logger.info(f"Processed email: {parsed['subject']}")
+        except Exception as e:
+            logger.error(f"Error processing email ID {e_id}: {str(e)}")
+            continue
+    
+    return emails
+
+
+def fetch_email_by_uid(mail, uid, mark_seen=True, max_bytes=MAX_FETCH_BYTES):
+    """
+    Fetch and parse the message with the given UID (its first ``max_bytes``)
+    from the INBOX, or return None if it no longer exists. ``mark_seen``
+    decides between BODY[] (marks the message read, like the old RFC822
+    fetch) and BODY.PEEK[].
+    """
+    if positive_int(uid) is None:
+        raise ValueError(f"Invalid UID: {uid!r}")
+    uid = int(uid)
+    mail.select('inbox')
+    section = 'BODY[]' if mark_seen else 'BODY.PEEK[]'
+    result, data = mail.uid('FETCH', str(uid), f'(UID {section}<0.{max_bytes}>)')
+    if result != 'OK':
+        raise RuntimeError(f"UID FETCH failed: {data}")
+    for items in parse_fetch_response(data).values():
+        if items.get('UID') == str(uid):
+            parsed = parse_email(_find_item(items, 'BODY[]'))
+            parsed['uid'] = items['UID']
+            return parsed
+    return None
+
+
+def read_accounts_unread(executor, readers, timeout, limit):
+    """
+    Run ``readers`` ({account email: callable returning that account's
+    unread emails}) in parallel on ``executor`` and merge their emails by
+    date, oldest first, keeping the ``limit`` most recent. Each email gets
+    the 'account' it came from. Returns (emails, errors), where errors maps
+    every account that failed or did not finish within ``timeout`` seconds
+    to the reason; reads still running are left to finish in the background.
+    """
+    futures = {executor.submit(reader): user_email for user_email, reader in readers.items()}
+    done, pending = wait(futures, timeout=timeout)
+
+    emails = []
+    errors = {}
+    for future in done:
+        user_email = futures[future]
+        try:
+            for message in future.result():
+                message['account'] = user_email
+                emails.append(message)
+        except Exception as e:
+            logger.error(f"Error reading unread emails for {user_email}: {str(e)}")
+            errors[user_email] = str(e)
+    for future in pending:
+        # Left running: a summary read still fills the cache for next time
+        logger.warning(f"Gave up waiting for unread emails of {futures[future]}")
+        errors[futures[future]] = f"Timed out after {timeout:g}s"
+
+    emails.sort(key=lambda message: email_timestamp(message.get('date')))
+    return emails[-limit:], errors
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+import logging
+
+from mail_reader import fetch_messages_by_uid, parse_summary, summary_items
+
+logger = logging.getLogger(__name__)
+
+
+def _response_code(mail, name):
+    """Value of an untagged [CODE value] response from the last SELECT, e.g. UIDVALIDITY"""
+    _, values = mail.response(name)
+    if not values or values[0] is None:
+        return None
+    return int(values[-1].split()[0])
+
+
+class MailboxSync:
+    """
+    Incremental, UID-based sync of each account's unread INBOX messages into
+    a local SQLite cache.
+
+    For every (username, email) the cache remembers UIDVALIDITY, UIDNEXT and,
+    when the server reports it, HIGHESTMODSEQ (CONDSTORE), plus the parsed
+    summaries of the unread messages it has already downloaded. A sync is:
+
+    * SELECT, and drop the cache if UIDVALIDITY changed;
+    * if HIGHESTMODSEQ and UIDNEXT are unchanged, nothing happened in the
+      mailbox: answer from the cache with no further round trips;
+    * otherwise one UID SEARCH UNSEEN, then a single UID FETCH for only the
+      unread UIDs not cached yet. Cached messages that were read elsewhere are
+      pruned.
+
+    The cache holds the most recent unread messages up to the largest
+    ``limit`` asked for so far (at most ``max_cached``), and records that
+    window, so a call with a larger ``limit`` than the cache covers always
+    goes to the server.
+    """
+
+    def __init__(self, path, preview_bytes=2048, preview_chars=500, max_cached=100):
+        self.path = path
+        self.max_cached = max_cached
+        self.preview_bytes = preview_bytes
+        self.preview_chars = preview_chars
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS mailbox_state (
+                    username TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    uidvalidity INTEGER,
+                    uidnext INTEGER,
+                    highestmodseq INTEGER,
+                    synced_limit INTEGER,
+                    PRIMARY KEY (username, email)
+                )""")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(mailbox_state)")]
+            if 'synced_limit' not in columns:
+                # Caches created before the window was recorded
+                conn.execute("ALTER TABLE mailbox_state ADD COLUMN synced_limit INTEGER")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    username TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    uid INTEGER NOT NULL,
+                    summary TEXT NOT NULL,
+                    PRIMARY KEY (username, email, uid)
+                )""")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _state(self, key):
+        row = self._connect().execute(
+            "SELECT uidvalidity, uidnext, highestmodseq, synced_limit FROM mailbox_state "
+            "WHERE username = ? AND email = ?", key).fetchone()
+        return row or (None, None, None, None)
+
+    def _cached(self, key):
+        rows = self._connect().execute(
+            "SELECT uid, summary FROM messages WHERE username = ? AND email = ?", key).fetchall()
+        return {uid: json.loads(summary) for uid, summary in rows}
+
+    def reset(self, key):
+        """Forget everything cached for an account"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE username = ? AND email = ?", key)
+            conn.execute("DELETE FROM mailbox_state WHERE username = ? AND email = ?", key)
+
+    def sync_unread(self, mail, key, limit=20):
+        """
+        Bring the cache for ``key`` = (username, email) up to date over the
+        logged-in session ``mail`` and return summaries of the ``limit`` most
+        recent unread messages (at most ``max_cached``), oldest first.
+        """
+        limit = min(limit, self.max_cached)
+        mail.select('inbox')
+        uidvalidity = _response_code(mail, 'UIDVALIDITY')
+        uidnext = _response_code(mail, 'UIDNEXT')
+        highestmodseq = _response_code(mail, 'HIGHESTMODSEQ')
+
+        cached_validity, cached_uidnext, cached_modseq, synced_limit = self._state(key)
+        if cached_validity is not None and cached_validity != uidvalidity:
+            logger.info(f"UIDVALIDITY changed for {key[1]}, discarding cached messages")
+            self.reset(key)
+            cached_uidnext = cached_modseq = synced_limit = None
+
+        cached = self._cached(key)
+        unchanged = (highestmodseq is not None and highestmodseq == cached_modseq
+                     and uidnext is not None and uidnext == cached_uidnext
+                     and synced_limit is not None and limit <= synced_limit)
+        if unchanged:
+            logger.info(f"Mailbox unchanged since last sync for {key[1]}, serving from cache")
+            return self._latest(cached, limit)
+
+        result, data = mail.uid('SEARCH', None, 'UNSEEN')
+        if result != 'OK':
+            raise RuntimeError(f"UID SEARCH failed: {data}")
+        # Keep the window the cache already covers, so a smaller limit does not shrink it
+        window = max(limit, synced_limit or 0)
+        unseen = sorted(int(uid) for uid in data[0].split())[-window:]
+
+        new_uids = [uid for uid in unseen if uid not in cached]
+        logger.info(f"{len(unseen)} unread emails, {len(new_uids)} not cached yet")
+        fetched = {}
+        for uid, items in fetch_messages_by_uid(mail, new_uids, summary_items(self.preview_bytes)).items():
+            try:
+                fetched[uid] = parse_summary(items, self.preview_chars)
+            except Exception as e:
+                logger.error(f"Error processing email UID {uid}: {str(e)}")
+
+        unseen_set = set(unseen)
+        with self._connect() as conn:
+            stale = [(key[0], key[1], uid) for uid in cached if uid not in unseen_set]
+            conn.executemany("DELETE FROM messages WHERE username = ? AND email = ? AND uid = ?", stale)
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (username, email, uid, summary) VALUES (?, ?, ?, ?)",
+                [(key[0], key[1], uid, json.dumps(summary)) for uid, summary in fetched.items()])
+            conn.execute(
+                "INSERT OR REPLACE INTO mailbox_state "
+                "(username, email, uidvalidity, uidnext, highestmodseq, synced_limit) VALUES (?, ?, ?, ?, ?, ?)",
+                (key[0], key[1], uidvalidity, uidnext, highestmodseq, window))
+
+        current = {uid: cached[uid] for uid in unseen if uid in cached}
+        current.update(fetched)
+        return self._latest(current, limit)
+
+    @staticmethod
+    def _latest(messages, limit):
+        return [messages[uid] for uid in sorted(messages)[-limit:]]
@@ -0,0 +1,260 @@
+import imaplib
+import queue
+import re
+import select
+import socket
+import ssl
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_EXISTS = re.compile(rb'\* (\d+) EXISTS', re.I)
+
+
+def _buffered(mail):
+    """
+    Whether response data is waiting without blocking: already read into
+    imaplib's buffered file (several responses can arrive in one packet),
+    decrypted in the TLS layer, or readable from the socket.
+    """
+    timeout = mail.sock.gettimeout()
+    mail.sock.settimeout(0)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        mail.sock.settimeout(timeout)
+
+
+def _is_auth_error(error):
+    """Whether an IMAP error is the server refusing the account's credentials"""
+    if not isinstance(error, imaplib.IMAP4.error) or isinstance(error, imaplib.IMAP4.abort):
+        return False
+    message = str(error).upper()
+    return any(word in message for word in ('AUTHENTICATIONFAILED', 'LOGIN', 'CREDENTIALS'))
+
+
+def idle_wait(mail, timeout, wakeup=None):
+    """
+    Put a selected IMAP session into IDLE (RFC 2177) until the server reports
+    the mailbox size, ``timeout`` seconds pass or ``wakeup`` (a socket) becomes
+    readable, then leave IDLE again.
+
+    Returns the last EXISTS count the server sent, or None if there was none.
+    imaplib has no IDLE support before Python 3.14, so the exchange is done
+    by hand on the session's socket.
+    """
+    tag = b'IDLE%d' % id(mail)
+    mail.send(tag + b' IDLE\r\n')
+    line = mail.readline()
+    if not line.startswith(b'+'):
+        raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+
+    exists = None
+    watched = [mail.sock] if wakeup is None else [mail.sock, wakeup]
+    while exists is None:
+        # Lines that came in with the last one never make the socket readable again
+        if not _buffered(mail):
+            readable, _, _ = select.select(watched, [], [], timeout)
+            if mail.sock not in readable:
+                break
+        line = mail.readline()
+        if not line or line.startswith(b'* BYE'):
+            raise imaplib.IMAP4.abort(f"Connection closed during IDLE: {line!r}")
+        match = _EXISTS.match(line)
+        if match:
+            exists = int(match.group(1))
+
+    mail.send(b'DONE\r\n')
+    while True:
+        line = mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Connection closed while leaving IDLE")
+        if line.startswith(tag + b' '):
+            if not line[len(tag) + 1:].upper().startswith(b'OK'):
+                raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+            return exists
+        match = _EXISTS.match(line)
+        if match:
+            exists = int(match.group(1))
+
+
+class _Watch:
+    def __init__(self, key, email_address, password):
+        self.key = key
+        self.email = email_address
+        self.password = password
+        self.subscribers = set()
+        self.failures = 0  # consecutive failed sessions, for the reconnect backoff
+        self.stop = threading.Event()
+        # Writing to this socket pair interrupts a blocking IDLE
+        self.wakeup, self._wakeup_writer = socket.socketpair()
+        self.thread = None
+
+    def cancel(self):
+        self.stop.set()
+        try:
+            self._wakeup_writer.send(b'x')
+        except OSError:
+            pass
+
+    def close(self):
+        self.wakeup.close()
+        self._wakeup_writer.close()
+
+
+class MailWatcher:
+    """
+    Pushes new-mail notifications for accounts that have at least one
+    subscriber (an open event stream in the browser).
+
+    Each watched account gets a thread. Up to ``max_idle`` accounts hold a
+    dedicated IMAP connection in IDLE, so the server tells us about new mail
+    the moment it arrives; IDLE is re-issued every ``idle_timeout`` seconds
+    to stay under server inactivity limits. Accounts beyond that cap, or on
+    servers without IDLE, fall back to checking the mailbox every
+    ``poll_interval`` seconds over a session borrowed from ``imap_pool``.
+    The watch stops when the last subscriber goes away.
+
+    Failed sessions are retried after ``reconnect_delay`` seconds, doubling
+    up to ``max_reconnect_delay`` while they keep failing. A login the server
+    refuses is not retried: subscribers get a 'login-failed' event and the
+    watch stops until the account's password changes (see login_failed()).
+    """
+
+    def __init__(self, connect, imap_pool, max_idle=20, idle_timeout=600, poll_interval=60,
+                 reconnect_delay=10, max_reconnect_delay=600):
+        self.connect = connect
+        self.imap_pool = imap_pool
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._idle_slots = threading.BoundedSemaphore(max_idle) if max_idle else None
+        self._no_idle = set()  # accounts whose server does not support IDLE
+        self._login_failures = {}  # key -> password the server refused
+        self._lock = threading.Lock()
+        self._watches = {}
+
+    def subscribe(self, key, email_address, password):
+        """Start watching an account if needed and return a queue of its events"""
+        events = queue.Queue(maxsize=100)
+        with self._lock:
+            watch = self._watches.get(key)
+            if watch is None:
+                watch = _Watch(key, email_address, password)
+                watch.thread = threading.Thread(target=self._watch_loop, args=(watch,),
+                                                name=f"mail-watch-{email_address}", daemon=True)
+                self._watches[key] = watch
+                watch.thread.start()
+            watch.subscribers.add(events)
+        return events
+
+    def login_failed(self, key, password):
+        """Whether the server already refused this password for the account"""
+        with self._lock:
+            return self._login_failures.get(key) == password
+
+    def unsubscribe(self, key, events):
+        with self._lock:
+            watch = self._watches.get(key)
+            if watch is None:
+                return
+            watch.subscribers.discard(events)
+            if watch.subscribers:
+                return
+            del self._watches[key]
+        logger.info(f"No more listeners for {watch.email}, stopping mail watch")
+        watch.cancel()
+
+    def _publish(self, watch, event):
+        with self._lock:
+            subscribers = list(watch.subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def _watch_loop(self, watch):
+        try:
+            while not watch.stop.is_set():
+                try:
+                    if watch.key not in self._no_idle and self._idle_slots is not None \
+                            and self._idle_slots.acquire(blocking=False):
+                        try:
+                            self._idle(watch)
+                        finally:
+                            self._idle_slots.release()
+                    else:
+                        self._poll(watch)
+                except Exception as e:
+                    if _is_auth_error(e):
+                        self._stop_for_login_failure(watch, e)
+                        return
+                    delay = min(self.reconnect_delay * 2 ** watch.failures, self.max_reconnect_delay)
+                    watch.failures += 1
+                    logger.warning(f"Mail watch for {watch.email} failed ({e}), retrying in {delay}s")
+                    watch.stop.wait(delay)
+        finally:
+            watch.close()
+
+    def _stop_for_login_failure(self, watch, error):
+        logger.error(f"IMAP login for {watch.email} was refused ({error}), stopping mail watch")
+        with self._lock:
+            self._login_failures[watch.key] = watch.password
+            if self._watches.get(watch.key) is watch:
+                del self._watches[watch.key]
+        self._publish(watch, {'type': 'login-failed', 'email': watch.email})
+        watch.stop.set()
+
+    def _idle(self, watch):
+        mail = self.connect(watch.email, watch.password)
+        try:
+            if 'IDLE' not in mail.capabilities:
+                logger.info(f"IMAP server for {watch.email} has no IDLE, polling instead")
+                self._no_idle.add(watch.key)
+                return
+            status, data = mail.select('inbox', readonly=True)
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"SELECT failed: {data}")
+            exists = int(data[0])
+            watch.failures = 0
+            logger.info(f"Watching {watch.email} with IDLE")
+            while not watch.stop.is_set():
+                count = idle_wait(mail, self.idle_timeout, watch.wakeup)
+                if count is not None and count > exists:
+                    self._publish(watch, {'type': 'new-mail', 'email': watch.email, 'count': count - exists})
+                if count is not None:
+                    exists = count
+        finally:
+            try:
+                mail.logout()
+            except Exception:
+                mail.shutdown()
+
+    def _poll(self, watch):
+        """Check UIDNEXT on a pooled session until stopped or an IDLE slot frees up"""
+        def uidnext(mail):
+            mail.select('inbox', readonly=True)
+            _, values = mail.response('UIDNEXT')
+            return int(values[-1]) if values and values[-1] is not None else None
+
+        logger.info(f"Watching {watch.email} by polling every {self.poll_interval}s")
+        last = None
+        while not watch.stop.is_set():
+            current = self.imap_pool.run(watch.key, uidnext, watch.email, watch.password)
+            watch.failures = 0
+            if last is not None and current is not None and current > last:
+                self._publish(watch, {'type': 'new-mail', 'email': watch.email, 'count': current - last})
+            last = current
+            if watch.stop.wait(self.poll_interval):
+                return
+            if watch.key not in self._no_idle and self._idle_slots is not None \
+                    and self._idle_slots.acquire(blocking=False):
+                # Hand the slot straight back; the watch loop takes it again for IDLE
+                self._idle_slots.release()
+                return
@@ -0,0 +1,181 @@
+import binascii
+import codecs
+import io
+import logging
+from email.parser import BytesHeaderParser
+
+from html_text import HTMLTextConverter
+
+logger = logging.getLogger(__name__)
+
+TEXT_TYPES = ('text/plain', 'text/html')
+_MAX_LINE = 64 * 1024
+_MAX_HEADER_BYTES = 256 * 1024
+
+
+class _Stop(Exception):
+    """Raised once the body has been extracted to abandon the rest of the message"""
+
+
+class _BodyExtractor:
+
+    def __init__(self, stream, max_chars):
+        self.stream = stream
+        self.max_chars = max_chars
+        self.boundaries = []
+        self.at_line_start = True
+        self.body = ''
+        self.content_type = None
+        self.truncated = False
+
+    def _next_line(self):
+        """
+        Next line (or, for very long lines, the next _MAX_LINE bytes of it) as
+        (data, starts_line); (None, False) at end of input.
+        """
+        line = self.stream.readline(_MAX_LINE)
+        if not line:
+            return None, False
+        starts = self.at_line_start
+        self.at_line_start = line.endswith(b'\n')
+        return line, starts
+
+    def _delimiter(self, line, starts):
+        """(depth, closing) if the line is a boundary of any enclosing multipart"""
+        if not starts or not line.startswith(b'--') or not self.boundaries:
+            return None
+        line = line.rstrip()
+        for depth in range(len(self.boundaries) - 1, -1, -1):
+            boundary = b'--' + self.boundaries[depth]
+            if line == boundary:
+                return depth, False
+            if line == boundary + b'--':
+                return depth, True
+        return None
+
+    def read_headers(self):
+        """Parse one header block; returns (headers, delimiter hit before the blank line)"""
+        block = []
+        size = 0
+        hit = None
+        while True:
+            line, starts = self._next_line()
+            if line is None:
+                break
+            hit = self._delimiter(line, starts)
+            if hit is not None or (starts and not line.strip()):
+                break
+            if size < _MAX_HEADER_BYTES:
+                block.append(line)
+                size += len(line)
+        return BytesHeaderParser().parsebytes(b''.join(block)), hit
+
+    def entity(self, headers):
+        """Consume one entity; returns the delimiter that ended it, or None at end of input"""
+        if headers.get_content_maintype() == 'multipart' and headers.get_param('boundary'):
+            return self._multipart(headers.get_param('boundary').encode('latin-1', 'replace'))
+        content_type = headers.get_content_type()
+        disposition = str(headers.get('Content-Disposition', '')).lower()
+        if content_type in TEXT_TYPES and 'attachment' not in disposition:
+            self._decode(headers, content_type)
+        return self._skip()
+
+    def _skip(self):
+        # Attachments and other parts are scanned for the next boundary, never decoded
+        while True:
+            line, starts = self._next_line()
+            if line is None:
+                return None
+            hit = self._delimiter(line, starts)
+            if hit is not None:
+                return hit
+
+    def _multipart(self, boundary):
+        depth = len(self.boundaries)
+        self.boundaries.append(boundary)
+        hit = self._skip()  # preamble
+        while hit is not None and hit == (depth, False):
+            headers, hit = self.read_headers()
+            if hit is None:
+                hit = self.entity(headers)
+        self.boundaries.pop()
+        if hit is not None and hit[0] == depth:
+            # Our closing delimiter; the epilogue runs until the parent's next one
+            return self._skip()
+        return hit
+
+    def _decode(self, headers, content_type):
+        encoding = str(headers.get('Content-Transfer-Encoding', '7bit')).strip().lower()
+        try:
+            decoder = codecs.getincrementaldecoder(headers.get_content_charset() or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        # HTML is converted as it is decoded, so the cap applies to the spoken text
+        html = HTMLTextConverter(self.max_chars) if content_type == 'text/html' else None
+
+        pieces = []
+        length = 0
+        pending = b''
+        while length < self.max_chars:
+            line, starts = self._next_line()
+            if line is None or self._delimiter(line, starts) is not None:
+                break
+            if encoding == 'base64':
+                data = pending + b''.join(line.split())
+                usable = len(data) - len(data) % 4
+                pending = data[usable:]
+                try:
+                    chunk = binascii.a2b_base64(data[:usable])
+                except binascii.Error:
+                    chunk = b''
+            elif encoding == 'quoted-printable':
+                chunk = binascii.a2b_qp(line)
+            else:
+                chunk = line
+            text = decoder.decode(chunk)
+            if html is not None:
+                html.feed(text)
+                if html.full:
+                    break
+            else:
+                pieces.append(text)
+                length += len(text)
+        else:
+            self.truncated = True
+
+        if html is not None:
+            if html.full:
+                self.truncated = True
+            else:
+                html.feed(decoder.decode(b'', final=True))
+                html.close()
+            self.body = html.text()
+        else:
+            pieces.append(decoder.decode(b'', final=True))
+            self.body = ''.join(pieces)[:self.max_chars]
+        self.content_type = content_type
+        raise _Stop
+
+
+def extract_body(raw, max_chars=20000):
+    """
+    Pull the first text/plain or text/html body out of a MIME message in a
+    single forward pass.
+
+    ``raw`` is the message as bytes or a binary file object. Only one line
+    is held at a time: attachment payloads are scanned for the next boundary
+    without being decoded, parsing stops as soon as the first text part has
+    been read, and it ends once ``max_chars`` characters of text have been
+    produced. HTML parts are converted to text on the fly (html_text).
+
+    Returns (headers, body, content_type, truncated); content_type is None
+    if the message has no text part.
+    """
+    stream = io.BytesIO(raw) if isinstance(raw, (bytes, bytearray)) else raw
+    extractor = _BodyExtractor(stream, max_chars)
+    headers, _ = extractor.read_headers()
+    try:
+        extractor.entity(headers)
+    except _Stop:
+        pass
+    return headers, extractor.body, extractor.content_type, extractor.truncated
@@ -0,0 +1,81 @@
+import smtplib
+import logging
+
+from connection_pool import KeyedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+def smtp_server_for(email_address):
+    """Pick the SMTP submission server from the email domain"""
+    email_domain = email_address.split('@')[1].lower()
+
+    if 'gmail' in email_domain:
+        return 'smtp.gmail.com'
+    elif 'yahoo' in email_domain:
+        return 'smtp.mail.yahoo.com'
+    elif 'outlook' in email_domain or 'hotmail' in email_domain or 'live' in email_domain:
+        return 'smtp.office365.com'
+    else:
+        # Custom domains are validated against Office 365, as adding an
+        # account always did, so they must send through it too
+        return 'smtp.office365.com'
+
+
+def smtp_login(email_address, password, timeout=30):
+    """Open an SMTP submission session (port 587, STARTTLS) and log in"""
+    smtp_server = smtp_server_for(email_address)
+    logger.info(f"Connecting to SMTP server {smtp_server} for {email_address}")
+    server = smtplib.SMTP(smtp_server, 587, timeout=timeout)
+    try:
+        server.starttls()
+        server.login(email_address, password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+class SMTPConnectionPool(KeyedConnectionPool):
+    """
+    Authenticated SMTP sessions keyed by (username, email), so sending
+    several emails in a row pays for TLS + AUTH once. A reused session gets
+    an RSET before its next message, which also proves it is still alive;
+    if the server has dropped it the message is sent on a fresh session.
+    """
+
+    # Only connection loss is retried: other SMTP errors (refused recipients,
+    # rejected data) are answers about the message and must not resend it
+    disconnect_errors = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+    name = "SMTP"
+
+    def __init__(self, timeout=30, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def _connect(self, key, email_address, password):
+        return smtp_login(email_address, password, self.timeout)
+
+    def _check(self, server):
+        status, _ = server.noop()
+        if status != 250:
+            raise smtplib.SMTPServerDisconnected(f"NOOP returned {status}")
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def send_message(self, key, msg, email_address, password):
+        """Send ``msg`` over a pooled session for ``key``"""
+        def send(server):
+            if getattr(server, 'messages_sent', 0):
+                # Start from a clean transaction on a reused session, also after a refused message
+                status, _ = server.rset()
+                if status != 250:
+                    raise smtplib.SMTPServerDisconnected(f"RSET returned {status}")
+            server.messages_sent = getattr(server, 'messages_sent', 0) + 1
+            server.send_message(msg)
+
+        self.run(key, send, email_address, password)
@@ -0,0 +1,183 @@
+"""
+Minimal local SMTP server for tests and benchmarks.
+
+Speaks just enough plain-TCP ESMTP for smtplib.SMTP (EHLO, AUTH PLAIN/LOGIN,
+MAIL, RCPT, DATA, RSET, NOOP, QUIT), keeps every accepted message in memory
+and counts commands and connections so tests can assert on round trips:
+
+    server = SMTPStandIn().start()
+    smtp = smtplib.SMTP('127.0.0.1', server.port)
+    smtp.login('user@example.com', 'password')
+    ...
+    server.command_counts['AUTH'], server.connections, server.messages
+
+LocalSMTPPool is an SMTPConnectionPool that connects to a stand-in's port.
+"""
+import smtplib
+import socket
+import socketserver
+import threading
+import time
+from collections import Counter
+
+from smtp_pool import SMTPConnectionPool
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def send(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server.standin
+        with server.lock:
+            server.connections += 1
+            server.handlers.add(self)
+        self.sender = None
+        self.recipients = []
+        self.send("220 SMTP stand-in ready")
+        try:
+            self._serve()
+        finally:
+            with server.lock:
+                server.handlers.discard(self)
+
+    def _serve(self):
+        server = self.server.standin
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+            command, _, args = line.decode().rstrip('\r\n').partition(' ')
+            command = command.upper()
+            with server.lock:
+                server.command_counts[command] += 1
+            if server.latency:
+                time.sleep(server.latency)
+            handler = getattr(self, f"_cmd_{command.lower()}", None)
+            if handler is None:
+                self.send("500 unknown command")
+                continue
+            if handler(args) is False:
+                return
+
+    def _cmd_ehlo(self, args):
+        self.send("250-stand-in")
+        self.send("250-AUTH PLAIN LOGIN")
+        self.send("250 SIZE 35882577")
+
+    def _cmd_helo(self, args):
+        self.send("250 stand-in")
+
+    def _cmd_auth(self, args):
+        mechanism = args.split()[0].upper()
+        if mechanism == 'LOGIN':
+            # Username and password prompts
+            for _ in range(2):
+                self.send("334 VXNlcm5hbWU6")
+                self.rfile.readline()
+        elif len(args.split()) == 1:
+            self.send("334 ")
+            self.rfile.readline()
+        self.send("235 Authentication successful")
+
+    def _cmd_mail(self, args):
+        self.sender = args.split(':', 1)[1].strip().split()[0].strip('<>')
+        self.recipients = []
+        self.send("250 OK")
+
+    def _cmd_rcpt(self, args):
+        recipient = args.split(':', 1)[1].strip().strip('<>')
+        if recipient in self.server.standin.refused:
+            self.send("550 No such user")
+            return
+        self.recipients.append(recipient)
+        self.send("250 OK")
+
+    def _cmd_data(self, args):
+        server = self.server.standin
+        self.send("354 End data with <CR><LF>.<CR><LF>")
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line == b'.\r\n':
+                break
+            lines.append(line[1:] if line.startswith(b'..') else line)
+        with server.lock:
+            server.messages.append((self.sender, list(self.recipients), b''.join(lines)))
+        self.sender = None
+        self.recipients = []
+        self.send("250 OK queued")
+
+    def _cmd_rset(self, args):
+        self.sender = None
+        self.recipients = []
+        self.send("250 OK")
+
+    def _cmd_noop(self, args):
+        self.send("250 OK")
+
+    def _cmd_quit(self, args):
+        self.send("221 Bye")
+        return False
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPStandIn:
+    """In-memory SMTP server on 127.0.0.1 with an ephemeral port"""
+
+    def __init__(self, latency=0.0):
+        # Delay before every reply, to simulate a remote provider
+        self.latency = latency
+        self.messages = []
+        self.refused = set()
+        self.connections = 0
+        self.command_counts = Counter()
+        self.handlers = set()
+        self.lock = threading.RLock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.standin = self
+        self.port = self._server.server_address[1]
+
+    def reset_counts(self):
+        with self.lock:
+            self.command_counts.clear()
+            self.connections = 0
+
+    def drop_connections(self):
+        """Close every open session from the server side, like an idle timeout"""
+        with self.lock:
+            handlers = list(self.handlers)
+        for handler in handlers:
+            try:
+                handler.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class LocalSMTPPool(SMTPConnectionPool):
+    """SMTPConnectionPool whose sessions go to a stand-in on ``port`` instead of the provider"""
+
+    def __init__(self, port, **kwargs):
+        self.port = port
+        super().__init__(**kwargs)
+
+    def _connect(self, key, email_address, password):
+        server = smtplib.SMTP('127.0.0.1', self.port, timeout=self.timeout)
+        server.login(email_address, password)
+        return server
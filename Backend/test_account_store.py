@@ -0,0 +1,57 @@
+"""
+Email account store: accounts are kept per user with the first one as the
+default, duplicates are refused, and the legacy pickle is migrated once.
+"""
+import os
+import pickle
+import threading
+
+import pytest
+
+from account_store import AccountStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AccountStore(str(tmp_path / 'email_accounts.db'))
+
+
+def test_add_and_list_accounts(store):
+    assert store.add_account('alice', 'alice@gmail.com', 'secret1')
+    assert store.add_account('alice', 'alice@work.com', 'secret2')
+    assert not store.add_account('alice', 'alice@gmail.com', 'other')
+    assert store.list_accounts('alice') == [
+        {'email': 'alice@gmail.com', 'isDefault': True},
+        {'email': 'alice@work.com', 'isDefault': False},
+    ]
+    assert store.get_account('alice', 'alice@gmail.com') == {'password': 'secret1', 'isDefault': True}
+    assert store.get_account('bob', 'alice@gmail.com') is None
+    assert store.has_user('alice') and not store.has_user('bob')
+
+
+def test_concurrent_writers(store):
+    threads = [threading.Thread(target=store.add_account, args=(f"user{i % 4}", f"{i}@example.com", 'pw'))
+               for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.count_users() == 4
+    assert sum(len(store.list_accounts(f"user{i}")) for i in range(4)) == 40
+    assert all(sum(a['isDefault'] for a in store.list_accounts(f"user{i}")) == 1 for i in range(4))
+
+
+def test_migrates_legacy_pickle_once(store, tmp_path):
+    pickle_path = str(tmp_path / 'email_accounts.pkl')
+    with open(pickle_path, 'wb') as f:
+        pickle.dump({
+            'alice': {'alice@gmail.com': {'password': 'pw1', 'isDefault': True},
+                      'alice@work.com': {'password': 'pw2', 'isDefault': False}},
+            'bob': {},
+        }, f)
+    assert store.migrate_pickle(pickle_path) == 2
+    assert not os.path.exists(pickle_path) and os.path.exists(pickle_path + '.migrated')
+    assert store.has_user('bob')
+    assert store.get_account('alice', 'alice@work.com') == {'password': 'pw2', 'isDefault': False}
+    assert store.migrate_pickle(pickle_path) == 0
+    assert len(store.list_accounts('alice')) == 2
@@ -0,0 +1,76 @@
+"""
+In-memory audio decoding for speech-to-text: WAV in any common PCM layout
+comes out as mono 16-bit PCM at 16 kHz with the same duration and pitch,
+concurrent decodes do not interfere, and bad uploads raise AudioDecodeError.
+"""
+import io
+import shutil
+import subprocess
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from audio_decode import AudioDecodeError, TARGET_RATE, decode_audio
+
+
+def make_wav(freq, rate=44100, channels=2, width=2, seconds=0.5):
+    t = np.arange(int(rate * seconds)) / rate
+    tone = 0.5 * np.sin(2 * np.pi * freq * t)
+    if width == 1:
+        samples = np.round(tone * 127 + 128).astype(np.uint8).tobytes()
+    elif width == 2:
+        samples = np.round(tone * 32767).astype('<i2').tobytes()
+    else:
+        ints = np.round(tone * (2 ** 23 - 1)).astype('<i4')
+        samples = ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    frames = np.frombuffer(samples, dtype=np.uint8).reshape(-1, width)
+    frames = np.repeat(frames, channels, axis=0).tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+def dominant_frequency(pcm):
+    samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32)
+    spectrum = np.abs(np.fft.rfft(samples))
+    return np.argmax(spectrum) * TARGET_RATE / len(samples)
+
+
+@pytest.mark.parametrize('rate,channels,width', [(44100, 2, 2), (48000, 1, 3), (8000, 1, 1), (16000, 1, 2)])
+def test_wav_is_normalized_to_mono_16k(rate, channels, width):
+    pcm = decode_audio(make_wav(440, rate, channels, width))
+    assert len(pcm) == 2 * int(0.5 * TARGET_RATE)
+    assert abs(dominant_frequency(pcm) - 440) < 5
+    peak = np.abs(np.frombuffer(pcm, dtype='<i2')).max()
+    assert 0.4 * 32767 < peak < 0.6 * 32767
+
+
+def test_concurrent_decodes_are_isolated():
+    uploads = {freq: make_wav(freq) for freq in (300, 500, 700, 900, 1100, 1300)}
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = dict(zip(uploads, pool.map(decode_audio, uploads.values())))
+    for freq, pcm in results.items():
+        assert abs(dominant_frequency(pcm) - freq) < 5
+
+
+def test_unreadable_upload():
+    with pytest.raises(AudioDecodeError):
+        decode_audio(b'')
+    with pytest.raises(AudioDecodeError):
+        decode_audio(b'this is not audio at all')
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="ffmpeg not installed")
+def test_webm_opus_through_ffmpeg():
+    webm = subprocess.run(
+        ['ffmpeg', '-loglevel', 'error', '-i', 'pipe:0', '-c:a', 'libopus', '-f', 'webm', 'pipe:1'],
+        input=make_wav(440, 48000, 1), capture_output=True, check=True).stdout
+    pcm = decode_audio(webm)
+    assert abs(len(pcm) / 2 / TARGET_RATE - 0.5) < 0.05
+    assert abs(dominant_frequency(pcm) - 440) < 5
@@ -0,0 +1,119 @@
+"""
+Mail merge: placeholders are filled per recipient, a batch goes out over a
+few pooled sessions within the provider's per-mailbox rate limit, and only
+finished jobs are forgotten.
+"""
+import threading
+import time
+
+from bulk_mail import BulkSender, RateLimiter, render_messages
+from smtp_standin import SMTPStandIn, LocalSMTPPool
+
+
+def test_render_messages_fills_fields_lazily():
+    recipients = ['a@example.com', {'email': 'b@example.com', 'fields': {'name': 'Bob'}}]
+    messages = render_messages('me@example.com', "Hi {name}", "Dear {name}, {unknown} stays.", recipients)
+    to, msg = next(messages)
+    assert to == 'a@example.com' and msg['Subject'] == "Hi {name}"
+    to, msg = next(messages)
+    assert msg['Subject'] == "Hi Bob"
+    assert msg.get_payload() == "Dear Bob, {unknown} stays."
+
+
+def test_bulk_send_over_pooled_sessions():
+    server = SMTPStandIn().start()
+    sender = BulkSender(LocalSMTPPool(server.port, max_per_key=2), rate_limits={}, default_rate=None, concurrency=2)
+    server.refused.add('bad@example.com')
+    try:
+        recipients = [f"user{i}@example.com" for i in range(20)] + ['bad@example.com']
+        job = sender.send(('testuser', 'me@example.com'), 'me@example.com', 'password',
+                          render_messages('me@example.com', "Hi", "Hello", recipients))
+        assert job['sent'] == 20
+        assert [f['to'] for f in job['failed']] == ['bad@example.com']
+        assert server.command_counts['AUTH'] <= 3
+    finally:
+        server.stop()
+
+
+def test_message_errors_fail_the_job():
+    server = SMTPStandIn().start()
+    sender = BulkSender(LocalSMTPPool(server.port), rate_limits={}, default_rate=None, concurrency=2)
+    try:
+        recipients = ['a@example.com', {'email': 'b@example.com', 'fields': 'not a dict'}, 'c@example.com']
+        job_id = sender.start_job(('testuser', 'me@example.com'), 'me@example.com', 'password',
+                                  render_messages('me@example.com', "Hi", "Hello", recipients), len(recipients))
+        deadline = time.monotonic() + 5
+        while sender.job_status(job_id)['finished_at'] is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        job = sender.job_status(job_id)
+        assert job['status'] == 'failed'
+        assert job['sent'] == 1
+        assert 'error' in job
+    finally:
+        server.stop()
+
+
+def test_rate_limiter_spaces_out_sends():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_each_mailbox_has_its_own_rate_limiter():
+    sender = BulkSender(smtp_pool=None)
+    alice = sender._limiter_for('alice@gmail.com')
+    assert sender._limiter_for('Alice@gmail.com') is alice
+    assert sender._limiter_for('bob@gmail.com') is not alice
+    assert alice.rate == sender._limiter_for('bob@gmail.com').rate == 2.0
+
+
+class BlockingPool:
+    """Stands in for the SMTP pool: sends from blocked@example.com wait for ``release``"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def send_message(self, key, msg, email_address, password):
+        if email_address == 'blocked@example.com':
+            self.release.wait(10)
+
+
+def wait_until_finished(sender, job_id):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = sender.job_status(job_id)
+        if job is None or job['status'] != 'running':
+            return
+        time.sleep(0.01)
+
+
+def test_only_finished_jobs_are_forgotten():
+    pool = BlockingPool()
+    sender = BulkSender(pool, rate_limits={}, default_rate=None, max_jobs=2)
+
+    def start(from_email):
+        messages = render_messages(from_email, "Hi", "Hello", ['a@example.com'])
+        return sender.start_job(('testuser', from_email), from_email, 'password', messages, 1)
+
+    running = [start('blocked@example.com') for _ in range(2)]
+    done = start('free@example.com')
+    wait_until_finished(sender, done)
+    assert sender.job_status(done)['status'] == 'done'
+
+    # Over max_jobs: the new job pushes out the finished one, never a running one
+    newer = start('free@example.com')
+    wait_until_finished(sender, newer)
+    assert sender.job_status(done) is None
+    assert all(sender.job_status(job_id)['status'] == 'running' for job_id in running)
+    assert sender.job_status(newer)['status'] == 'done'
+
+    pool.release.set()
+    for job_id in running:
+        wait_until_finished(sender, job_id)
+    latest = start('free@example.com')
+    wait_until_finished(sender, latest)
+    # Back down to the two most recent jobs
+    assert [sender.job_status(job_id) for job_id in running] == [None, None]
+    assert sender.job_status(newer)['status'] == sender.job_status(latest)['status'] == 'done'
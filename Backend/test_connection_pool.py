@@ -0,0 +1,137 @@
+"""
+Keyed connection pool with fake connections: idle sessions are health
+checked after keepalive_interval, reaped after idle_timeout, and a session
+that drops mid-call is replaced and the call retried, while an ordinary
+error reply leaves the session in the pool.
+"""
+import pytest
+
+from connection_pool import KeyedConnectionPool, PoolTimeoutError
+
+KEY = ('testuser', 'user@example.com')
+
+
+class Dropped(ConnectionError):
+    """The fake server closed the connection"""
+
+
+class Refused(Exception):
+    """The fake server answered a command with an error"""
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+        self.checks = 0
+
+
+class FakePool(KeyedConnectionPool):
+    disconnect_errors = (Dropped,)
+    name = "fake"
+
+    def __init__(self, **kwargs):
+        self.opened = []
+        super().__init__(**kwargs)
+
+    def _connect(self, key, password):
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+    def _check(self, conn):
+        conn.checks += 1
+        if not conn.alive:
+            raise Dropped("NOOP failed")
+
+    def _close(self, conn):
+        conn.closed = True
+
+
+def age(pool, seconds):
+    """Pretend every idle connection was last used ``seconds`` earlier"""
+    with pool._cond:
+        for key, idle in pool._idle.items():
+            pool._idle[key] = [(conn, used - seconds) for conn, used in idle]
+
+
+def test_idle_connection_is_reused_without_a_check():
+    pool = FakePool(keepalive_interval=60)
+    first = pool.run(KEY, lambda conn: conn, 'password')
+    assert pool.run(KEY, lambda conn: conn, 'password') is first
+    assert first.checks == 0 and len(pool.opened) == 1
+
+
+def test_keepalive_checks_and_replaces_a_dead_connection():
+    pool = FakePool(keepalive_interval=60)
+    first = pool.run(KEY, lambda conn: conn, 'password')
+    age(pool, 61)
+    assert pool.run(KEY, lambda conn: conn, 'password') is first
+    assert first.checks == 1
+
+    first.alive = False
+    age(pool, 61)
+    second = pool.run(KEY, lambda conn: conn, 'password')
+    assert second is not first and first.closed
+    assert pool._counts[KEY] == 1
+
+
+def test_reap_closes_only_expired_connections():
+    pool = FakePool(idle_timeout=300, max_per_key=2)
+    old, fresh = pool.acquire(KEY, 'password'), pool.acquire(KEY, 'password')
+    pool.release(KEY, old)
+    age(pool, 301)
+    pool.release(KEY, fresh)
+    pool.reap()
+    assert old.closed and not fresh.closed
+    assert pool._counts[KEY] == 1
+    assert pool.run(KEY, lambda conn: conn, 'password') is fresh
+
+
+def test_dropped_connection_is_reconnected_and_retried():
+    pool = FakePool()
+    calls = []
+
+    def send(conn):
+        calls.append(conn)
+        if conn.number == 0:
+            raise Dropped("connection reset")
+        return "sent"
+
+    assert pool.run(KEY, send, 'password') == "sent"
+    assert [conn.number for conn in calls] == [0, 1]
+    assert calls[0].closed and pool._counts[KEY] == 1
+
+
+def test_retries_give_up_after_the_last_attempt():
+    pool = FakePool()
+
+    def send(conn):
+        raise Dropped("connection reset")
+
+    with pytest.raises(Dropped):
+        pool.run(KEY, send, 'password', retries=2)
+    assert len(pool.opened) == 3
+    assert KEY not in pool._counts
+
+
+def test_error_reply_keeps_the_session_and_is_not_retried():
+    pool = FakePool()
+    calls = []
+
+    def send(conn):
+        calls.append(conn)
+        raise Refused("550 mailbox unavailable")
+
+    with pytest.raises(Refused):
+        pool.run(KEY, send, 'password')
+    assert len(calls) == 1 and not calls[0].closed
+    assert pool.run(KEY, lambda conn: conn, 'password') is calls[0]
+
+
+def test_acquire_times_out_when_every_connection_is_busy():
+    pool = FakePool(max_per_key=1, acquire_timeout=0.1)
+    pool.acquire(KEY, 'password')
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire(KEY, 'password')
@@ -0,0 +1,132 @@
+"""
+Face request batching: a request goes straight to an idle worker, and while
+every worker is busy requests are held until ``max_batch`` have queued or
+``window`` has passed. The worker pool is replaced by one whose jobs finish
+when the test completes them, and face_recognition by a stub.
+"""
+import importlib
+import queue
+import sys
+import time
+import types
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from face_workers import FaceJobTimeoutError
+
+
+class ManualPool:
+    """Stands in for FaceWorkerPool: submitted jobs wait in ``jobs`` until the test completes them"""
+
+    def __init__(self, workers=1, timeout=5):
+        self.workers = workers
+        self.timeout = timeout
+        self.jobs = queue.Queue()
+
+    def submit(self, fn, items, detection_options):
+        job = Future()
+        self.jobs.put((items, job))
+        return job
+
+    def next_job(self, timeout=2):
+        return self.jobs.get(timeout=timeout)
+
+
+class Gallery:
+    """Stands in for FaceGallery.pair_distances(): only 'alice' is registered"""
+
+    def pair_distances(self, usernames, encodings):
+        return np.array([0.25 if name == 'alice' else np.nan for name in usernames])
+
+
+def analysed(items):
+    """What analyze_batch() returns for uploads that each hold one face"""
+    return [{'shape': (10, 10, 3), 'locations': [(0, 5, 5, 0)], 'encodings': [np.zeros(128)]} for _ in items]
+
+
+@pytest.fixture
+def face_batcher(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'face_recognition', types.ModuleType('face_recognition'))
+    monkeypatch.delitem(sys.modules, 'face_pipeline', raising=False)
+    monkeypatch.delitem(sys.modules, 'face_batcher', raising=False)
+    yield importlib.import_module('face_batcher')
+    sys.modules.pop('face_pipeline', None)
+    sys.modules.pop('face_batcher', None)
+
+
+def test_idle_worker_dispatches_at_once(face_batcher):
+    pool = ManualPool()
+    batcher = face_batcher.FaceBatcher(pool, Gallery(), {}, window=10, max_batch=8)
+    start = time.monotonic()
+    future = batcher.submit(b'one')
+    items, job = pool.next_job()
+    # Not held for the 10 s window while the worker is free
+    assert time.monotonic() - start < 2
+    assert items == [(b'one', None)]
+    job.set_result(analysed(items))
+    assert future.result(timeout=2)['locations'] == [(0, 5, 5, 0)]
+
+
+def test_busy_workers_flush_at_max_batch(face_batcher):
+    pool = ManualPool()
+    batcher = face_batcher.FaceBatcher(pool, Gallery(), {}, window=10, max_batch=3)
+    batcher.submit(b'first')
+    first_items, first_job = pool.next_job()
+    futures = [batcher.submit(data) for data in (b'a', b'b', b'c', b'd')]
+    start = time.monotonic()
+    items, job = pool.next_job()
+    assert [data for data, _ in items] == [b'a', b'b', b'c']
+    assert time.monotonic() - start < 2
+    job.set_result(analysed(items))
+    assert all(future.result(timeout=2)['encodings'] for future in futures[:3])
+    assert not futures[3].done()
+    first_job.set_result(analysed(first_items))
+
+
+def test_busy_workers_flush_when_window_expires(face_batcher):
+    pool = ManualPool()
+    batcher = face_batcher.FaceBatcher(pool, Gallery(), {}, window=0.3, max_batch=8)
+    batcher.submit(b'first')
+    pool.next_job()
+    start = time.monotonic()
+    batcher.submit(b'a')
+    batcher.submit(b'b')
+    items, _ = pool.next_job()
+    assert [data for data, _ in items] == [b'a', b'b']
+    assert time.monotonic() - start >= 0.25
+
+
+def test_run_times_out_when_job_never_finishes(face_batcher):
+    pool = ManualPool(timeout=0.2)
+    batcher = face_batcher.FaceBatcher(pool, Gallery(), {})
+    with pytest.raises(FaceJobTimeoutError):
+        batcher.run(b'stuck')
+
+
+def test_results_carry_distances_and_errors(face_batcher):
+    pool = ManualPool()
+    batcher = face_batcher.FaceBatcher(pool, Gallery(), {}, window=10, max_batch=3)
+    batcher.submit(b'first')
+    pool.next_job()
+    futures = [batcher.submit(b'x', 'alice'), batcher.submit(b'y', 'bob'), batcher.submit(b'z', 'alice')]
+    items, job = pool.next_job()
+    results = analysed(items)
+    results[2] = sys.modules['face_pipeline'].ImageDecodeError("Could not decode image")
+    job.set_result(results)
+    assert futures[0].result(timeout=2)['distance'] == 0.25
+    # Not registered
+    assert futures[1].result(timeout=2)['distance'] is None
+    with pytest.raises(ValueError):
+        futures[2].result(timeout=2)
+
+
+def test_failed_job_fails_every_request(face_batcher):
+    pool = ManualPool()
+    batcher = face_batcher.FaceBatcher(pool, Gallery(), {})
+    future = batcher.submit(b'x')
+    _, job = pool.next_job()
+    job.set_exception(RuntimeError("worker died"))
+    with pytest.raises(RuntimeError):
+        future.result(timeout=2)
@@ -0,0 +1,88 @@
+"""
+Burst login: frames are matched in capture order, the first confident match
+wins without reading the rest, otherwise the closest frame wins, unreadable
+frames are skipped and frames past the limit are never looked at.
+face_recognition is replaced by a stub, so these run without dlib.
+"""
+import importlib
+import io
+import sys
+import types
+
+import pytest
+
+CONFIDENT = 0.4
+
+
+class Frame(io.BytesIO):
+    """Uploaded frame that records whether it was read"""
+
+    was_read = False
+
+    def read(self, *args):
+        self.was_read = True
+        return super().read(*args)
+
+
+@pytest.fixture
+def face_burst(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'face_recognition', types.ModuleType('face_recognition'))
+    monkeypatch.delitem(sys.modules, 'face_pipeline', raising=False)
+    monkeypatch.delitem(sys.modules, 'face_burst', raising=False)
+    yield importlib.import_module('face_burst')
+    sys.modules.pop('face_pipeline', None)
+    sys.modules.pop('face_burst', None)
+
+
+def burst(*payloads):
+    return [Frame(payload) for payload in payloads]
+
+
+def matcher(face_burst, distances):
+    """
+    Stands in for authenticate_frame(): each frame's bytes name its distance
+    in ``distances``; b'bad' is undecodable and None means no face found.
+    """
+    def match_frame(data):
+        if data == b'bad':
+            raise face_burst.ImageDecodeError("Could not decode image")
+        distance = distances[data]
+        return {"frame": data.decode(), "authenticated": distance is not None and distance <= 0.5}, distance
+    return match_frame
+
+
+def test_confident_frame_wins_and_skips_the_rest(face_burst):
+    frames = burst(b'a', b'b', b'c')
+    body = face_burst.match_burst(frames, matcher(face_burst, {b'a': 0.45, b'b': 0.3, b'c': 0.1}), 5, CONFIDENT)
+    assert body["frame"] == 'b' and body["frames_processed"] == 2
+    assert not frames[2].was_read
+
+
+def test_closest_frame_wins_without_a_confident_match(face_burst):
+    distances = {b'a': None, b'b': 0.48, b'c': 0.45, b'd': 0.6}
+    body = face_burst.match_burst(burst(b'a', b'b', b'c', b'd'), matcher(face_burst, distances), 5, CONFIDENT)
+    assert body == {"frame": 'c', "authenticated": True, "frames_processed": 4}
+
+
+def test_faceless_frame_only_wins_when_no_frame_has_a_face(face_burst):
+    distances = {b'a': None, b'b': None}
+    body = face_burst.match_burst(burst(b'a', b'b'), matcher(face_burst, distances), 5, CONFIDENT)
+    assert body["frame"] == 'a' and not body["authenticated"]
+
+
+def test_frames_past_the_limit_are_ignored(face_burst):
+    frames = burst(b'a', b'b', b'c', b'd')
+    distances = {b'a': 0.6, b'b': 0.55, b'c': 0.2, b'd': 0.1}
+    body = face_burst.match_burst(frames, matcher(face_burst, distances), 2, CONFIDENT)
+    assert body["frame"] == 'b' and body["frames_processed"] == 2
+    assert not frames[2].was_read and not frames[3].was_read
+
+
+def test_unreadable_frames_are_skipped(face_burst):
+    body = face_burst.match_burst(burst(b'bad', b'a', b'bad'), matcher(face_burst, {b'a': 0.45}), 5, CONFIDENT)
+    assert body["frame"] == 'a' and body["frames_processed"] == 3
+
+
+def test_burst_of_unreadable_frames_is_rejected(face_burst):
+    with pytest.raises(face_burst.ImageDecodeError):
+        face_burst.match_burst(burst(b'bad', b'bad'), matcher(face_burst, {}), 5, CONFIDENT)
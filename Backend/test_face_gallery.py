@@ -0,0 +1,67 @@
+"""
+Face gallery: matrix search agrees with comparing every registered face one
+by one, stays correct through replace/remove, and finds an already
+registered face when someone else tries to register it.
+"""
+import numpy as np
+
+from face_gallery import ENCODING_SIZE, FaceGallery
+
+TOLERANCE = 0.5
+
+
+def random_faces(count, seed=0):
+    rng = np.random.default_rng(seed)
+    # Spread like dlib encodings: distinct people are well over the 0.5 tolerance apart
+    return {f"user{i}": rng.normal(0, 0.1, ENCODING_SIZE) for i in range(count)}
+
+
+def brute_force(faces, probe):
+    return min(((name, float(np.linalg.norm(enc - probe))) for name, enc in faces.items()),
+               key=lambda item: item[1])
+
+
+def test_nearest_matches_brute_force():
+    faces = random_faces(300)
+    gallery = FaceGallery.from_dict(faces)
+    rng = np.random.default_rng(1)
+    for name in ('user0', 'user150', 'user299'):
+        probe = faces[name] + rng.normal(0, 0.01, ENCODING_SIZE)
+        found, distance = gallery.nearest(probe)
+        expected, expected_distance = brute_force(faces, probe)
+        assert found == expected == name
+        assert abs(distance - expected_distance) < 1e-9
+
+
+def test_replace_and_remove_keep_rows_consistent():
+    faces = random_faces(100)
+    gallery = FaceGallery(capacity=4)
+    for name, enc in faces.items():
+        gallery.add(name, enc)
+    faces['user5'] = faces['user5'] + 0.5
+    gallery.add('user5', faces['user5'])
+    for name in ('user0', 'user50', 'user99'):
+        assert gallery.remove(name)
+        del faces[name]
+    assert not gallery.remove('user0')
+
+    assert len(gallery) == 97 and sorted(gallery.keys()) == sorted(faces)
+    for name, enc in faces.items():
+        np.testing.assert_array_equal(gallery[name], enc)
+        found, distance = gallery.nearest(enc)
+        assert found == name and distance < 1e-6
+    np.testing.assert_allclose(gallery.pair_distances(['user5', 'nobody'], [faces['user5']] * 2),
+                               [0.0, np.nan], atol=1e-6)
+
+
+def test_duplicate_registration_is_detected():
+    faces = random_faces(50)
+    gallery = FaceGallery.from_dict(faces)
+    same_person = faces['user7'] + 0.001
+    # Someone new registering user7's face
+    name, distance = gallery.nearest(same_person, exclude='newcomer')
+    assert name == 'user7' and distance < TOLERANCE
+    # user7 re-registering their own face is not a duplicate
+    name, distance = gallery.nearest(same_person, exclude='user7')
+    assert name != 'user7' and distance > TOLERANCE
+    assert FaceGallery().nearest(same_person) == (None, None)
@@ -0,0 +1,103 @@
+"""
+IVF face index: recall against an exact scan stays high, small galleries
+fall back to exact search, the inverted lists follow rows that the gallery
+adds, replaces and moves, and training runs off the gallery lock.
+"""
+import threading
+
+import numpy as np
+import pytest
+
+from face_gallery import ENCODING_SIZE, FaceGallery
+from face_index import ExactIndex, IVFIndex, create_index
+
+
+def clustered_faces(count, clusters=40, seed=0):
+    """Encodings grouped around a few centres, like faces of similar-looking people"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 0.3, (clusters, ENCODING_SIZE))
+    labels = rng.integers(0, clusters, count)
+    return centres[labels] + rng.normal(0, 0.05, (count, ENCODING_SIZE))
+
+
+def test_recall_against_exact_search():
+    matrix = clustered_faces(4000)
+    faces = {f"user{i}": enc for i, enc in enumerate(matrix)}
+    exact = FaceGallery.from_dict(faces)
+    ivf = FaceGallery.from_dict(faces, index=IVFIndex(nlist=32, nprobe=4, min_train_size=1000))
+    assert ivf._index.is_trained
+
+    rng = np.random.default_rng(1)
+    probes = matrix[rng.choice(len(matrix), 200, replace=False)] + rng.normal(0, 0.01, (200, ENCODING_SIZE))
+    hits = sum(ivf.nearest(probe)[0] == exact.nearest(probe)[0] for probe in probes)
+    assert hits / len(probes) >= 0.95
+
+
+def test_small_gallery_falls_back_to_exact_search():
+    index = IVFIndex(min_train_size=1000)
+    gallery = FaceGallery.from_dict({f"user{i}": enc for i, enc in enumerate(clustered_faces(100))}, index=index)
+    assert not index.is_trained
+    assert index.candidates(np.zeros(ENCODING_SIZE), len(gallery)) is None
+
+
+def test_lists_follow_gallery_changes():
+    matrix = clustered_faces(500)
+    gallery = FaceGallery.from_dict({f"user{i}": enc for i, enc in enumerate(matrix)},
+                                    index=IVFIndex(nlist=8, nprobe=8, min_train_size=100))
+    index = gallery._index
+    gallery.add('newcomer', matrix[3] + 0.001)
+    gallery.add('user10', matrix[20] + 0.002)  # re-registered with a different face
+    gallery.remove('user0')  # the last row moves into row 0
+
+    # Probing every list sees exactly the gallery's rows
+    rows = index.candidates(np.zeros(ENCODING_SIZE), len(gallery))
+    assert sorted(rows.tolist()) == list(range(len(gallery)))
+    assert gallery.nearest(matrix[3] + 0.001)[0] == 'newcomer'
+    assert gallery.nearest(matrix[20] + 0.002)[0] == 'user10'
+    assert gallery.nearest(matrix[499])[0] == 'user499'
+
+
+def test_training_runs_in_the_background_and_catches_up(monkeypatch):
+    matrix = clustered_faces(300)
+    gallery = FaceGallery.from_dict({f"user{i}": enc for i, enc in enumerate(matrix[:199])},
+                                    index=IVFIndex(nlist=8, nprobe=8, min_train_size=200))
+    assert not gallery._index.is_trained
+
+    started, release = threading.Event(), threading.Event()
+    train = IVFIndex.train
+
+    def slow_train(index, snapshot):
+        started.set()
+        release.wait(10)
+        train(index, snapshot)
+
+    monkeypatch.setattr(IVFIndex, 'train', slow_train)
+    # The 200th face crosses min_train_size: add() returns while k-means is still running
+    gallery.add('user199', matrix[199])
+    assert started.wait(5)
+    assert gallery.train_index(background=True) is None  # already training
+
+    # The gallery stays usable meanwhile, and these changes must reach the new index
+    assert gallery.nearest(matrix[5])[0] == 'user5'
+    gallery.add('newcomer', matrix[250])
+    gallery.add('user10', matrix[260])
+    gallery.remove('user0')
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'face-index-train':
+            thread.join(10)
+
+    index = gallery._index
+    assert index.is_trained
+    rows = index.candidates(np.zeros(ENCODING_SIZE), len(gallery))
+    assert sorted(rows.tolist()) == list(range(len(gallery)))
+    assert gallery.nearest(matrix[250])[0] == 'newcomer'
+    assert gallery.nearest(matrix[260])[0] == 'user10'
+    assert gallery.nearest(matrix[199])[0] == 'user199'
+
+
+def test_create_index():
+    assert isinstance(create_index('exact'), ExactIndex)
+    assert create_index('ivf', nprobe=2).nprobe == 2
+    with pytest.raises(ValueError):
+        create_index('hnsw')
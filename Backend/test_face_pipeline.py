@@ -0,0 +1,149 @@
+"""
+Face pipeline around the dlib calls: boxes found on a downscaled or cropped
+frame map back to full-resolution coordinates, and batched encoding returns
+the same descriptors as face_recognition.face_encodings() image by image.
+face_recognition and dlib are replaced by stubs, so these run without dlib.
+"""
+import collections
+import importlib
+import sys
+import types
+
+import numpy as np
+import pytest
+
+
+Rectangle = collections.namedtuple('Rectangle', 'left top right bottom')
+
+
+class StubEncoder:
+    """
+    Stands in for dlib's face_recognition_model_v1: the descriptor of a face
+    is derived from its pixels and box. Like old dlib builds, it can be made
+    to reject the batched (list of images, list of detections) overload.
+    """
+
+    def __init__(self, batched=True):
+        self.batched = batched
+        self.calls = []
+
+    @staticmethod
+    def describe(image, box):
+        face = image[box.top:box.bottom, box.left:box.right]
+        return [float(face.mean()), float(face.std()), box.left, box.top, box.right, box.bottom]
+
+    def compute_face_descriptor(self, image, faces, num_jitters=0):
+        if isinstance(image, list):
+            self.calls.append('batch')
+            if not self.batched:
+                raise TypeError("compute_face_descriptor(): incompatible function arguments")
+            return [[self.describe(img, f) for f in image_faces] for img, image_faces in zip(image, faces)]
+        self.calls.append('single')
+        return self.describe(image, faces)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """face_pipeline imported against stub face_recognition and dlib modules the test fills in"""
+    face_recognition = types.ModuleType('face_recognition')
+    face_recognition.api = types.SimpleNamespace(
+        face_encoder=StubEncoder(),
+        # The 5-point predictor's landmarks are stood in for by the box itself
+        pose_predictor_5_point=lambda image, rect: rect,
+    )
+
+    def face_encodings(image, known_face_locations):
+        api = face_recognition.api
+        return [np.array(api.face_encoder.compute_face_descriptor(
+                    image, api.pose_predictor_5_point(image, Rectangle(left, top, right, bottom)), 1))
+                for top, right, bottom, left in known_face_locations]
+
+    face_recognition.face_encodings = face_encodings
+    dlib = types.ModuleType('dlib')
+    dlib.rectangle = Rectangle
+    dlib.full_object_detections = list
+    monkeypatch.setitem(sys.modules, 'face_recognition', face_recognition)
+    monkeypatch.setitem(sys.modules, 'dlib', dlib)
+    monkeypatch.delitem(sys.modules, 'face_pipeline', raising=False)
+    yield importlib.import_module('face_pipeline')
+    sys.modules.pop('face_pipeline', None)
+
+
+def frame_with_face(top, right, bottom, left, width=1920, height=1080):
+    """Black frame with a white box where the "face" is"""
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[top:bottom, left:right] = 255
+    return image
+
+
+detected_on = []  # shapes of the frames the stub detector was given
+
+
+def bright_box_locations(image, number_of_times_to_upsample=1, model='hog'):
+    """Stands in for face_recognition.face_locations: the bounding box of the white pixels"""
+    detected_on.append(image.shape)
+    rows = np.flatnonzero(image.max(axis=(1, 2)) > 127)
+    cols = np.flatnonzero(image.max(axis=(0, 2)) > 127)
+    return [(rows[0], cols[-1] + 1, rows[-1] + 1, cols[0])]
+
+
+@pytest.mark.parametrize('roi_fraction', [None, 0.8])
+def test_boxes_map_back_to_full_resolution(pipeline, roi_fraction):
+    pipeline.face_recognition.face_locations = bright_box_locations
+    detected_on.clear()
+    face = (300, 1100, 700, 800)
+    [box] = pipeline.detect_faces(frame_with_face(*face), detection_width=640, roi_fraction=roi_fraction)
+    assert detected_on[0][1] == 640
+    # One pixel of the downscaled frame is up to 3 full-size pixels
+    assert np.abs(np.array(box) - np.array(face)).max() <= 3
+
+
+def test_small_frames_are_not_upscaled(pipeline):
+    pipeline.face_recognition.face_locations = bright_box_locations
+    detected_on.clear()
+    face = (100, 300, 200, 200)
+    assert pipeline.detect_faces(frame_with_face(*face, width=480, height=360), detection_width=640) == [face]
+    assert detected_on[0][:2] == (360, 480)
+
+
+def test_center_roi_offsets(pipeline):
+    image = np.zeros((1000, 2000, 3), dtype=np.uint8)
+    crop, offset = pipeline.center_roi(image, 0.5)
+    assert crop.shape[:2] == (500, 1000) and offset == (250, 500)
+    assert pipeline.center_roi(image, None)[1] == (0, 0)
+
+
+def encoding_batch():
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (120, 160, 3), dtype=np.uint8) for _ in range(3)]
+    locations = [[(10, 60, 50, 20), (60, 150, 110, 90)], [], [(0, 160, 120, 0)]]
+    return images, locations
+
+
+def test_batched_encodings_match_face_encodings(pipeline):
+    images, locations = encoding_batch()
+    batched = pipeline._encode_batch(images, locations)
+    assert pipeline.face_recognition.api.face_encoder.calls == ['batch']
+    assert [len(e) for e in batched] == [2, 0, 1]
+    for image, image_locations, encodings in zip(images, locations, batched):
+        expected = pipeline.face_recognition.face_encodings(image, image_locations)
+        assert len(encodings) == len(expected)
+        for got, want in zip(encodings, expected):
+            np.testing.assert_array_equal(got, want)
+
+
+def test_encoding_falls_back_without_batch_overload(pipeline):
+    encoder = pipeline.face_recognition.api.face_encoder
+    encoder.batched = False
+    images, locations = encoding_batch()
+    encodings = pipeline._encode_batch(images, locations)
+    # One rejected batch call, then one call per face
+    assert encoder.calls == ['batch', 'single', 'single', 'single']
+    assert [len(e) for e in encodings] == [2, 0, 1]
+    np.testing.assert_array_equal(encodings[2][0], pipeline.face_recognition.face_encodings(images[2], locations[2])[0])
+
+
+def test_encode_batch_without_faces_skips_dlib(pipeline):
+    images, _ = encoding_batch()
+    assert pipeline._encode_batch(images, [[], [], []]) == [[], [], []]
+    assert pipeline.face_recognition.api.face_encoder.calls == []
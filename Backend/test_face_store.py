@@ -0,0 +1,90 @@
+"""
+Append-only face encoding store: appends and tombstones survive a reopen,
+compaction drops dead records, and a crash mid-append (a torn record or log
+line) loses only the write in progress.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from face_gallery import ENCODING_SIZE
+from face_store import FaceEncodingStore
+
+
+def encoding(seed):
+    return np.random.default_rng(seed).random(ENCODING_SIZE, dtype=np.float32)
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    """Opens a store in the test's temporary directory"""
+    return lambda **options: FaceEncodingStore(str(tmp_path / 'face_encodings'), **options)
+
+
+def test_append_delete_and_reopen(make_store):
+    store = make_store()
+    store.append('alice', encoding(1))
+    store.append('bob', encoding(2))
+    store.append('alice', encoding(3))  # re-registration replaces the old record
+    assert store.delete('bob') and not store.delete('bob')
+
+    reopened = FaceEncodingStore(store.prefix)
+    faces = reopened.load()
+    assert list(faces) == ['alice']
+    np.testing.assert_array_equal(faces['alice'], encoding(3))
+    assert reopened.dead_records == 2
+
+
+def test_compaction_keeps_live_encodings(make_store):
+    store = make_store(compact_min_dead=3, compact_ratio=1.0)
+    for i in range(3):
+        store.append('alice', encoding(i))
+    assert store.dead_records == 2
+    # The third replaced record reaches the threshold
+    store.append('alice', encoding(3))
+    assert store.dead_records == 0
+    store.append('bob', encoding(10))
+    store.append('carol', encoding(11))
+    assert os.path.basename(store._data_path) == 'face_encodings.1.f32'
+    assert not os.path.exists(store.prefix + '.0.f32')
+
+    faces = FaceEncodingStore(store.prefix).load()
+    assert sorted(faces) == ['alice', 'bob', 'carol']
+    np.testing.assert_array_equal(faces['alice'], encoding(3))
+    np.testing.assert_array_equal(faces['carol'], encoding(11))
+
+
+def test_torn_record_and_log_line_are_ignored(make_store):
+    store = make_store()
+    store.append('alice', encoding(1))
+    store.append('bob', encoding(2))
+    data_path, index_path = store._data_path, store.index_path
+    store._data_file.close()
+    store._index_file.close()
+
+    # Crash while appending carol: half a record and half a log line made it to disk
+    with open(data_path, 'ab') as f:
+        f.write(encoding(3).tobytes()[:100])
+    with open(index_path, 'ab') as f:
+        f.write(b'{"add": "carol", "ro')
+
+    reopened = FaceEncodingStore(store.prefix)
+    assert sorted(reopened.load()) == ['alice', 'bob']
+    assert os.path.getsize(data_path) == 2 * reopened.record_size
+    # The store keeps working after the repair
+    reopened.append('carol', encoding(3))
+    faces = FaceEncodingStore(store.prefix).load()
+    np.testing.assert_array_equal(faces['carol'], encoding(3))
+    np.testing.assert_array_equal(faces['bob'], encoding(2))
+
+
+def test_log_entry_without_its_record_is_dropped(make_store):
+    store = make_store()
+    store.append('alice', encoding(1))
+    store._data_file.close()
+    store._index_file.close()
+    # A log line whose record never reached the data file
+    with open(store.index_path, 'ab') as f:
+        f.write(b'{"add": "bob", "row": 1}\n')
+    assert list(FaceEncodingStore(store.prefix).load()) == ['alice']
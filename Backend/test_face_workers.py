@@ -0,0 +1,45 @@
+"""
+Face worker pool: all workers are forked by start(), jobs before start() or
+after a worker crash run inline instead of forking from a threaded process.
+"""
+import math
+import os
+
+import face_workers
+from face_workers import FaceWorkerPool
+
+
+def no_models():
+    """Stands in for loading the dlib models in each worker"""
+
+
+def crash():
+    os._exit(1)
+
+
+def test_start_forks_every_worker_up_front(monkeypatch):
+    monkeypatch.setattr(face_workers, '_init_worker', no_models)
+    pool = FaceWorkerPool(workers=2, queue_depth=2, timeout=10)
+    # Not started: runs on the calling thread
+    assert pool.run(os.getpid) == os.getpid()
+    assert pool.status() == {'mode': 'inline', 'workers': 2, 'degraded': False, 'broken_at': None}
+    pool.start()
+    try:
+        assert len(pool._executor._processes) == 2
+        assert pool.run(math.sqrt, 16.0) == 4.0
+        assert pool.run(os.getpid) != os.getpid()
+    finally:
+        pool.shutdown()
+
+
+def test_broken_pool_runs_jobs_inline(monkeypatch):
+    monkeypatch.setattr(face_workers, '_init_worker', no_models)
+    pool = FaceWorkerPool(workers=1, queue_depth=1, timeout=10).start()
+    try:
+        assert pool.status()['mode'] == 'processes' and not pool.status()['degraded']
+        pool.submit(crash).exception(timeout=10)
+        assert pool.run(os.getpid) == os.getpid()
+        assert pool._executor is None
+        assert pool.status()['mode'] == 'inline' and pool.status()['degraded']
+    finally:
+        pool.shutdown()
@@ -0,0 +1,30 @@
+"""
+HTML email bodies converted to speech text: no markup, CSS or script, entities
+decoded, paragraphs kept apart.
+"""
+from html_text import HTMLTextConverter, html_to_text
+
+
+def test_drops_head_style_and_script():
+    html = ("<html><head><title>Promo</title><style>p { color: red; }</style></head>"
+            "<body><script>track();</script><p>Big sale</p></body></html>")
+    assert html_to_text(html) == "Big sale"
+
+
+def test_decodes_entities_and_keeps_paragraphs():
+    html = "<p>Fish&nbsp;&amp;&nbsp;chips at the caf&eacute;</p><p>Line one<br>line two</p><p>A <b>bold</b> move</p>"
+    assert html_to_text(html) == "Fish & chips at the café\n\nLine one\nline two\n\nA bold move"
+
+
+def test_table_cells_are_separated():
+    assert html_to_text("<table><tr><td>Price</td><td>$5</td></tr></table>") == "Price $5"
+
+
+def test_stops_at_max_chars():
+    converter = HTMLTextConverter(max_chars=50)
+    for i in range(1000):
+        converter.feed(f"<p>Paragraph number {i} of a very long newsletter.</p>")
+        if converter.full:
+            break
+    assert converter.full and i < 5
+    assert len(converter.text()) == 50
@@ -0,0 +1,119 @@
+"""
+Round-trip test for batched IMAP FETCH against a local IMAP stand-in.
+
+Run with pytest, or directly to print the FETCH counts before and after:
+    python test_imap_fetch.py
+"""
+import email
+import imaplib
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+from imap_standin import IMAPStandIn, make_message
+from mail_reader import fetch_unread_emails, fetch_email_by_uid, compress_message_set, positive_int
+
+
+def start_server(unread=20, read=5):
+    server = IMAPStandIn().start()
+    for i in range(read):
+        server.add_message(make_message(f"read-{i}"), flags=['\\Seen'])
+    for i in range(unread):
+        server.add_message(make_message(i))
+    return server
+
+
+def fetch_one_by_one(mail, limit=20):
+    """The previous fetch loop: one FETCH round trip per unread email"""
+    mail.select('inbox')
+    result, data = mail.search(None, 'UNSEEN')
+    emails = []
+    for e_id in data[0].split()[-limit:]:
+        result, data = mail.fetch(e_id, '(RFC822)')
+        emails.append(email.message_from_bytes(data[0][1])['subject'])
+    return emails
+
+
+def count_fetches(reader, unread, limit):
+    server = start_server(unread=unread)
+    try:
+        mail = imaplib.IMAP4('127.0.0.1', server.port)
+        mail.login('user@example.com', 'password')
+        server.reset_counts()
+        emails = reader(mail, limit=limit)
+        mail.logout()
+        return server.command_counts['FETCH'], emails
+    finally:
+        server.stop()
+
+
+def test_compress_message_set():
+    assert compress_message_set([b'1', b'5', b'9', b'10', b'11', b'12']) == '1,5,9:12'
+    assert compress_message_set(['3']) == '3'
+
+
+def test_single_fetch_round_trip():
+    fetches, emails = count_fetches(fetch_unread_emails, unread=20, limit=20)
+    assert fetches == 1
+    assert [e['subject'] for e in emails] == [f"Subject {i}" for i in range(20)]
+    assert emails[0]['from'] == "sender0@example.com"
+    assert emails[0]['body'] == "Body of message 0"
+
+
+def test_round_trips_do_not_grow_with_mailbox():
+    fetches, emails = count_fetches(fetch_unread_emails, unread=200, limit=200)
+    assert fetches == 1
+    assert len(emails) == 200
+
+
+def test_summary_mode_skips_attachments_and_keeps_unread():
+    server = IMAPStandIn().start()
+    try:
+        msg = MIMEMultipart()
+        msg['From'] = "sender@example.com"
+        msg['Subject'] = "Quarterly report"
+        msg.attach(MIMEText("Please find the report attached."))
+        msg.attach(MIMEApplication(b"\0" * 2_000_000, Name="report.bin"))
+        server.add_message(msg.as_bytes().replace(b'\n', b'\r\n'))
+        
+        mail = imaplib.IMAP4('127.0.0.1', server.port)
+        mail.login('user@example.com', 'password')
+        emails = fetch_unread_emails(mail, mode='summary', preview_bytes=1024)
+        assert emails[0]['subject'] == "Quarterly report"
+        assert emails[0]['body'] == "Please find the report attached."
+        assert emails[0]['truncated'] and emails[0]['size'] > 2_000_000
+        
+        # PEEK left it unread, so a second summary read still sees it
+        assert len(fetch_unread_emails(mail, mode='summary')) == 1
+        
+        full = fetch_email_by_uid(mail, emails[0]['uid'], mark_seen=False)
+        assert full['body'] == "Please find the report attached."
+        mail.logout()
+    finally:
+        server.stop()
+
+
+def test_uid_must_be_a_positive_int():
+    assert positive_int(7) == 7 and positive_int("42") == 42
+    for bad in (0, -1, True, 1.5, "", "1:*", "1 (FLAGS)\r\nA1 STORE 1:* +FLAGS (\\Deleted)", None, [1]):
+        assert positive_int(bad) is None
+    server = start_server(unread=2)
+    try:
+        mail = imaplib.IMAP4('127.0.0.1', server.port)
+        mail.login('user@example.com', 'password')
+        server.reset_counts()
+        with pytest.raises(ValueError):
+            fetch_email_by_uid(mail, "1 (FLAGS)\r\nA1 STORE 1:* +FLAGS (\\Deleted)")
+        assert server.command_counts['STORE'] == 0 and server.command_counts['FETCH'] == 0
+        mail.logout()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    for count in (20, 200):
+        before, _ = count_fetches(fetch_one_by_one, unread=count, limit=count)
+        after, _ = count_fetches(fetch_unread_emails, unread=count, limit=count)
+        print(f"{count} unread emails: {before} FETCH round trips before, {after} after")
@@ -0,0 +1,124 @@
+"""
+Outbound mail queue: messages are accepted immediately, retried with backoff
+while the provider fails, and give up at once on permanent SMTP errors.
+"""
+import smtplib
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+from mail_queue import MailQueue, PermanentDeliveryError
+
+
+def make_message(to='friend@example.com'):
+    msg = MIMEText("Hello")
+    msg['From'] = 'user@example.com'
+    msg['To'] = to
+    msg['Subject'] = 'Hi'
+    return msg
+
+
+def wait_for_status(queue, message_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if queue.status(message_id)['status'] == status:
+            return queue.status(message_id)
+        time.sleep(0.02)
+    raise AssertionError(f"{message_id} is {queue.status(message_id)['status']}, expected {status}")
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / 'mail_queue.db')
+
+
+@pytest.fixture
+def make_queue(queue_path):
+    """Starts a queue on the test's database with a short retry delay"""
+    return lambda deliver, **options: MailQueue(queue_path, deliver, base_delay=0.05, **options).start()
+
+
+def test_retries_transient_failures(make_queue):
+    attempts = []
+
+    def deliver(username, from_email, raw):
+        attempts.append(raw)
+        if len(attempts) < 3:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+    queue = make_queue(deliver)
+    message_id = queue.enqueue('testuser', 'user@example.com', make_message())
+    status = wait_for_status(queue, message_id, 'sent')
+    assert status['attempts'] == 3 and status['last_error'] is None
+    assert b'Subject: Hi' in attempts[-1]
+
+
+def test_permanent_failure_is_not_retried(make_queue):
+    def deliver(username, from_email, raw):
+        raise smtplib.SMTPRecipientsRefused({'nobody@example.com': (550, b'No such user')})
+
+    queue = make_queue(deliver)
+    message_id = queue.enqueue('testuser', 'user@example.com', make_message('nobody@example.com'))
+    status = wait_for_status(queue, message_id, 'failed')
+    assert status['attempts'] == 1
+
+
+def test_permanent_delivery_error_is_not_retried(make_queue):
+    def deliver(username, from_email, raw):
+        raise PermanentDeliveryError("Sender account no longer exists")
+
+    queue = make_queue(deliver)
+    message_id = queue.enqueue('testuser', 'user@example.com', make_message())
+    status = wait_for_status(queue, message_id, 'failed')
+    assert status['attempts'] == 1
+
+
+def test_gives_up_after_max_attempts(make_queue):
+    def deliver(username, from_email, raw):
+        raise ConnectionRefusedError("provider down")
+
+    queue = make_queue(deliver, max_attempts=3)
+    message_id = queue.enqueue('testuser', 'user@example.com', make_message())
+    status = wait_for_status(queue, message_id, 'failed')
+    assert status['attempts'] == 3 and 'provider down' in status['last_error']
+
+
+def test_two_queues_on_one_file_send_each_message_once(queue_path):
+    sent = []
+
+    def deliver(username, from_email, raw):
+        sent.append(raw)
+
+    # Stand-ins for two server processes (the debug reloader, several workers)
+    first = MailQueue(queue_path, deliver, workers=3)
+    second = MailQueue(queue_path, deliver, workers=3)
+    ids = [first.enqueue('testuser', 'user@example.com', make_message(f"friend{i}@example.com"))
+           for i in range(200)]
+    first.start()
+    second.start()
+    for message_id in ids:
+        wait_for_status(first, message_id, 'sent')
+    assert len(sent) == 200
+
+
+def test_recent_sending_rows_are_left_to_their_process(queue_path):
+    queue = MailQueue(queue_path, lambda *args: None)
+    message_id = queue.enqueue('testuser', 'user@example.com', make_message())
+    assert queue._claim()['id'] == message_id
+    # Another process starting now must not take over a message being sent
+    MailQueue(queue_path, lambda *args: None)
+    assert queue.status(message_id)['status'] == 'sending'
+    MailQueue(queue_path, lambda *args: None, stale_after=0)
+    assert queue.status(message_id)['status'] == 'queued'
+
+
+def test_workers_requeue_stale_rows_while_running(queue_path):
+    stopped = MailQueue(queue_path, lambda *args: None)
+    message_id = stopped.enqueue('testuser', 'user@example.com', make_message())
+    # A process claims the message and stops before delivering it
+    assert stopped._claim()['id'] == message_id
+    sent = []
+    queue = MailQueue(queue_path, lambda *args: sent.append(args), stale_after=0.2).start()
+    wait_for_status(queue, message_id, 'sent')
+    assert len(sent) == 1
@@ -0,0 +1,86 @@
+"""
+Incremental mailbox sync against a local IMAP stand-in: the second read of an
+unchanged mailbox must not download anything, and later reads only fetch the
+new UIDs.
+"""
+import imaplib
+
+import pytest
+
+from imap_standin import IMAPStandIn, make_message
+from mail_sync import MailboxSync
+
+KEY = ('testuser', 'user@example.com')
+
+
+@pytest.fixture
+def run_sync(tmp_path):
+    """
+    Starts a stand-in with five unread messages and a logged-in client; both
+    are shut down after the test.
+    """
+    started = []
+
+    def run(capabilities):
+        server = IMAPStandIn(capabilities=capabilities).start()
+        sync = MailboxSync(str(tmp_path / 'mail_cache.db'))
+        for i in range(5):
+            server.add_message(make_message(i))
+        mail = imaplib.IMAP4('127.0.0.1', server.port)
+        started.append((server, mail))
+        mail.login('user@example.com', 'password')
+        return server, sync, mail
+
+    yield run
+    for server, mail in started:
+        mail.logout()
+        server.stop()
+
+
+def test_sync_fetches_only_new_uids(run_sync):
+    server, sync, mail = run_sync(('IMAP4rev1',))
+    assert [m['subject'] for m in sync.sync_unread(mail, KEY)] == [f"Subject {i}" for i in range(5)]
+    assert server.command_counts['FETCH'] == 1
+
+    server.reset_counts()
+    assert len(sync.sync_unread(mail, KEY)) == 5
+    assert server.command_counts['FETCH'] == 0
+
+    server.add_message(make_message(5))
+    server.set_flags(1, ['\\Seen'])
+    server.reset_counts()
+    emails = sync.sync_unread(mail, KEY)
+    assert [m['subject'] for m in emails] == [f"Subject {i}" for i in range(1, 6)]
+    assert server.command_counts['FETCH'] == 1
+
+
+def test_condstore_skips_search_when_unchanged(run_sync):
+    server, sync, mail = run_sync(('IMAP4rev1', 'CONDSTORE'))
+    sync.sync_unread(mail, KEY)
+    server.reset_counts()
+    assert len(sync.sync_unread(mail, KEY)) == 5
+    assert server.command_counts['SEARCH'] == 0
+    assert server.command_counts['FETCH'] == 0
+
+
+def test_uidvalidity_change_resets_cache(run_sync):
+    server, sync, mail = run_sync(('IMAP4rev1',))
+    sync.sync_unread(mail, KEY)
+    server.uidvalidity += 1
+    server.reset_counts()
+    assert len(sync.sync_unread(mail, KEY)) == 5
+    assert server.command_counts['FETCH'] == 1
+
+
+def test_larger_limit_on_unchanged_mailbox_goes_to_the_server(run_sync):
+    server, sync, mail = run_sync(('IMAP4rev1', 'CONDSTORE'))
+    assert [m['subject'] for m in sync.sync_unread(mail, KEY, limit=2)] == ["Subject 3", "Subject 4"]
+    server.reset_counts()
+    assert [m['subject'] for m in sync.sync_unread(mail, KEY, limit=5)] == [f"Subject {i}" for i in range(5)]
+    assert server.command_counts['FETCH'] == 1
+
+    # A smaller limit afterwards is served from the cache without shrinking it
+    server.reset_counts()
+    assert len(sync.sync_unread(mail, KEY, limit=2)) == 2
+    assert len(sync.sync_unread(mail, KEY, limit=5)) == 5
+    assert server.command_counts['FETCH'] == 0
@@ -0,0 +1,121 @@
+"""
+New-mail notifications against a local IMAP stand-in, both through IDLE and
+through the polling fallback used beyond the IDLE connection cap.
+"""
+import imaplib
+import socket
+import threading
+import time
+
+from imap_standin import IMAPStandIn, LocalIMAPPool, make_message, wait_for
+from mail_watcher import MailWatcher, idle_wait
+
+KEY = ('testuser', 'user@example.com')
+
+
+def make_watcher(server, **options):
+    def connect(email_address, password):
+        mail = imaplib.IMAP4('127.0.0.1', server.port)
+        mail.login(email_address, password)
+        return mail
+    return MailWatcher(connect, LocalIMAPPool(server.port), reconnect_delay=0.1, **options)
+
+
+def test_idle_pushes_new_mail():
+    server = IMAPStandIn(capabilities=('IMAP4rev1', 'IDLE')).start()
+    server.add_message(make_message(0))
+    watcher = make_watcher(server, max_idle=1, idle_timeout=30)
+    try:
+        events = watcher.subscribe(KEY, KEY[1], 'password')
+        assert wait_for(lambda: server.idlers)
+        server.add_message(make_message(1))
+        event = events.get(timeout=5)
+        assert event == {'type': 'new-mail', 'email': KEY[1], 'count': 1}
+        assert server.command_counts['IDLE'] >= 1
+        # One IDLE session and no polling while waiting
+        assert server.command_counts['NOOP'] == 0
+        
+        watcher.unsubscribe(KEY, events)
+        assert wait_for(lambda: server.command_counts['LOGOUT'] == 1)
+    finally:
+        server.stop()
+
+
+def test_polls_beyond_idle_cap():
+    server = IMAPStandIn(capabilities=('IMAP4rev1', 'IDLE')).start()
+    watcher = make_watcher(server, max_idle=0, poll_interval=0.1)
+    try:
+        events = watcher.subscribe(KEY, KEY[1], 'password')
+        assert wait_for(lambda: server.command_counts['EXAMINE'] >= 1)
+        server.add_message(make_message(0))
+        assert events.get(timeout=5)['count'] == 1
+        assert server.command_counts['IDLE'] == 0
+        watcher.unsubscribe(KEY, events)
+    finally:
+        server.stop()
+
+
+class SocketSession:
+    """Just the parts of an imaplib session idle_wait uses, over a plain socket"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.file.readline()
+
+
+def test_idle_reads_exists_that_arrived_with_other_responses():
+    client, server = socket.socketpair()
+
+    def serve():
+        lines = server.makefile('rb')
+        tag = lines.readline().split(b' ')[0]
+        # EXPUNGE and EXISTS in the same packet as the continuation
+        server.sendall(b'+ idling\r\n* 3 EXPUNGE\r\n* 4 EXISTS\r\n')
+        lines.readline()  # DONE
+        server.sendall(tag + b' OK IDLE terminated\r\n')
+
+    threading.Thread(target=serve, daemon=True).start()
+    start = time.monotonic()
+    assert idle_wait(SocketSession(client), timeout=3) == 4
+    assert time.monotonic() - start < 1
+    client.close()
+    server.close()
+
+
+def test_refused_login_stops_the_watch():
+    server = IMAPStandIn(capabilities=('IMAP4rev1', 'IDLE')).start()
+    server.refused_logins.add(KEY[1])
+    watcher = make_watcher(server, max_idle=1)
+    try:
+        events = watcher.subscribe(KEY, KEY[1], 'password')
+        assert events.get(timeout=5) == {'type': 'login-failed', 'email': KEY[1]}
+        assert watcher.login_failed(KEY, 'password')
+        assert not watcher.login_failed(KEY, 'new password')
+        time.sleep(0.3)
+        assert server.command_counts['LOGIN'] == 1
+    finally:
+        server.stop()
+
+
+def test_reconnects_back_off():
+    attempts = []
+
+    def connect(email_address, password):
+        attempts.append(time.monotonic())
+        raise ConnectionRefusedError("server down")
+
+    watcher = MailWatcher(connect, None, max_idle=1, reconnect_delay=0.05, max_reconnect_delay=0.2)
+    events = watcher.subscribe(KEY, KEY[1], 'password')
+    try:
+        assert wait_for(lambda: len(attempts) >= 5)
+        gaps = [b - a for a, b in zip(attempts, attempts[1:])]
+        assert gaps[0] < gaps[2]
+        assert gaps[2] >= 0.15
+    finally:
+        watcher.unsubscribe(KEY, events)
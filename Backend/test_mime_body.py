@@ -0,0 +1,67 @@
+"""
+Body extraction from MIME messages: the first text part is found without
+decoding attachments, and memory stays flat however big the message is.
+"""
+import tracemalloc
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from mail_reader import parse_email
+from mime_body import extract_body
+
+
+def make_message(attachment_size, text="Hello there, see the attached report.", html=None, attachment_first=False):
+    msg = MIMEMultipart('mixed')
+    msg['From'] = "sender@example.com"
+    msg['Subject'] = "Quarterly report"
+    body = MIMEMultipart('alternative')
+    body.attach(MIMEText(text, 'plain', 'utf-8'))
+    if html is not None:
+        body.attach(MIMEText(html, 'html', 'utf-8'))
+    attachment = MIMEApplication(b'\x00\xff' * (attachment_size // 2), Name='report.bin')
+    attachment['Content-Disposition'] = 'attachment; filename="report.bin"'
+    if attachment_first:
+        msg.attach(attachment)
+        msg.attach(body)
+    else:
+        msg.attach(body)
+        msg.attach(attachment)
+    return msg.as_bytes()
+
+
+def test_extracts_first_text_part():
+    parsed = parse_email(make_message(1024, text="Café opens at nine."))
+    assert parsed == {"from": "sender@example.com", "subject": "Quarterly report", "date": None,
+                      "body": "Café opens at nine."}
+
+
+def test_text_after_attachment():
+    _, body, content_type, truncated = extract_body(make_message(100_000, attachment_first=True))
+    assert body.strip() == "Hello there, see the attached report."
+    assert content_type == 'text/plain' and not truncated
+
+
+def test_html_only_message():
+    msg = MIMEText("<html><body><p>Hi <b>Bob</b></p></body></html>", 'html')
+    msg['From'] = "a@example.com"
+    msg['Subject'] = "Hi"
+    assert parse_email(msg.as_bytes())['body'] == "Hi Bob"
+
+
+def test_caps_body_length():
+    _, body, _, truncated = extract_body(make_message(10, text="word " * 10_000), max_chars=100)
+    assert len(body) == 100 and truncated
+
+
+def test_memory_does_not_grow_with_attachment():
+    peaks = []
+    for size in (1_000_000, 20_000_000):
+        raw = make_message(size, attachment_first=True)
+        tracemalloc.start()
+        extract_body(raw)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    # Only a line at a time is held, never the decoded attachment
+    assert peaks[1] < 2 * peaks[0] + 100_000
+    assert peaks[1] < 1_000_000
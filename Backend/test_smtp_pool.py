@@ -0,0 +1,72 @@
+"""
+Pooled SMTP sending against a local SMTP stand-in: consecutive emails share
+one authenticated session, and a session the server dropped is replaced
+without losing the message.
+"""
+import smtplib
+from email.mime.text import MIMEText
+
+import pytest
+
+from smtp_pool import smtp_server_for
+from smtp_standin import SMTPStandIn, LocalSMTPPool
+
+KEY = ('testuser', 'user@example.com')
+
+
+def make_message(i, to='friend@example.com'):
+    msg = MIMEText(f"Message {i}")
+    msg['From'] = KEY[1]
+    msg['To'] = to
+    msg['Subject'] = f"Subject {i}"
+    return msg
+
+
+def test_consecutive_sends_reuse_one_session():
+    server = SMTPStandIn().start()
+    pool = LocalSMTPPool(server.port)
+    try:
+        for i in range(5):
+            pool.send_message(KEY, make_message(i), KEY[1], 'password')
+        assert len(server.messages) == 5
+        assert server.connections == 1
+        assert server.command_counts['AUTH'] == 1
+        assert server.command_counts['RSET'] == 4
+    finally:
+        server.stop()
+
+
+def test_reconnects_after_server_disconnect():
+    server = SMTPStandIn().start()
+    pool = LocalSMTPPool(server.port)
+    try:
+        pool.send_message(KEY, make_message(0), KEY[1], 'password')
+        server.drop_connections()
+        pool.send_message(KEY, make_message(1), KEY[1], 'password')
+        assert len(server.messages) == 2
+        assert server.connections == 2
+    finally:
+        server.stop()
+
+
+def test_refused_recipient_is_not_retried():
+    server = SMTPStandIn().start()
+    server.refused.add('nobody@example.com')
+    pool = LocalSMTPPool(server.port)
+    try:
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            pool.send_message(KEY, make_message(0, to='nobody@example.com'), KEY[1], 'password')
+        assert server.connections == 1
+        # The session survives the refusal and is reused for the next message
+        pool.send_message(KEY, make_message(1), KEY[1], 'password')
+        assert len(server.messages) == 1
+        assert server.connections == 1
+    finally:
+        server.stop()
+
+
+def test_custom_domains_use_office365():
+    assert smtp_server_for('me@gmail.com') == 'smtp.gmail.com'
+    assert smtp_server_for('me@yahoo.com') == 'smtp.mail.yahoo.com'
+    assert smtp_server_for('me@outlook.com') == 'smtp.office365.com'
+    assert smtp_server_for('me@example.org') == 'smtp.office365.com'
@@ -0,0 +1,73 @@
+"""
+TTS clip cache: hits come from memory, clips survive a restart on disk under
+their real format's extension, the disk tier stays under its size limit, and
+concurrent misses render once.
+"""
+import os
+import threading
+import time
+
+from tts_cache import TTSCache, tts_cache_key
+
+
+def test_key_depends_on_every_parameter():
+    base = tts_cache_key("Hello", 'en', False, 'gtts')
+    assert base == tts_cache_key("Hello", 'en', False, 'gtts')
+    assert len({base, tts_cache_key("Hello", 'fr', False, 'gtts'),
+                tts_cache_key("Hello", 'en', True, 'gtts'), tts_cache_key("Hello", 'en', False, 'pyttsx3')}) == 4
+
+
+def test_memory_hit_and_disk_persistence(tmp_path):
+    directory = str(tmp_path)
+    cache = TTSCache(directory)
+    renders = []
+    key = tts_cache_key("No unread emails found.", 'en', False, 'gtts')
+    assert cache.get_or_create(key, lambda: renders.append(1) or b'mp3') == b'mp3'
+    # A new process finds the clip on disk
+    assert TTSCache(directory).get(key) == b'mp3'
+    # With the file gone, the hit can only come from memory
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    assert cache.get_or_create(key, lambda: renders.append(1) or b'other') == b'mp3'
+    assert len(renders) == 1
+
+
+def test_files_are_named_after_the_audio_format(tmp_path):
+    directory = str(tmp_path)
+    cache = TTSCache(directory)
+    cache.get_or_create('spoken', lambda: b'RIFF....WAVE', 'wav')
+    cache.put('online', b'ID3')
+    assert sorted(os.listdir(directory)) == ['online.mp3', 'spoken.wav']
+    restarted = TTSCache(directory, max_memory_bytes=0)
+    assert restarted.get('spoken') == b'RIFF....WAVE'
+    # Re-rendered in another format: the old file goes
+    restarted.put('spoken', b'ID3', 'mp3')
+    assert sorted(os.listdir(directory)) == ['online.mp3', 'spoken.mp3']
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    directory = str(tmp_path)
+    cache = TTSCache(directory, max_memory_bytes=0, max_disk_bytes=250)
+    for i in range(3):
+        cache.put(f"clip{i}", bytes(100))
+        time.sleep(0.01)
+    assert cache.get('clip0') is None
+    assert cache.get('clip2') == bytes(100)
+    assert sum(os.path.getsize(os.path.join(directory, n)) for n in os.listdir(directory)) <= 250
+
+
+def test_concurrent_misses_render_once(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    renders = []
+
+    def render():
+        renders.append(1)
+        time.sleep(0.05)
+        return b'mp3'
+
+    threads = [threading.Thread(target=cache.get_or_create, args=('same', render)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(renders) == 1
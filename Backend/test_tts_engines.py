@@ -0,0 +1,117 @@
+"""
+Pluggable TTS engines: pyttsx3 runs on one dedicated thread no matter how
+many requests call it, and a failing engine falls back to the next one.
+Uses a stand-in for the pyttsx3 driver, so no speech engine or network is needed.
+"""
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from tts_cache import TTSCache
+from tts_engines import Pyttsx3Engine, TTSEngine, synthesize_with_fallback
+
+
+class FakePyttsx3:
+    """Writes a WAV of silence whose length follows the text, like espeak would write speech"""
+
+    def __init__(self):
+        self.properties = {'rate': 200, 'voice': 'default', 'voices': [
+            SimpleNamespace(id='english', languages=[b'\x05en-gb']),
+            SimpleNamespace(id='french', languages=[b'\x05fr-fr']),
+        ]}
+        self.threads = set()
+        self.calls = []
+        self._pending = None
+
+    def getProperty(self, name):
+        return self.properties[name]
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def save_to_file(self, text, path):
+        self._pending = (text, path)
+
+    def runAndWait(self):
+        self.threads.add(threading.current_thread().name)
+        text, path = self._pending
+        self.calls.append((text, self.properties['voice'], self.properties['rate']))
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(b'\x00\x00' * 16 * len(text))
+
+
+class FailingEngine(TTSEngine):
+    name = 'offline-network'
+
+    def synthesize(self, text, lang='en', slow=False):
+        raise ConnectionError("no route to host")
+
+
+def test_pyttsx3_renders_wav_on_one_thread():
+    fake = FakePyttsx3()
+    engine = Pyttsx3Engine(init=lambda: fake, encode=False)
+    assert engine.format == 'wav' and engine.mimetype == 'audio/wav'
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        clips = list(pool.map(lambda i: engine.synthesize(f"Message number {i}"), range(8)))
+    assert all(clip.startswith(b'RIFF') for clip in clips)
+    assert fake.threads == {'pyttsx3'}
+
+    engine.synthesize("Bonjour", lang='fr', slow=True)
+    assert fake.calls[-1] == ("Bonjour", 'french', 140)
+
+
+def test_pyttsx3_encodes_when_an_encoder_is_given():
+    engine = Pyttsx3Engine(init=FakePyttsx3, encode=lambda wav: b'MP3' + wav[:4])
+    assert engine.format == 'mp3'
+    assert engine.synthesize("Hello") == b'MP3RIFF'
+
+
+def test_pyttsx3_unavailable_raises():
+    def init():
+        raise ImportError("No module named 'pyttsx3'")
+
+    with pytest.raises(RuntimeError):
+        Pyttsx3Engine(init=init, encode=False).synthesize("Hello")
+
+
+def test_stuck_pyttsx3_times_out_and_recovers():
+    fake = FakePyttsx3()
+    release = threading.Event()
+    render = fake.runAndWait
+
+    def stuck_on_first_clip():
+        if len(fake.calls) == 0:
+            release.wait(10)
+        render()
+
+    fake.runAndWait = stuck_on_first_clip
+    engine = Pyttsx3Engine(init=lambda: fake, encode=False, timeout=0.2)
+    with pytest.raises(RuntimeError):
+        engine.synthesize("Hello")
+    assert not engine.healthy
+    # Fails at once rather than queueing behind the stuck clip
+    with pytest.raises(RuntimeError, match="not responding"):
+        engine.synthesize("Hello again")
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while not engine.healthy and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert engine.healthy
+    assert engine.synthesize("Back").startswith(b'RIFF')
+
+
+def test_fallback_to_next_engine(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    offline = Pyttsx3Engine(init=FakePyttsx3, encode=False)
+    audio, engine = synthesize_with_fallback([FailingEngine(), offline], "Hello", 'en', False, cache)
+    assert engine is offline and audio.startswith(b'RIFF')
+    with pytest.raises(ConnectionError):
+        synthesize_with_fallback([FailingEngine()], "Hello", 'en', False, cache)
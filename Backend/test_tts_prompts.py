@@ -0,0 +1,74 @@
+"""
+Voice prompt catalog: templates split into reusable segments, pre-warming
+renders every segment once, and a prompt is then assembled from the cache
+with only the unknown part synthesized.
+"""
+import json
+
+from tts_cache import TTSCache, tts_cache_key
+from tts_engines import Pyttsx3Engine, TTSEngine
+from tts_prompts import PromptCatalog, prewarm, synthesize_prompt
+from tts_stream import concat_mp3
+
+CATALOG = PromptCatalog(phrases=["No unread emails found."],
+                        templates=["Email {index} of {total}."], max_number=20)
+
+
+def test_segments_and_plan():
+    assert CATALOG.segments() == ["No unread emails found.", "Email", "of"] + [str(n) for n in range(21)]
+    assert CATALOG.plan("No unread  emails found.") == ["No unread emails found."]
+    assert CATALOG.plan("Email 3 of 12. From: bob@example.com. Subject: Lunch.") == [
+        "Email", "3", "of", "12", "From: bob@example.com. Subject: Lunch."]
+    assert CATALOG.plan("Subject: Lunch.") == ["Subject: Lunch."]
+    assert CATALOG.covers("Email 3 of 12.") and CATALOG.covers("No unread emails found.")
+    assert not CATALOG.covers("Email 3 of 12. Subject: Lunch.")
+    assert not CATALOG.covers("Email 3 of 99.")
+
+
+def test_load_from_file(tmp_path):
+    path = tmp_path / 'prompts.json'
+    path.write_text(json.dumps({'phrases': ["Goodbye."], 'templates': ["{n} new emails."], 'max_number': 2}))
+    catalog = PromptCatalog.load(str(path))
+    assert catalog.segments() == ["Goodbye.", "new emails", "0", "1", "2"]
+    assert PromptCatalog.load().phrases
+
+
+def test_prewarmed_prompt_needs_no_synthesis(tmp_path):
+    cache = TTSCache(str(tmp_path))
+    rendered = []
+
+    def render(text):
+        key = tts_cache_key(text, 'en', False, 'fake.mp3')
+        return cache.get_or_create(key, lambda: rendered.append(text) or f"<{text}>".encode())
+
+    prewarm(CATALOG, render).join()
+    assert len(rendered) == len(CATALOG.segments())
+
+    rendered.clear()
+    audio = concat_mp3([render(part) for part in CATALOG.plan("Email 2 of 5. Subject: Lunch.")])
+    assert audio == b"<Email><2><of><5><Subject: Lunch.>"
+    assert rendered == ["Subject: Lunch."]
+
+
+class FakeGTTS(TTSEngine):
+    name = 'gtts'
+
+    def __init__(self):
+        self.rendered = []
+
+    def synthesize(self, text, lang='en', slow=False):
+        self.rendered.append(text)
+        return f"<{text}>".encode()
+
+
+def test_default_engines_assemble_from_prewarmed_segments(tmp_path):
+    # The default configuration: gTTS, falling back to pyttsx3 that only makes WAV without ffmpeg
+    gtts = FakeGTTS()
+    engines = [gtts, Pyttsx3Engine(init=lambda: None, encode=False)]
+    cache = TTSCache(str(tmp_path))
+    prewarm(CATALOG, lambda text: synthesize_prompt(CATALOG, engines, text, 'en', False, cache)).join()
+
+    gtts.rendered.clear()
+    audio, engine = synthesize_prompt(CATALOG, engines, "Email 3 of 12. From: bob.", 'en', False, cache)
+    assert audio == b"<Email><3><of><12><From: bob.>"
+    assert engine is gtts and gtts.rendered == ["From: bob."]
@@ -0,0 +1,78 @@
+"""
+Sentence-chunked TTS: text splits into speakable chunks, chunks are yielded
+in order, the first one arrives after one render rather than all of them,
+and closing the stream stops rendering.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_stream import PendingStreams, split_sentences, stream_synthesis, strip_id3
+
+
+def test_split_sentences():
+    text = "Hi. Your order has shipped!\n\nIt will arrive on Monday, between nine and five. Thanks"
+    assert split_sentences(text) == [
+        "Hi. Your order has shipped!",
+        "It will arrive on Monday, between nine and five. Thanks",
+    ]
+    long = "word " * 100
+    chunks = split_sentences(long, max_chars=50)
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert ' '.join(chunks) == long.strip()
+    assert split_sentences("  \n ") == []
+
+
+def test_strip_id3():
+    frames = b'\xff\xfb\x90\x00' * 4
+    tag = b'ID3\x04\x00\x00\x00\x00\x00\x05' + b'TAG..'
+    assert strip_id3(tag + frames) == frames
+    assert strip_id3(frames) == frames
+
+
+def test_first_chunk_waits_for_one_render_only():
+    executor = ThreadPoolExecutor(max_workers=4)
+
+    def render(chunk):
+        time.sleep(0.1)
+        return chunk.encode()
+
+    chunks = [f"Sentence {i}." for i in range(8)]
+    start = time.perf_counter()
+    audio = stream_synthesis(chunks, render, executor, lookahead=2)
+    assert next(audio) == b"Sentence 0."
+    assert time.perf_counter() - start < 0.2
+    assert list(audio) == [chunk.encode() for chunk in chunks[1:]]
+    # Three renders overlap, so the whole text takes about a third of the serial time
+    assert time.perf_counter() - start < 0.8 * 0.6
+
+
+def test_closing_the_stream_stops_rendering():
+    executor = ThreadPoolExecutor(max_workers=1)
+    rendered = []
+    lock = threading.Lock()
+
+    def render(chunk):
+        time.sleep(0.02)
+        with lock:
+            rendered.append(chunk)
+        return b''
+
+    audio = stream_synthesis(range(50), render, executor, lookahead=2)
+    next(audio)
+    audio.close()
+    executor.shutdown(wait=True)
+    assert len(rendered) <= 4
+
+
+def test_pending_streams_expire():
+    streams = PendingStreams(ttl=0.05, max_pending=2)
+    first = streams.add({'text': "Hello"})
+    assert streams.get(first) == {'text': "Hello"}
+    # Still valid on a second request (the audio element may re-request)
+    assert streams.get(first) == {'text': "Hello"}
+    time.sleep(0.06)
+    assert streams.get(first) is None
+    ids = [streams.add({'text': str(i)}) for i in range(3)]
+    assert streams.get(ids[0]) is None and streams.get(ids[2]) == {'text': "2"}
+    assert streams.get('unknown') is None
@@ -0,0 +1,113 @@
+"""
+Unified inbox: unread emails of several accounts, each on its own local IMAP
+stand-in, are read in parallel and merged by date; an account that fails or
+does not answer in time is reported without holding back the others.
+"""
+import imaplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+
+from imap_standin import IMAPStandIn
+from mail_reader import fetch_unread_emails, read_accounts_unread
+
+
+def dated_message(subject, date):
+    msg = MIMEText(f"Body of {subject}")
+    msg['From'] = "sender@example.com"
+    msg['Subject'] = subject
+    msg['Date'] = date
+    return msg.as_bytes().replace(b'\n', b'\r\n')
+
+
+def start_server(*messages):
+    server = IMAPStandIn().start()
+    for subject, date in messages:
+        server.add_message(dated_message(subject, date))
+    return server
+
+
+def reader(server, user_email, limit=20):
+    """Summary read of one account, as the unified inbox does it"""
+    def read():
+        mail = imaplib.IMAP4('127.0.0.1', server.port)
+        try:
+            mail.login(user_email, 'password')
+            return fetch_unread_emails(mail, limit=limit, mode='summary')
+        finally:
+            if mail.state != 'LOGOUT':
+                mail.logout()
+    return read
+
+
+def test_accounts_are_merged_by_date():
+    work = start_server(("work-1", "Mon, 06 Oct 2026 09:00:00 +0000"),
+                        ("work-2", "Mon, 06 Oct 2026 14:00:00 +0200"))
+    home = start_server(("home-1", "Mon, 06 Oct 2026 10:30:00 +0000"),
+                        ("home-2", "Sun, 05 Oct 2026 23:00:00 -0500"))
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        emails, errors = read_accounts_unread(executor, {
+            'me@work.example': reader(work, 'me@work.example'),
+            'me@home.example': reader(home, 'me@home.example'),
+        }, timeout=10, limit=20)
+        assert errors == {}
+        # 14:00 +0200 is 12:00 UTC and 23:00 -0500 is 04:00 UTC the next day
+        assert [(m['subject'], m['account']) for m in emails] == [
+            ("home-2", 'me@home.example'),
+            ("work-1", 'me@work.example'),
+            ("home-1", 'me@home.example'),
+            ("work-2", 'me@work.example'),
+        ]
+
+        emails, _ = read_accounts_unread(executor, {
+            'me@work.example': reader(work, 'me@work.example'),
+            'me@home.example': reader(home, 'me@home.example'),
+        }, timeout=10, limit=2)
+        assert [m['subject'] for m in emails] == ["home-1", "work-2"]
+    finally:
+        executor.shutdown()
+        work.stop()
+        home.stop()
+
+
+def test_failed_account_is_reported_next_to_the_others():
+    work = start_server(("work-1", "Mon, 06 Oct 2026 09:00:00 +0000"))
+    work.refused_logins.add('old@work.example')
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        emails, errors = read_accounts_unread(executor, {
+            'me@work.example': reader(work, 'me@work.example'),
+            'old@work.example': reader(work, 'old@work.example'),
+        }, timeout=10, limit=20)
+        assert [(m['subject'], m['account']) for m in emails] == [("work-1", 'me@work.example')]
+        assert list(errors) == ['old@work.example']
+        assert 'AUTHENTICATIONFAILED' in errors['old@work.example']
+    finally:
+        executor.shutdown()
+        work.stop()
+
+
+def test_slow_account_does_not_hold_back_the_answer():
+    work = start_server(("work-1", "Mon, 06 Oct 2026 09:00:00 +0000"))
+    release = threading.Event()
+
+    def stuck():
+        release.wait(10)
+        return [{'subject': "late", 'date': None}]
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        start = time.monotonic()
+        emails, errors = read_accounts_unread(executor, {
+            'me@work.example': reader(work, 'me@work.example'),
+            'slow@example.com': stuck,
+        }, timeout=0.5, limit=20)
+        assert time.monotonic() - start < 5
+        assert [m['subject'] for m in emails] == ["work-1"]
+        assert errors == {'slow@example.com': "Timed out after 0.5s"}
+    finally:
+        release.set()
+        executor.shutdown()
+        work.stop()
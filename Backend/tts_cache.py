@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# File extensions of the audio formats the engines produce
+AUDIO_FORMATS = ('mp3', 'wav')
+
+
+def tts_cache_key(text, lang, slow, engine):
+    """Content address of a synthesized clip: sha256 over everything that changes the audio"""
+    return hashlib.sha256(json.dumps([text, lang, bool(slow), engine]).encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """
+    Two-tier cache of synthesized audio keyed by tts_cache_key().
+
+    The memory tier is an LRU of up to ``max_memory_bytes``; the disk tier
+    keeps one file per clip under ``directory`` up to ``max_disk_bytes``,
+    evicting the least recently used (by mtime, refreshed on every hit).
+    Each file is named after the clip's audio format ('mp3' or 'wav'), as
+    passed to put() / get_or_create() by the engine that rendered it.
+    get_or_create() renders a missing clip once even when several requests
+    ask for it at the same time.
+    """
+
+    def __init__(self, directory, max_memory_bytes=32 * 1024 * 1024, max_disk_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = {}  # key -> (size, last used, format)
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> Event while a clip is being rendered
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith('.tmp'):
+                # Left over from a write that was interrupted
+                os.unlink(os.path.join(directory, name))
+            else:
+                key, _, audio_format = name.rpartition('.')
+                if audio_format not in AUDIO_FORMATS:
+                    continue
+                st = os.stat(os.path.join(directory, name))
+                self._disk[key] = (st.st_size, st.st_mtime, audio_format)
+                self._disk_bytes += st.st_size
+        logger.info(f"TTS cache has {len(self._disk)} clips ({self._disk_bytes / 1e6:.1f} MB) on disk")
+
+    def _path(self, key, audio_format):
+        return os.path.join(self.directory, f"{key}.{audio_format}")
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        if len(data) > self.max_memory_bytes:
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+            if key not in self._disk:
+                return None
+            _, _, audio_format = self._disk[key]
+        path = self._path(key, audio_format)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                size, _, _ = self._disk.pop(key, (0, 0, None))
+                self._disk_bytes -= size
+            return None
+        with self._lock:
+            if key in self._disk:
+                size, _, audio_format = self._disk[key]
+                self._disk[key] = (size, time.time(), audio_format)
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data, audio_format='mp3'):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key, audio_format))
+        except OSError as e:
+            logger.error(f"Could not write TTS clip to disk cache: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        evict = []
+        with self._lock:
+            self._remember(key, data)
+            old_size, _, old_format = self._disk.get(key, (0, 0, audio_format))
+            if old_format != audio_format:
+                evict.append((key, old_format))
+            self._disk[key] = (len(data), time.time(), audio_format)
+            self._disk_bytes += len(data) - old_size
+            if self._disk_bytes > self.max_disk_bytes:
+                for old_key, (size, _, old_format) in sorted(self._disk.items(), key=lambda item: item[1][1]):
+                    if self._disk_bytes <= self.max_disk_bytes:
+                        break
+                    if old_key == key:
+                        continue
+                    del self._disk[old_key]
+                    self._disk_bytes -= size
+                    evict.append((old_key, old_format))
+        for old_key, old_format in evict:
+            try:
+                os.unlink(self._path(old_key, old_format))
+            except OSError:
+                pass
+
+    def get_or_create(self, key, render, audio_format='mp3'):
+        """Cached clip for ``key``, calling ``render()`` to make it (in ``audio_format``) on a miss"""
+        while True:
+            data = self.get(key)
+            if data is not None:
+                return data
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Another request is rendering the same clip; wait for it and re-check
+            pending.wait()
+        try:
+            data = render()
+            self.put(key, data, audio_format)
+            return data
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
@@ -0,0 +1,168 @@
+import io
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from tts_cache import tts_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class TTSEngine:
+    """
+    A speech synthesizer. synthesize() returns the audio bytes for a text,
+    in ``format`` ('mp3' or 'wav'). ``name`` selects the engine in requests.
+    ``healthy`` is False while the engine is known to be unable to answer.
+    """
+    name = None
+    format = 'mp3'
+    healthy = True
+
+    @property
+    def mimetype(self):
+        return 'audio/mpeg' if self.format == 'mp3' else f"audio/{self.format}"
+
+    @property
+    def cache_name(self):
+        # Part of the cache key, so clips from different engines or formats never mix
+        return f"{self.name}.{self.format}"
+
+    def synthesize(self, text, lang='en', slow=False):
+        raise NotImplementedError
+
+
+class GTTSEngine(TTSEngine):
+    """Google Text-to-Speech: good voices, but one network round trip per clip"""
+    name = 'gtts'
+
+    def synthesize(self, text, lang='en', slow=False):
+        from gtts import gTTS
+        mp3_fp = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=slow).write_to_fp(mp3_fp)
+        return mp3_fp.getvalue()
+
+
+def encode_mp3(audio, timeout=60):
+    """Encode WAV (or any format ffmpeg reads) to MP3 through ffmpeg's stdin/stdout"""
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0', '-f', 'mp3', '-q:a', '4', 'pipe:1'],
+        input=audio, capture_output=True, timeout=timeout, check=True)
+    return result.stdout
+
+
+class Pyttsx3Engine(TTSEngine):
+    """
+    Offline synthesis with pyttsx3 (espeak, SAPI5 or NSSpeechSynthesizer).
+
+    pyttsx3 engines are not thread safe and run their own event loop, so one
+    dedicated thread owns the engine and renders the queued texts in turn.
+    pyttsx3 can only save to a file, so each clip goes through a temporary
+    WAV; when ffmpeg is installed it is encoded to MP3, otherwise served as WAV.
+    ``init`` creates the engine (pyttsx3.init by default).
+
+    A clip not rendered within ``timeout`` seconds fails, and the engine is
+    marked unhealthy: later calls fail at once (so the fallback engine takes
+    over) instead of queueing behind a driver that may never return, until
+    the engine thread finishes the clip it is stuck on.
+    """
+    name = 'pyttsx3'
+
+    def __init__(self, init=None, rate=None, encode=None, timeout=30):
+        self._init = init
+        self.rate = rate
+        self.timeout = timeout
+        self.healthy = True
+        if encode is None:
+            encode = encode_mp3 if shutil.which('ffmpeg') else False
+        self._encode = encode
+        self.format = 'mp3' if encode else 'wav'
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def synthesize(self, text, lang='en', slow=False):
+        if not self.healthy:
+            raise RuntimeError("pyttsx3 is not responding")
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='pyttsx3', daemon=True)
+                self._thread.start()
+        future = Future()
+        self._jobs.put((text, lang, slow, future))
+        try:
+            audio = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Still queued: drop it. Rendering: the driver is stuck
+            future.cancel()
+            self.healthy = False
+            logger.error(f"pyttsx3 did not render a clip within {self.timeout}s, marking it unhealthy")
+            raise RuntimeError(f"pyttsx3 took longer than {self.timeout}s")
+        return self._encode(audio) if self._encode else audio
+
+    def _run(self):
+        try:
+            if self._init is None:
+                import pyttsx3
+                self._init = pyttsx3.init
+            engine = self._init()
+            rate = self.rate or engine.getProperty('rate')
+        except Exception as e:
+            logger.error(f"Could not start pyttsx3: {e}")
+            engine, error = None, e
+        voices = {}
+        while True:
+            text, lang, slow, future = self._jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            if engine is None:
+                future.set_exception(RuntimeError(f"pyttsx3 is not available: {error}"))
+                continue
+            fd, path = tempfile.mkstemp(suffix='.wav')
+            os.close(fd)
+            try:
+                if lang not in voices:
+                    voices[lang] = self._voice_for(engine, lang)
+                if voices[lang] is not None:
+                    engine.setProperty('voice', voices[lang])
+                engine.setProperty('rate', int(rate * 0.7) if slow else rate)
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+                with open(path, 'rb') as f:
+                    future.set_result(f.read())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                os.unlink(path)
+                # The driver answered, so it can take new clips again
+                self.healthy = True
+
+    @staticmethod
+    def _voice_for(engine, lang):
+        """Id of the first installed voice for the language, or None for the default voice"""
+        for voice in engine.getProperty('voices'):
+            languages = [l.decode('utf-8', 'ignore') if isinstance(l, bytes) else str(l)
+                         for l in (getattr(voice, 'languages', None) or [])]
+            if any(l.lstrip('\x05').lower().startswith(lang.lower()) for l in languages):
+                return voice.id
+        return None
+
+
+def synthesize_with_fallback(engines, text, lang, slow, cache):
+    """
+    Render text with the first of ``engines`` that succeeds, through the
+    cache. Returns (audio, engine); raises the last error if all fail.
+    """
+    error = None
+    for engine in engines:
+        key = tts_cache_key(text, lang, slow, engine.cache_name)
+        try:
+            return cache.get_or_create(key, lambda: engine.synthesize(text, lang, slow), engine.format), engine
+        except Exception as e:
+            logger.warning(f"TTS engine {engine.name} failed, trying the next one: {e}")
+            error = e
+    raise error
@@ -0,0 +1,158 @@
+import json
+import re
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_engines import synthesize_with_fallback
+from tts_stream import split_sentences, concat_mp3
+
+logger = logging.getLogger(__name__)
+
+# Prompts the voice flow speaks over and over; a TTS_PROMPTS_FILE with the
+# same keys replaces them
+DEFAULT_PROMPTS = {
+    'phrases': [
+        "No unread emails found.",
+        "Email sent successfully!",
+        "Email queued for sending!",
+        "Please say the recipient's email address.",
+        "Please say the subject of your email.",
+        "Please say your message.",
+        "Should I send this email? Say yes or no.",
+        "Email cancelled.",
+        "Sorry, I didn't catch that. Please try again.",
+    ],
+    # {placeholders} are numbers, spoken from their own cached clips
+    'templates': [
+        "Email {index} of {total}.",
+        "You have {count} unread emails.",
+    ],
+    'max_number': 50,
+}
+
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+def _segment(literal):
+    """Speakable part of the text between placeholders ('Email ', ' of ', '.')"""
+    return literal.strip(' \t\n.,;:!?')
+
+
+class PromptCatalog:
+    """
+    The fixed prompts worth having in the TTS cache before anyone asks.
+
+    ``phrases`` are whole sentences. ``templates`` are sentences with numeric
+    placeholders; the text around the placeholders and the numbers up to
+    ``max_number`` are separate segments, so "Email 3 of 12." is assembled
+    from the clips for "Email", "3", "of" and "12" without synthesis.
+    """
+
+    def __init__(self, phrases=(), templates=(), max_number=0):
+        self.phrases = list(phrases)
+        self._phrases = set(self.phrases)
+        self.templates = list(templates)
+        self.max_number = max_number
+        self._patterns = []
+        for template in self.templates:
+            pieces = _PLACEHOLDER.split(template)
+            # Even pieces are literal text, odd ones placeholder names
+            regex = ''.join(re.escape(piece) if i % 2 == 0 else r'(\d+)' for i, piece in enumerate(pieces))
+            self._patterns.append((re.compile(regex), pieces[0::2]))
+        self._segments = set(self.segments())
+
+    @classmethod
+    def load(cls, path=None):
+        """Catalog from a JSON file, or DEFAULT_PROMPTS"""
+        prompts = DEFAULT_PROMPTS
+        if path:
+            with open(path, encoding='utf-8') as f:
+                prompts = json.load(f)
+        return cls(prompts.get('phrases', ()), prompts.get('templates', ()), prompts.get('max_number', 0))
+
+    def segments(self):
+        """Every text to render ahead of time"""
+        texts = list(self.phrases)
+        for _, literals in self._patterns:
+            texts.extend(segment for segment in map(_segment, literals) if segment)
+        texts.extend(str(n) for n in range(self.max_number + 1))
+        return list(dict.fromkeys(texts))
+
+    def _match(self, sentence):
+        for pattern, literals in self._patterns:
+            match = pattern.fullmatch(sentence)
+            if match:
+                parts = []
+                for literal, number in zip(literals, match.groups() + (None,)):
+                    parts.extend(filter(None, [_segment(literal), number]))
+                return parts
+        return None
+
+    def plan(self, text):
+        """
+        Split text into the pieces to render and concatenate, in order:
+        sentences matching a template become their segments, catalog phrases
+        stay whole, and runs of other sentences are kept together.
+        """
+        text = ' '.join(text.split())
+        if text in self._phrases:
+            return [text]
+        parts = []
+        other = []
+        for sentence in split_sentences(text, max_chars=len(text) + 1, min_chars=0):
+            segments = [sentence] if sentence in self._phrases else self._match(sentence)
+            if segments is None:
+                other.append(sentence)
+                continue
+            if other:
+                parts.append(' '.join(other))
+                other = []
+            parts.extend(segments)
+        if other:
+            parts.append(' '.join(other))
+        return parts
+
+    def covers(self, text):
+        """Whether text is made only of catalog segments, so it carries nothing private"""
+        return all(part in self._segments for part in self.plan(text))
+
+
+def synthesize_prompt(catalog, engines, text, lang, slow, cache):
+    """
+    Render text through the cache, returning (audio, engine). Sentences in
+    the catalog are assembled from their cached clips by the MP3 engines
+    among ``engines`` (WAV clips cannot be concatenated) and only the rest
+    is synthesized; if no MP3 engine can do it, the text is rendered whole.
+    """
+    parts = catalog.plan(text)
+    mp3_engines = [engine for engine in engines if engine.format == 'mp3']
+    if len(parts) > 1 and mp3_engines:
+        try:
+            clips = [synthesize_with_fallback(mp3_engines, part, lang, slow, cache) for part in parts]
+            return concat_mp3([audio for audio, _ in clips]), clips[-1][1]
+        except Exception as e:
+            logger.warning(f"Could not assemble prompt from segments, rendering it whole: {e}")
+    return synthesize_with_fallback(engines, text, lang, slow, cache)
+
+
+def prewarm(catalog, render, workers=2):
+    """Render every catalog segment with ``render(text)`` from a background thread"""
+    def run():
+        start = time.perf_counter()
+        texts = catalog.segments()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts-prewarm') as executor:
+            for text, future in [(text, executor.submit(render, text)) for text in texts]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"Could not pre-render prompt {text!r}: {e}")
+                    failed += 1
+        logger.info(f"Pre-rendered {len(texts) - failed}/{len(texts)} voice prompts "
+                    f"in {time.perf_counter() - start:.1f}s")
+
+    thread = threading.Thread(target=run, name='tts-prewarm', daemon=True)
+    thread.start()
+    return thread
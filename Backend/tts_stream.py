@@ -0,0 +1,137 @@
+import re
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+|\s*\n+\s*')
+_CLAUSE_END = re.compile(r'(?<=[,)])\s+')
+
+
+def _split_long(sentence, max_chars):
+    """Break a sentence longer than max_chars at commas, else at spaces"""
+    pieces = []
+    current = ''
+    for part in _CLAUSE_END.split(sentence):
+        if len(part) > max_chars:
+            words = part.split(' ')
+        else:
+            words = [part]
+        for word in words:
+            if current and len(current) + 1 + len(word) > max_chars:
+                pieces.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_sentences(text, max_chars=200, min_chars=20):
+    """
+    Split text into chunks to synthesize one at a time: one sentence each,
+    with sentences shorter than ``min_chars`` joined to the next and
+    sentences longer than ``max_chars`` broken at clause or word boundaries.
+    """
+    chunks = []
+    pending = ''
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = ' '.join(sentence.split())
+        if not sentence:
+            continue
+        pending = f"{pending} {sentence}" if pending else sentence
+        if len(pending) < min_chars:
+            continue
+        chunks.extend(_split_long(pending, max_chars) if len(pending) > max_chars else [pending])
+        pending = ''
+    if pending:
+        if chunks and len(chunks[-1]) + 1 + len(pending) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {pending}"
+        else:
+            chunks.append(pending)
+    return chunks
+
+
+def strip_id3(mp3):
+    """Drop a leading ID3v2 tag so concatenated clips form one MP3 frame stream"""
+    if len(mp3) < 10 or mp3[:3] != b'ID3':
+        return mp3
+    size = (mp3[6] << 21) | (mp3[7] << 14) | (mp3[8] << 7) | mp3[9]
+    if mp3[5] & 0x10:
+        size += 10  # footer
+    return mp3[10 + size:]
+
+
+def concat_mp3(clips):
+    """Join MP3 clips into one playable stream"""
+    return clips[0] + b''.join(strip_id3(clip) for clip in clips[1:])
+
+
+def stream_synthesis(chunks, render, executor, lookahead=2):
+    """
+    Yield render(chunk) for each chunk, in order, as soon as each is ready.
+
+    Up to ``lookahead`` chunks after the one being sent are rendered ahead
+    on ``executor``, so the first chunk is yielded as soon as it alone is
+    synthesized and later chunks are usually ready by the time the client
+    has played the previous one. Closing the generator (the client went
+    away) cancels the chunks that have not started.
+    """
+    chunks = iter(chunks)
+    in_flight = deque()
+
+    def submit_next():
+        chunk = next(chunks, None)
+        if chunk is not None:
+            in_flight.append(executor.submit(render, chunk))
+
+    for _ in range(1 + lookahead):
+        submit_next()
+    try:
+        while in_flight:
+            future = in_flight.popleft()
+            submit_next()
+            yield future.result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+class PendingStreams:
+    """
+    Text waiting to be streamed, by id. The client POSTs the text and then
+    opens the stream with a GET by id, so email bodies never end up in a
+    URL (access logs, proxies, browser history). An id stays valid for
+    ``ttl`` seconds, long enough for the audio element to re-request it;
+    at most ``max_pending`` are kept.
+    """
+
+    def __init__(self, ttl=300, max_pending=1000):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._pending = OrderedDict()  # id -> (expires, params)
+        self._lock = threading.Lock()
+
+    def add(self, params):
+        stream_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            while self._pending:
+                oldest_id, (expires, _) = next(iter(self._pending.items()))
+                if expires > now and len(self._pending) < self.max_pending:
+                    break
+                del self._pending[oldest_id]
+            self._pending[stream_id] = (now + self.ttl, params)
+        return stream_id
+
+    def get(self, stream_id):
+        """The params stored under ``stream_id``, or None if unknown or expired"""
+        with self._lock:
+            entry = self._pending.get(stream_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
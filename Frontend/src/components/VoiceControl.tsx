@@ -6,6 +6,10 @@ import { MicrophoneAnimation, MailAnimation, WavesAnimation, TalkingAnimation, C
 // Backend API base URL
 const API_BASE_URL = 'http://localhost:5001';
 
+// How often and for how long to follow a queued email's delivery status
+const EMAIL_STATUS_POLL_MS = 1500;
+const EMAIL_STATUS_POLL_LIMIT_MS = 30000;
+
 interface VoiceControlProps {
   email: string;
   mode: 'send' | 'read';
@@ -59,6 +63,15 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
   const [isCheckingService, setIsCheckingService] = useState<boolean>(false);
   const tempRecognitionRef = useRef<any>(null);
   
+  // Fixed voice prompts the server lets us request with a cacheable GET
+  const speechPromptsRef = useRef<Set<string>>(new Set());
+  
+  useEffect(() => {
+    axios.get(`${API_BASE_URL}/api/text-to-speech/prompts`)
+      .then((response) => { speechPromptsRef.current = new Set(response.data.phrases); })
+      .catch((err) => console.warn("Could not load voice prompts, POSTing all speech requests", err));
+  }, []);
+  
   // Initialize speech recognition
   useEffect(() => {
     const initResult = initializeSpeechRecognition();
@@ -237,6 +250,37 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
     }
   }, [mode, email]);
 
+  // In read mode, let the server push new-mail notifications instead of polling
+  useEffect(() => {
+    if (mode !== 'read' || !email || !username) {
+      return;
+    }
+
+    const params = new URLSearchParams({ username, email });
+    const events = new EventSource(`${API_BASE_URL}/api/mail-events?${params}`);
+
+    events.addEventListener('new-mail', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      console.log('New mail notification:', data);
+      setStatus(`${data.count} new email(s) arrived.`);
+      fetchUnreadEmails();
+    });
+
+    events.addEventListener('login-failed', () => {
+      setError(`The mail server refused the login for ${email}. Please update the account password.`);
+      events.close();
+    });
+
+    events.onerror = () => {
+      // EventSource reconnects by itself
+      console.warn('Mail event stream interrupted, reconnecting...');
+    };
+
+    return () => {
+      events.close();
+    };
+  }, [mode, email, username]);
+
   // Effect to handle audio playback
   useEffect(() => {
     if (audioSrc && audioRef.current) {
@@ -325,6 +369,25 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
     }
   };
   
+  // Follow a queued email until it is sent or has failed, or the poll limit passes
+  const waitForDelivery = async (messageId: string) => {
+    const deadline = Date.now() + EMAIL_STATUS_POLL_LIMIT_MS;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, EMAIL_STATUS_POLL_MS));
+      try {
+        const response = await axios.get(`${API_BASE_URL}/api/email-status/${messageId}`, {
+          params: { username }
+        });
+        if (response.data.status === 'sent' || response.data.status === 'failed') {
+          return response.data;
+        }
+      } catch (error) {
+        console.error('Error checking email status:', error);
+      }
+    }
+    return null;
+  };
+  
   const sendEmail = async () => {
     setLoading(true);
     setStatus('Sending email...');
@@ -339,7 +402,21 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
         username
       });
       
-      setStatus('Email sent successfully!');
+      // The server queues the email and delivers it in the background (202 Accepted)
+      if (response.status === 202) {
+        setStatus('Email queued for sending!');
+        const delivery = await waitForDelivery(response.data.message_id);
+        if (delivery && delivery.status === 'failed') {
+          const failure = `Email could not be delivered: ${delivery.last_error}`;
+          setStatus('');
+          setError(failure);
+          fallbackToBuiltInTTS(failure);
+          return;
+        }
+        setStatus(delivery ? 'Email sent successfully!' : 'Email is queued and will keep retrying in the background.');
+      } else {
+        setStatus('Email sent successfully!');
+      }
       
       // Automatically complete the process after showing success message
       setTimeout(() => {
@@ -377,9 +454,11 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
     console.log('Attempting to fetch unread emails for:', email);
     
     try {
+      // Summary mode: headers and a short preview only; full bodies are fetched on demand
       const response = await axios.post(`${API_BASE_URL}/api/read-unread-emails`, {
         email: email,
-        username: username
+        username: username,
+        mode: 'summary'
       });
       
       console.log('Email fetch response data:', response.data);
@@ -421,6 +500,30 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
     }
   };
   
+  // Request synthesized speech as an audio blob. Fixed voice prompts use GET
+  // so the browser can cache them (the server sends ETag/Cache-Control);
+  // everything else is POSTed, so senders, subjects and bodies never end up
+  // in a URL.
+  const fetchSpeech = (text: string) => {
+    if (speechPromptsRef.current.has(text)) {
+      return axios.get(`${API_BASE_URL}/api/text-to-speech`, {
+        params: { text },
+        responseType: 'blob'
+      });
+    }
+    return axios.post(`${API_BASE_URL}/api/text-to-speech`, {
+      text
+    }, { responseType: 'blob' });
+  };
+  
+  // POST the text for streaming and return the stream URL for the audio
+  // element, which starts playing after the first sentence. The text stays
+  // out of the URL, so email bodies do not end up in server or proxy logs.
+  const createSpeechStream = async (text: string): Promise<string> => {
+    const response = await axios.post(`${API_BASE_URL}/api/text-to-speech/stream`, { text });
+    return `${API_BASE_URL}/api/text-to-speech/stream/${response.data.stream_id}`;
+  };
+  
   // Format email for text-to-speech to avoid spaces in email addresses
   const formatEmailForSpeech = (emailText: string): string => {
     // Replace email pattern with no-space version
@@ -445,9 +548,7 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
     try {
       // Try to use the backend gTTS service if available
       console.log("Trying to use gTTS text-to-speech service...");
-      const response = await axios.post(`${API_BASE_URL}/api/text-to-speech`, {
-        text: message
-      }, { responseType: 'blob' });
+      const response = await fetchSpeech(message);
       
       console.log("Received response from text-to-speech API", response);
       
@@ -543,20 +644,30 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
     // Format the from address to ensure no spaces in email addresses
     const fromAddress = formatEmailForSpeech(emailData.from);
     
+    // The list only holds a preview; fetch the full body if it was cut short
+    let fullBody = emailData.body;
+    if (emailData.truncated && emailData.uid) {
+      try {
+        const bodyResponse = await axios.post(`${API_BASE_URL}/api/read-email`, {
+          email,
+          username,
+          uid: emailData.uid
+        });
+        fullBody = bodyResponse.data.email.body;
+      } catch (error) {
+        console.error("Error fetching full email body, reading the preview instead:", error);
+      }
+    }
+    
     // Message including body
-    const message = `Email ${index + 1} of ${unreadEmails.length}. From: ${fromAddress}. Subject: ${emailData.subject}. Message: ${emailData.body}`;
+    const message = `Email ${index + 1} of ${unreadEmails.length}. From: ${fromAddress}. Subject: ${emailData.subject}. Message: ${fullBody}`;
     
     try {
       // Try to use the backend gTTS service if available
       console.log("Trying to use gTTS text-to-speech service for full email...");
-      const response = await axios.post(`${API_BASE_URL}/api/text-to-speech`, {
-        text: message
-      }, { responseType: 'blob' });
-      
-      console.log("Received response from text-to-speech API for full email");
       
-      // Create URL for the audio blob
-      const audioUrl = URL.createObjectURL(response.data);
+      // Stream the speech so playback starts before the whole email is synthesized
+      const audioUrl = await createSpeechStream(message);
       setAudioSrc(audioUrl);
       
       // Ensure the audio element is ready before playing
@@ -567,7 +678,6 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
         audioRef.current.onplay = () => console.log("Audio playback started");
         audioRef.current.onended = () => {
           console.log("Audio playback ended");
-          URL.revokeObjectURL(audioUrl);
           setIsReading(false);
           setAudioSrc(null);
         };
@@ -626,9 +736,7 @@ const VoiceControl: React.FC<VoiceControlProps> = ({
           setStatus(`Reading header ${index + 1} of ${unreadEmails.length}...`);
           
           // Try to use the backend gTTS service if available
-          const response = await axios.post(`${API_BASE_URL}/api/text-to-speech`, {
-            text: message
-          }, { responseType: 'blob' });
+          const response = await fetchSpeech(message);
           
           // Create URL for the audio blob
           const audioUrl = URL.createObjectURL(response.data);